@@ -21,6 +21,34 @@ def create_app(config_class=None):
     # Инициализация БД
     db.init_app(app)
 
+    # JSON через orjson (или стандартный json), сжатие ответов
+    from modules import json_provider
+    from modules.compression import response_compressor
+    json_provider.init_app(app)
+    response_compressor.init_app(app)
+
+    # Метрики запросов, поиск медленных SQL и N+1, хранилище экспорта, пул
+    # генерации PDF, объединение одинаковых запросов, лимит запросов,
+    # входящие события и кэш сделок Битрикс24
+    from modules.metrics import request_metrics
+    from modules.query_audit import query_audit
+    from modules.export_store import export_store
+    from modules.pdf.service import pdf_renderer
+    from modules.singleflight import coalescer
+    from modules.bitrix.limiter import rate_limiter
+    from modules.bitrix.events import deal_events
+    from modules.bitrix.cache import deal_cache
+    from modules.bitrix.sync import bitrix_cli
+    request_metrics.init_app(app)
+    query_audit.init_app(app)
+    export_store.init_app(app)
+    pdf_renderer.init_app(app)
+    coalescer.init_app(app)
+    rate_limiter.init_app(app)
+    deal_events.init_app(app)
+    deal_cache.init_app(app)
+    app.cli.add_command(bitrix_cli)
+
     # Регистрация blueprints
     from modules.orders.routes import orders_bp
     from modules.pricing.routes import pricing_bp
@@ -35,7 +63,16 @@ def create_app(config_class=None):
     # Создание таблиц БД
     with app.app_context():
         from models import Order, OrderSystem, PriceItem
+        from modules.pricing.search import ensure_search_index
+        from modules.pricing.catalog import backfill_system_type_links, backfill_price_history
+        from modules.orders.etag import ensure_version_column
+        from modules.pdf.service import ensure_job_file_key_column
         db.create_all()
+        ensure_version_column()
+        ensure_job_file_key_column()
+        ensure_search_index()
+        backfill_system_type_links()
+        backfill_price_history()
 
     # ========== HTML СТРАНИЦЫ ==========
 
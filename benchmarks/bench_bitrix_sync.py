@@ -0,0 +1,99 @@
+"""
+Нагрузочный прогон синхронизации с Битрикс24 на локальной заглушке
+
+Поднимает tests/fake_bitrix.py с задержкой ответа, лимитом запросов и
+долей случайных ошибок, заполняет временную SQLite-БД заказами и
+синхронизирует их через sync_orders — настоящий HTTP-клиент, batch,
+загрузку файлов и общий ограничитель частоты.
+
+Два прогона: ограничитель настроен на скорость портала и вдвое выше
+неё (проверка адаптации: сколько QUERY_LIMIT_EXCEEDED получено и
+до какой скорости ограничитель опустился). Выводятся время, заказов/с,
+запросов к порталу, отказов по лимиту и ошибок синхронизации.
+
+Запуск: python benchmarks/bench_bitrix_sync.py [заказов] [запросов/с портала] [задержка, мс]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from config import TestingConfig
+from extensions import db
+from models import Order, OrderSystem, BitrixSyncState
+from modules.bitrix import sync
+from modules.bitrix.limiter import rate_limiter
+from modules.calculator import calculate_system
+from tests.fake_bitrix import FakeBitrix
+
+
+def fill(count):
+    for i in range(count):
+        order = Order(customer_name=f'Бенчмарк {i}', city='Москва')
+        db.session.add(order)
+        db.session.flush()
+        params = {'system_type': 'Slider L', 'width': 2500 + i, 'height': 2400, 'panels': 3}
+        db.session.add(OrderSystem(order_id=order.id, position=1, price=100000.0,
+                                   calculated_data=calculate_system(params), **params))
+        order.total_price = 100000.0
+    db.session.commit()
+
+
+def reset():
+    """Забыть прошлую синхронизацию: следующий прогон создаёт сделки заново"""
+    BitrixSyncState.query.delete()
+    Order.query.update({Order.bitrix_deal_id: None})
+    db.session.commit()
+
+
+def run(title, orders, bitrix, client_rate):
+    rate_limiter.rate = client_rate
+    rate_limiter.min_rate = client_rate / 10
+    rate_limiter._last_rate = client_rate
+    rate_limiter._memory = None
+    requests_before = bitrix.stats['requests']
+    throttled_before = bitrix.stats['throttled']
+
+    started = time.perf_counter()
+    failed = 0
+    for results in sync.sync_orders(orders, deadline=60):
+        failed += sum(not r['success'] for r in results.values())
+    elapsed = time.perf_counter() - started
+
+    print(f'{title}: {elapsed:6.1f} с, {len(orders) / elapsed:5.2f} заказов/с, '
+          f'запросов {bitrix.stats["requests"] - requests_before}, '
+          f'отказов по лимиту {bitrix.stats["throttled"] - throttled_before}, '
+          f'ошибок {failed}, скорость в конце {rate_limiter.current_rate():.2f} запр/с')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    portal_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.05
+    tmp = tempfile.mkdtemp()
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        PDF_EXPORTS_DIR = os.path.join(tmp, 'exports')
+
+    app = create_app(BenchConfig)
+    with FakeBitrix(latency=latency, rate_limit=portal_rate, burst=50, error_rate=0.01, seed=1) as bitrix, \
+            app.app_context():
+        os.environ['BITRIX24_WEBHOOK_URL'] = bitrix.webhook_url
+        os.environ['BITRIX24_FOLDER_ID'] = '10'
+        db.create_all()
+        fill(count)
+        orders = Order.query.order_by(Order.id).all()
+        print(f'Заказов: {count}, портал: {portal_rate} запр/с, запас 50, задержка {latency * 1000:.0f} мс')
+
+        run('ограничитель = портал ', orders, bitrix, portal_rate)
+        reset()
+        run('ограничитель = портал×2', orders, bitrix, portal_rate * 2)
+
+
+if __name__ == '__main__':
+    main()
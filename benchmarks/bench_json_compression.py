@@ -0,0 +1,85 @@
+"""
+Бенчмарк ответа с заказом: JSON-провайдеры и сжатие
+
+Заказ из 50 систем (calculated_data у каждой) создаётся через API на
+базе в памяти. Сначала сравнивается сериализация ответа
+GET /api/orders/<id> стандартным json и orjson (modules/json_provider.py)
+— только провайдер, и весь запрос целиком. Затем для тела JSON и КП
+в PDF выводятся размер и время сжатия gzip и brotli (brotli — если
+установлен пакет).
+
+Запуск: python benchmarks/bench_json_compression.py [повторов]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from config import TestingConfig
+from modules.compression import response_compressor
+from modules.json_provider import OrjsonProvider, StdlibJSONProvider
+
+SYSTEMS = 50
+SYSTEM_TYPES = ['Slider L', 'JV Line']
+
+
+def make_order(client):
+    response = client.post('/api/orders', json={'customer_name': 'Бенчмарк', 'city': 'Москва'})
+    order_id = response.get_json()['data']['id']
+    for i in range(SYSTEMS):
+        client.post(f'/api/orders/{order_id}/systems', json={
+            'system_type': SYSTEM_TYPES[i % 2], 'width': 2500 + i * 10, 'height': 2400, 'panels': 3 + i % 2
+        })
+    return order_id
+
+
+def best_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    app = create_app(TestingConfig)
+    client = app.test_client()
+
+    with app.app_context():
+        order_id = make_order(client)
+        payload = client.get(f'/api/orders/{order_id}').get_json()
+
+        print(f'Заказ: {SYSTEMS} систем')
+        results = {}
+        for name, provider in (('stdlib', StdlibJSONProvider(app)), ('orjson', OrjsonProvider(app))):
+            app.json = provider
+            serialize = best_ms(lambda: provider.response(payload).get_data(), repeat)
+            request_ms = best_ms(lambda: client.get(f'/api/orders/{order_id}'), repeat)
+            body = client.get(f'/api/orders/{order_id}').data
+            results[name] = serialize
+            print(f'  {name:6}  сериализация {serialize:6.2f} мс   запрос {request_ms:6.2f} мс   '
+                  f'{len(body) / 1024:7.1f} KiB')
+        print(f'  orjson быстрее в {results["stdlib"] / results["orjson"]:.1f} раза')
+
+        bodies = {
+            'json': client.get(f'/api/orders/{order_id}').data,
+            'pdf': client.get(f'/api/orders/{order_id}/pdf/kp').data,
+        }
+    for label, body in bodies.items():
+        line = f'{label:4} {len(body) / 1024:7.1f} KiB'
+        for encoding in response_compressor.encodings:
+            compressed = response_compressor.compress(body, encoding)
+            ms = best_ms(lambda: response_compressor.compress(body, encoding), repeat)
+            line += (f'   {encoding} {len(compressed) / 1024:6.1f} KiB '
+                     f'({len(compressed) / len(body) * 100:4.1f}%) {ms:5.2f} мс')
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Бенчмарк генерации PDF: готовые стили против сборки на каждый документ
+
+Рендерит КП и разблюдовку для маленького (1 система) и большого
+(40 систем) заказа. Режим «cold» сбрасывает стили перед каждым
+рендерингом — так работали генераторы до modules/pdf/theme.py,
+режим «warm» переиспользует стили процесса. Для каждого режима
+выводится среднее время и пик выделенной памяти (tracemalloc).
+
+Запуск: python benchmarks/bench_pdf_render.py [повторов]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.calculator import calculate_system
+from modules.pdf.service import RENDERERS, get_generator
+from modules.pdf.theme import get_theme, reset_theme
+
+SYSTEM_TYPES = ['Slider L', 'JV Line']
+
+
+def make_order(systems_count):
+    systems = []
+    for i in range(systems_count):
+        params = {'system_type': SYSTEM_TYPES[i % 2], 'width': 2500 + i * 10,
+                  'height': 2400, 'panels': 3 + i % 2}
+        systems.append(SimpleNamespace(position=i + 1, price=100000.0, opening='влево',
+                                       calculated_data=calculate_system(params), **params))
+    return SimpleNamespace(
+        id=1, customer_name='Бенчмарк', city='Москва', ral_color='RAL 9016', notes='',
+        discount_percent=10, total_price=90000.0 * systems_count,
+        with_glass=True, with_assembly=True, with_install=True, systems=systems
+    )
+
+
+def measure(kind, order, repeat, cold):
+    generator = get_generator(kind)
+    get_theme()
+    generator(order)  # Прогрев шрифтов и импортов
+
+    elapsed = 0.0
+    for _ in range(repeat):
+        if cold:
+            reset_theme()
+        started = time.perf_counter()
+        generator(order)
+        elapsed += time.perf_counter() - started
+
+    # Память меряем отдельно: tracemalloc заметно замедляет рендеринг
+    if cold:
+        reset_theme()
+    tracemalloc.start()
+    generator(order)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed / repeat * 1000, peak / 1024
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for label, count in (('small', 1), ('large', 40)):
+        order = make_order(count)
+        for kind in RENDERERS:
+            cold_ms, cold_kb = measure(kind, order, repeat, cold=True)
+            warm_ms, warm_kb = measure(kind, order, repeat, cold=False)
+            print(f'{label:5} {kind:4}  cold {cold_ms:7.1f} ms {cold_kb:8.0f} KiB   '
+                  f'warm {warm_ms:7.1f} ms {warm_kb:8.0f} KiB   '
+                  f'{(1 - warm_ms / cold_ms) * 100:5.1f}% faster')
+
+
+if __name__ == '__main__':
+    main()
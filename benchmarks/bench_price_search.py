@@ -0,0 +1,65 @@
+"""
+Бенчмарк поиска по прайс-листу
+
+Заполняет временную SQLite-БД каталогом из 100 000 позиций и замеряет
+время GET /api/prices?search=... (цель — < 10 мс на запрос поиска).
+
+Запуск: python benchmarks/bench_price_search.py [кол-во позиций]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from config import TestingConfig
+from extensions import db
+from models.price import PriceItem
+from modules.pricing.search import apply_search
+
+WORDS = ['Профиль', 'верхний', 'нижний', 'Уплотнитель', 'щеточный', 'Ручка',
+         'Заглушка', 'Ролик', 'Саморез', 'Демпфер', 'Клей', 'Активатор']
+QUERIES = ['S-01', 'профиль', 'профиль верх', 'ролик', 'X-9999']
+
+
+def fill(count):
+    rows = []
+    for i in range(count):
+        rows.append({
+            'article': f'{"SXHA"[i % 4]}-{i:05d}',
+            'name': f'{WORDS[i % len(WORDS)]} {WORDS[(i * 7) % len(WORDS)]} {i}',
+            'price': float(i % 5000),
+            'category': f'Категория {i % 20}',
+            'unit': 'шт',
+            'is_active': True,
+        })
+    db.session.execute(PriceItem.__table__.insert(), rows)
+    db.session.commit()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        fill(count)
+        print(f'Каталог: {count} позиций')
+        for search in QUERIES:
+            runs = 20
+            start = time.perf_counter()
+            for _ in range(runs):
+                query, _ = apply_search(PriceItem.query, search)
+                found = query.limit(100).all()
+            elapsed = (time.perf_counter() - start) / runs * 1000
+            print(f'  {search!r:22} {len(found):4} шт  {elapsed:7.2f} мс')
+
+
+if __name__ == '__main__':
+    main()
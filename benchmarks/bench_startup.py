@@ -0,0 +1,67 @@
+"""
+Бенчмарк старта воркера: create_app и прогрев
+
+Каждый замер — в свежем процессе Python (как новый воркер gunicorn).
+Сравниваются create_app с ленивыми импортами и с заранее
+импортированными pandas, openpyxl и ReportLab (так было, пока модули
+импортировали их при загрузке), затем время этапов прогрева
+(modules/warmup.py). Выводятся медианы времени и прирост RSS.
+
+Запуск: python benchmarks/bench_startup.py [повторов]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = r'''
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+result = {{'rss_before': rss_mb()}}
+started = time.perf_counter()
+if {eager}:
+    import pandas, openpyxl, reportlab.platypus
+from app import create_app
+from config import TestingConfig
+app = create_app(TestingConfig)
+result['create_app'] = time.perf_counter() - started
+result['rss_app'] = rss_mb()
+result['heavy'] = [m for m in ('pandas', 'openpyxl', 'reportlab') if m in sys.modules]
+
+from modules.warmup import warm_up_worker
+result['warmup'] = warm_up_worker(app)
+result['rss_warm'] = rss_mb()
+print(json.dumps(result))
+'''
+
+
+def run(eager):
+    output = subprocess.run([sys.executable, '-c', SCRIPT.format(root=ROOT, eager=eager)],
+                            capture_output=True, text=True, check=True, cwd=ROOT).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for label, eager in (('ленивые импорты', False), ('pandas/openpyxl/ReportLab сразу', True)):
+        runs = [run(eager) for _ in range(repeat)]
+        create_ms = statistics.median(r['create_app'] for r in runs) * 1000
+        app_mb = statistics.median(r['rss_app'] - r['rss_before'] for r in runs)
+        warm_mb = statistics.median(r['rss_warm'] - r['rss_before'] for r in runs)
+        stages = {stage: statistics.median(r['warmup'][stage] for r in runs) * 1000 for stage in runs[0]['warmup']}
+        print(f'{label}:')
+        print(f'  create_app {create_ms:6.0f} мс, +{app_mb:5.1f} МБ RSS, загружены: {", ".join(runs[0]["heavy"]) or "-"}')
+        print(f'  прогрев    {sum(stages.values()):6.0f} мс ({", ".join(f"{s} {ms:.0f}" for s, ms in stages.items())}), '
+              f'после прогрева +{warm_mb:5.1f} МБ RSS')
+
+
+if __name__ == '__main__':
+    main()
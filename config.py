@@ -17,6 +17,14 @@ DATA_DIR.mkdir(exist_ok=True)
 EXPORTS_DIR = DATA_DIR / 'exports'
 EXPORTS_DIR.mkdir(exist_ok=True)
 
+# Блокировки и общие результаты single-flight между воркерами
+LOCKS_DIR = DATA_DIR / 'locks'
+LOCKS_DIR.mkdir(exist_ok=True)
+
+# Директория для загруженных файлов импорта цен
+IMPORTS_DIR = DATA_DIR / 'imports'
+IMPORTS_DIR.mkdir(exist_ok=True)
+
 
 class Config:
     """Базовая конфигурация"""
@@ -37,14 +45,80 @@ class Config:
         'https://joyvision.bitrix24.ru/rest/1/op5tzx11ardvgibz/'
     )
     BITRIX_FOLDER_ID = int(os.environ.get('BITRIX_FOLDER_ID', '3313'))
+    BITRIX_SYNC_TIMEOUT = 120  # Сколько ждать синхронизацию того же заказа в другом воркере, сек
+    BITRIX_RATE_LIMIT = float(os.environ.get('BITRIX_RATE_LIMIT', '2'))  # Запросов в секунду на портал
+    BITRIX_RATE_BURST = int(os.environ.get('BITRIX_RATE_BURST', '50'))  # Запас запросов сверх скорости
+    BITRIX_RATE_LIMIT_PATH = str(LOCKS_DIR / 'bitrix_rate.sqlite')  # Общая корзина воркеров
+    BITRIX_RATE_MAX_WAIT = 60  # Сколько ждать очереди запроса, сек
+    BITRIX_DEAL_CACHE_TTL = float(os.environ.get('BITRIX_DEAL_CACHE_TTL', '60'))  # Сколько хранить сделку, сек
+    BITRIX_DEAL_CACHE_SIZE = int(os.environ.get('BITRIX_DEAL_CACHE_SIZE', '1000'))  # Сделок в кэше воркера
+    BITRIX_APP_TOKEN = os.environ.get('BITRIX_APP_TOKEN', '')  # Токен исходящего вебхука портала
+    BITRIX_EVENT_DEBOUNCE = float(os.environ.get('BITRIX_EVENT_DEBOUNCE', '2'))  # Окно схлопывания событий, сек
+    BITRIX_EVENTS_ASYNC = True  # False — события обрабатываются прямо в запросе
+    BITRIX_EVENT_RETRY_MAX = float(os.environ.get('BITRIX_EVENT_RETRY_MAX', '60'))  # Предел паузы перед повтором, сек
+    # Стадия сделки (без префикса воронки) -> статус заказа
+    BITRIX_STAGE_STATUSES = {
+        'NEW': 'draft',
+        'PREPARATION': 'confirmed',
+        'PREPAYMENT_INVOICE': 'confirmed',
+        'EXECUTING': 'in_production',
+        'FINAL_INVOICE': 'in_production',
+        'WON': 'completed',
+        'LOSE': 'cancelled',
+    }
 
     # PDF
     PDF_EXPORTS_DIR = str(EXPORTS_DIR)
     PDF_FONT_PATH = str(BASE_DIR / 'static' / 'fonts' / 'DejaVuSans.ttf')
-
-    # JSON
+    PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', '1'))  # Процессов на воркер; 0 — в запросе
+    PDF_RENDER_QUEUE_LIMIT = int(os.environ.get('PDF_RENDER_QUEUE_LIMIT', '8'))
+    PDF_RENDER_DEADLINE = float(os.environ.get('PDF_RENDER_DEADLINE', '30'))  # Сколько ждать в запросе, сек
+    EXPORT_STORE_MAX_MB = float(os.environ.get('EXPORT_STORE_MAX_MB', '1024'))  # Квота каталога экспорта
+    EXPORT_STORE_MAX_AGE_DAYS = float(os.environ.get('EXPORT_STORE_MAX_AGE_DAYS', '30'))  # 0 — без ограничения
+    PDF_EXPORT_WINDOW = int(os.environ.get('PDF_EXPORT_WINDOW', '4'))  # PDF в работе одновременно при массовой выгрузке
+
+    # Импорт цен
+    PRICE_IMPORTS_DIR = str(IMPORTS_DIR)
+    PRICE_IMPORT_CHUNK_SIZE = int(os.environ.get('PRICE_IMPORT_CHUNK_SIZE', '500'))
+    PRICE_IMPORT_ASYNC = True  # False — импорт выполняется прямо в запросе
+    # Импорт в работе без нового чекпоинта дольше этого считается брошенным (воркер перезапущен)
+    PRICE_IMPORT_STALE_SECONDS = int(os.environ.get('PRICE_IMPORT_STALE_SECONDS', '600'))
+
+    # Прогрев воркера gunicorn до первого запроса (modules/warmup.py)
+    WORKER_WARMUP = ('db', 'prices', 'pdf')
+
+    # Метрики запросов (GET /metrics), общие для воркеров
+    METRICS_PATH = str(LOCKS_DIR / 'metrics.sqlite')
+    METRICS_FLUSH_INTERVAL = 5  # Как часто воркер сбрасывает метрики в общий файл, сек
+
+    # Поиск медленных SQL и N+1 (modules/query_audit.py)
+    QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', '200'))  # Медленный SQL, мс
+    QUERY_REPEAT_THRESHOLD = 5  # Одинаковых SQL за запрос — признак N+1
+    QUERY_AUDIT_SAMPLE = float(os.environ.get('QUERY_AUDIT_SAMPLE', '1'))  # Доля проверяемых запросов
+    QUERY_AUDIT_EXPLAIN = True  # План медленных SQL в лог
+
+    # Профилирование этапов калькулятора (modules/calculator/profiling.py)
+    CALC_PROFILE_HEADER = True  # Заголовок X-Calc-Profile включает профиль с памятью
+    # Если задан — X-Calc-Profile должен содержать этот токен (иначе подходит любое значение)
+    CALC_PROFILE_TOKEN = os.environ.get('CALC_PROFILE_TOKEN')
+    CALC_PROFILE_SAMPLE = float(os.environ.get('CALC_PROFILE_SAMPLE', '0'))  # Доля профилируемых расчётов
+    CALC_PROFILE_SAMPLE_MEMORY = False  # Память в выборке (tracemalloc замедляет процесс)
+
+    # Объединение одинаковых одновременных запросов
+    SINGLEFLIGHT_DIR = str(LOCKS_DIR)
+    SINGLEFLIGHT_RESULT_TTL = 10  # Сколько другой воркер может взять готовый результат, сек
+    SINGLEFLIGHT_REAP_INTERVAL = 60  # Как часто удалять устаревшие результаты и блокировки, сек
+
+    # JSON: 'orjson' (без установленного orjson — стандартный json) или 'stdlib'
+    JSON_PROVIDER = 'orjson'
     JSON_AS_ASCII = False
 
+    # Сжатие ответов (gzip, brotli при установленном пакете brotli)
+    COMPRESS_MIMETYPES = ('application/json', 'application/pdf')
+    COMPRESS_MIN_SIZE = 1024  # Меньшие ответы не сжимаются, байт
+    COMPRESS_LEVEL = 6  # gzip, 1-9
+    COMPRESS_BR_QUALITY = 4  # brotli, 0-11: выше 5 заметно медленнее
+
 
 class DevelopmentConfig(Config):
     """Конфигурация для разработки"""
@@ -54,6 +128,10 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     """Конфигурация для продакшена"""
     DEBUG = False
+    QUERY_AUDIT_SAMPLE = float(os.environ.get('QUERY_AUDIT_SAMPLE', '0.05'))
+    CALC_PROFILE_SAMPLE = float(os.environ.get('CALC_PROFILE_SAMPLE', '0.01'))
+    # tracemalloc замедляет весь воркер: заголовок — только с токеном
+    CALC_PROFILE_HEADER = bool(os.environ.get('CALC_PROFILE_TOKEN'))
 
     # В продакшене использовать PostgreSQL
     # SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
@@ -63,6 +141,12 @@ class TestingConfig(Config):
     """Конфигурация для тестов"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    PRICE_IMPORT_ASYNC = False
+    PDF_RENDER_WORKERS = 0
+    SINGLEFLIGHT_DIR = None
+    BITRIX_RATE_LIMIT_PATH = None
+    BITRIX_EVENTS_ASYNC = False
+    METRICS_PATH = None
 
 
 # Выбор конфигурации по окружению
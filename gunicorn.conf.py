@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+"""
+Хуки gunicorn: прогрев каждого воркера до первого запроса
+
+    gunicorn --config gunicorn.conf.py 'app:create_app()'
+
+post_fork вызывается сразу после fork, когда приложение воркера ещё не
+загружено (без preload_app): здесь только отмечается время. Прогрев —
+в post_worker_init, после fork и create_app, до приёма запросов.
+"""
+
+import time
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    from modules.warmup import warm_up_worker
+
+    timings = warm_up_worker(worker.wsgi)
+    startup = time.perf_counter() - getattr(worker, 'forked_at', time.perf_counter())
+    worker.log.info('Воркер %s готов за %.0f мс (прогрев: %s)', worker.pid, startup * 1000,
+                    ', '.join(f'{stage} {seconds * 1000:.0f} мс' for stage, seconds in timings.items()))
@@ -5,6 +5,9 @@ SQLAlchemy модели для Joy Vision Calculator
 
 from extensions import db
 from .order import Order, OrderSystem
-from .price import PriceItem
+from .price import PriceItem, PriceItemSystemType, PriceImportJob, PriceHistory
+from .export import PdfRenderJob
+from .bitrix import BitrixSyncState
 
-__all__ = ['db', 'Order', 'OrderSystem', 'PriceItem']
+__all__ = ['db', 'Order', 'OrderSystem', 'PriceItem', 'PriceItemSystemType', 'PriceImportJob',
+           'PriceHistory', 'PdfRenderJob', 'BitrixSyncState']
@@ -0,0 +1,41 @@
+"""
+Модели интеграции с Битрикс24
+"""
+
+from datetime import datetime
+from extensions import db
+
+
+class BitrixSyncState(db.Model):
+    """
+    Что уже отправлено в Битрикс24 по заказу
+
+    deal_hash — хэш полей сделки на момент последнего обновления,
+    files — {kind: {'id': ID файла на диске, 'hash': состояние заказа}}.
+    По ним синхронизация отправляет только изменившиеся части.
+    """
+    __tablename__ = 'bitrix_sync_state'
+
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), primary_key=True)
+    deal_id = db.Column(db.Integer, nullable=True)
+    deal_hash = db.Column(db.String(40), nullable=True)
+    files = db.Column(db.JSON, default=dict)
+    synced_at = db.Column(db.DateTime, nullable=True)
+
+    # Удаляется вместе с заказом средствами ORM: SQLite без PRAGMA foreign_keys
+    # не выполняет ON DELETE CASCADE, и новый заказ с тем же id унаследовал бы
+    # чужую сделку и файлы
+    order = db.relationship('Order', backref=db.backref('bitrix_sync_state', uselist=False,
+                                                        cascade='all, delete-orphan'))
+
+    def to_dict(self):
+        """Сериализация в словарь"""
+        return {
+            'order_id': self.order_id,
+            'deal_id': self.deal_id,
+            'files': self.files or {},
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None
+        }
+
+    def __repr__(self):
+        return f'<BitrixSyncState #{self.order_id} deal={self.deal_id}>'
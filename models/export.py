@@ -0,0 +1,38 @@
+"""
+Модели экспорта документов
+"""
+
+from datetime import datetime
+from extensions import db
+
+
+class PdfRenderJob(db.Model):
+    """Задача фоновой генерации PDF"""
+    __tablename__ = 'pdf_render_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # kp / spec
+    status = db.Column(db.String(20), default='queued', index=True)  # queued/done/failed
+    file_path = db.Column(db.String(500), nullable=True)
+    file_key = db.Column(db.String(200), nullable=True)  # ключ результата в каталоге экспорта
+    error = db.Column(db.Text, nullable=True)
+    render_ms = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        """Сериализация в словарь"""
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'kind': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'render_ms': self.render_ms,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<PdfRenderJob {self.id} {self.kind} #{self.order_id} {self.status}>'
@@ -3,9 +3,17 @@
 Модели заказа и систем в заказе
 """
 
+import hashlib
+import json
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from extensions import db
 
+# Служебные поля, не влияющие на содержимое документов (status меняется
+# и из Битрикс24 — смена стадии сделки не должна перезагружать документы)
+_STATE_EXCLUDED = {'created_at', 'updated_at', 'bitrix_deal_id', 'status', 'version'}
+
 
 class Order(db.Model):
     """Заказ"""
@@ -25,13 +33,20 @@ class Order(db.Model):
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Версия: растёт при каждом изменении систем заказа (для ETag)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Связь с системами
     systems = db.relationship('OrderSystem', backref='order', lazy='dynamic',
                               cascade='all, delete-orphan', order_by='OrderSystem.position')
 
-    def to_dict(self, include_systems=False):
-        """Сериализация в словарь"""
+    def to_dict(self, include_systems=False, systems_count=None):
+        """
+        Сериализация в словарь
+
+        systems_count — заранее посчитанное число систем (список заказов
+        считает их одним запросом вместо запроса на каждый заказ)
+        """
         data = {
             'id': self.id,
             'bitrix_deal_id': self.bitrix_deal_id,
@@ -45,7 +60,7 @@ class Order(db.Model):
             'status': self.status,
             'total_price': self.total_price,
             'notes': self.notes,
-            'systems_count': self.systems.count(),
+            'systems_count': self.systems.count() if systems_count is None else systems_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -53,6 +68,13 @@ class Order(db.Model):
             data['systems'] = [s.to_dict() for s in self.systems]
         return data
 
+    def state_hash(self):
+        """
+        Хэш содержимого заказа вместе с системами.
+        Одинаковый хэш — одинаковые КП, разблюдовка и данные сделки.
+        """
+        return order_state_hash(self, self.systems)
+
     def recalculate_total(self):
         """Пересчитать итоговую сумму заказа"""
         subtotal = sum(s.price or 0 for s in self.systems)
@@ -62,6 +84,25 @@ class Order(db.Model):
         return f'<Order #{self.id} "{self.customer_name}">'
 
 
+def order_state_hash(order, systems):
+    """
+    Хэш состояния заказа по значениям колонок (без служебных дат)
+
+    Работает и с моделями, и со снимками (любые объекты с теми же атрибутами).
+    """
+    state = {
+        'order': {c.key: getattr(order, c.key) for c in Order.__table__.columns
+                  if c.key not in _STATE_EXCLUDED},
+        'systems': [
+            {c.key: getattr(s, c.key) for c in OrderSystem.__table__.columns
+             if c.key not in _STATE_EXCLUDED}
+            for s in systems
+        ]
+    }
+    payload = json.dumps(state, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
 class OrderSystem(db.Model):
     """Система в заказе"""
     __tablename__ = 'order_systems'
@@ -130,3 +171,24 @@ class OrderSystem(db.Model):
 
     def __repr__(self):
         return f'<OrderSystem #{self.position} {self.system_type}>'
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_order_versions(session, flush_context, instances):
+    """
+    Изменение систем — изменение заказа: version заказа растёт, а с ним
+    (onupdate) и updated_at, даже если сумма заказа осталась прежней
+    """
+    order_ids = {
+        system.order_id
+        for system in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(system, OrderSystem) and system.order_id is not None
+        and (system not in session.dirty or session.is_modified(system))
+    }
+    if not order_ids:
+        return
+    with session.no_autoflush:
+        for order_id in order_ids:
+            order = session.get(Order, order_id)
+            if order is not None and order not in session.deleted:
+                order.version = (order.version or 0) + 1
@@ -3,9 +3,15 @@
 Модель прайс-листа
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session, validates
+from sqlalchemy.orm.attributes import get_history
 from extensions import db
 
+# Метка «применимо ко всем системам» (system_types пуст)
+ANY_SYSTEM = '*'
+
 
 class PriceItem(db.Model):
     """Позиция прайс-листа"""
@@ -21,6 +27,27 @@ class PriceItem(db.Model):
     is_active = db.Column(db.Boolean, default=True, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Нормализованная применимость к системам (индекс по system_type)
+    system_type_links = db.relationship('PriceItemSystemType', backref='price_item',
+                                        cascade='all, delete-orphan')
+
+    def __init__(self, **kwargs):
+        # Без явного system_types позиция применима ко всем системам
+        kwargs.setdefault('system_types', None)
+        super().__init__(**kwargs)
+
+    @validates('system_types')
+    def _sync_system_type_links(self, key, value):
+        """Синхронизировать таблицу применимости при любой записи system_types"""
+        wanted = set(value or []) or {ANY_SYSTEM}
+        current = {link.system_type: link for link in self.system_type_links}
+        for system_type, link in current.items():
+            if system_type not in wanted:
+                self.system_type_links.remove(link)
+        for system_type in wanted - current.keys():
+            self.system_type_links.append(PriceItemSystemType(system_type=system_type))
+        return value
+
     def to_dict(self):
         """Сериализация в словарь"""
         return {
@@ -37,3 +64,105 @@ class PriceItem(db.Model):
 
     def __repr__(self):
         return f'<PriceItem {self.article} "{self.name}">'
+
+
+class PriceItemSystemType(db.Model):
+    """Применимость позиции прайса к типу системы"""
+    __tablename__ = 'price_item_system_types'
+
+    # system_type первым в ключе — выборка каталога системы идёт по индексу
+    system_type = db.Column(db.String(50), primary_key=True)
+    price_item_id = db.Column(db.Integer, db.ForeignKey('price_items.id', ondelete='CASCADE'),
+                              primary_key=True, index=True)
+
+    def __repr__(self):
+        return f'<PriceItemSystemType {self.system_type} #{self.price_item_id}>'
+
+
+class PriceImportJob(db.Model):
+    """Фоновый импорт прайса из Excel"""
+    __tablename__ = 'price_import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending/running/done/failed
+    total_rows = db.Column(db.Integer, nullable=True)
+    processed_rows = db.Column(db.Integer, default=0)  # Чекпоинт: строк данных закоммичено
+    created = db.Column(db.Integer, default=0)
+    updated = db.Column(db.Integer, default=0)
+    errors = db.Column(db.JSON, default=list)  # [{"row": 5, "error": "..."}]
+    message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def is_resumable(self, stale_seconds):
+        """
+        Можно ли продолжить импорт: упал или брошен
+
+        Задача pending/running брошена, если её чекпоинт (updated_at) не
+        обновлялся дольше stale_seconds (воркер перезапущен посреди импорта).
+        """
+        if self.status == 'failed':
+            return True
+        if self.status not in ('pending', 'running'):
+            return False
+        last_seen = self.updated_at or self.created_at
+        return last_seen is None or datetime.utcnow() - last_seen > timedelta(seconds=stale_seconds)
+
+    def to_dict(self, stale_seconds=600):
+        """Сериализация в словарь (stale_seconds — см. is_resumable)"""
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'resumable': self.is_resumable(stale_seconds),
+            'total_rows': self.total_rows,
+            'processed_rows': self.processed_rows,
+            'created': self.created,
+            'updated': self.updated,
+            'errors': self.errors or [],
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<PriceImportJob #{self.id} {self.status}>'
+
+
+class PriceHistory(db.Model):
+    """История цен (только добавление): цена действует с valid_from до следующей записи"""
+    __tablename__ = 'price_history'
+
+    id = db.Column(db.Integer, primary_key=True)
+    article = db.Column(db.String(30), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    valid_from = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_price_history_article_valid_from', 'article', 'valid_from'),
+    )
+
+    def to_dict(self):
+        """Сериализация в словарь"""
+        return {
+            'article': self.article,
+            'price': self.price,
+            'valid_from': self.valid_from.isoformat() if self.valid_from else None
+        }
+
+    def __repr__(self):
+        return f'<PriceHistory {self.article} {self.price} c {self.valid_from}>'
+
+
+@event.listens_for(Session, 'before_flush')
+def _record_price_history(session, flush_context, instances):
+    """Дописать историю при создании позиции и при каждой смене цены"""
+    now = datetime.utcnow()
+    for obj in session.new:
+        if isinstance(obj, PriceItem):
+            session.add(PriceHistory(article=obj.article, price=obj.price or 0, valid_from=now))
+    for obj in session.dirty:
+        if isinstance(obj, PriceItem) and get_history(obj, 'price').has_changes():
+            session.add(PriceHistory(article=obj.article, price=obj.price or 0, valid_from=now))
@@ -6,9 +6,27 @@ API для работы с Битрикс24
 
 import requests
 import json
-import base64
 import os
 import datetime
+from urllib.parse import quote
+from .limiter import rate_limiter
+from .cache import deal_cache
+from modules.metrics import timed
+
+# Максимум команд в одном вызове batch (ограничение Битрикс24)
+BATCH_LIMIT = 50
+
+# Сколько раз повторять запрос после QUERY_LIMIT_EXCEEDED
+MAX_LIMIT_RETRIES = 5
+
+
+class BitrixError(Exception):
+    """Ошибка, которую вернул REST API Битрикс24"""
+
+    def __init__(self, code, description):
+        super().__init__(f"{code}: {description}" if code else description)
+        self.code = code
+        self.description = description
 
 
 def get_webhook_url():
@@ -19,6 +37,160 @@ def get_webhook_url():
     return url
 
 
+def get_folder_id():
+    """ID папки диска для документов заказов"""
+    folder_id = int(os.getenv('BITRIX24_FOLDER_ID', '0'))
+    if folder_id == 0:
+        raise Exception("BITRIX24_FOLDER_ID не установлен в .env")
+    return folder_id
+
+
+def deal_fields(company_name, total_price, address=""):
+    """Поля новой сделки по заказу"""
+    return {
+        "TITLE": f"Заказ - {company_name}",
+        "ADDRESS": address,
+        "CATEGORY_ID": 0,
+        "STAGE_ID": "C0:NEW",
+        "OPPORTUNITY": total_price,
+        "CURRENCY_ID": "RUB"
+    }
+
+
+def unique_filename(filename):
+    """Имя файла с меткой времени (Битрикс не перезаписывает файлы с тем же именем)"""
+    base_name, ext = os.path.splitext(filename)
+    return f"{base_name}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{ext}"
+
+
+def _is_limit_error(response):
+    """Ответ «слишком много запросов» (Битрикс отдаёт 503 с QUERY_LIMIT_EXCEEDED)"""
+    if response.status_code not in (429, 503):
+        return False
+    try:
+        return response.json().get('error') == 'QUERY_LIMIT_EXCEEDED'
+    except ValueError:
+        return response.status_code == 429
+
+
+def post(url, **kwargs):
+    """
+    POST к Битрикс24 через общий ограничитель частоты
+
+    На QUERY_LIMIT_EXCEEDED снижает общую скорость и повторяет запрос
+    (до MAX_LIMIT_RETRIES раз).
+
+    Raises:
+        BitrixError: QUERY_LIMIT_EXCEEDED и после всех повторов
+    """
+    for _ in range(MAX_LIMIT_RETRIES + 1):
+        rate_limiter.acquire()
+        with timed('bitrix'):
+            response = requests.post(url, **kwargs)
+        if not _is_limit_error(response):
+            rate_limiter.reward()
+            return response
+        rate_limiter.penalize()
+    raise BitrixError('QUERY_LIMIT_EXCEEDED',
+                      f'Превышен лимит запросов Битрикс24 (повторов: {MAX_LIMIT_RETRIES})')
+
+
+def build_query(params, prefix=None):
+    """
+    Параметры метода в строку запроса в формате PHP http_build_query
+    (так batch принимает команды): {'fields': {'A': 1}} -> 'fields[A]=1'
+    """
+    parts = []
+    items = params.items() if isinstance(params, dict) else enumerate(params)
+    for key, value in items:
+        name = f"{prefix}[{key}]" if prefix else str(key)
+        if isinstance(value, (dict, list, tuple)):
+            parts.append(build_query(value, name))
+        else:
+            if value is None:
+                value = ''
+            elif isinstance(value, bool):
+                value = 'Y' if value else 'N'
+            # $result[...] — ссылка на результат предыдущей команды batch
+            parts.append(f"{quote(name, safe='[]')}={quote(str(value), safe='$[]')}")
+    return '&'.join(p for p in parts if p)
+
+
+def call_method(method, params=None):
+    """
+    Вызвать метод REST API
+
+    Returns:
+        поле result ответа
+
+    Raises:
+        BitrixError: ответ с ошибкой
+    """
+    response = post(f"{get_webhook_url()}{method}.json", json=params or {})
+    result = response.json()
+    if 'error' in result:
+        raise BitrixError(result['error'], result.get('error_description', 'Неизвестная ошибка'))
+    return result.get('result')
+
+
+def call_batch(commands, halt=False):
+    """
+    Выполнить до BATCH_LIMIT команд одним запросом batch
+
+    Команда может ссылаться на результат предыдущей команды того же
+    вызова: {'ENTITY_ID': '$result[deal]'}.
+
+    Args:
+        commands: dict имя -> (метод, параметры), порядок сохраняется
+        halt: прервать выполнение на первой ошибке
+
+    Returns:
+        (results, errors): dict имя -> результат и dict имя -> BitrixError
+
+    Raises:
+        BitrixError: ошибка самого вызова batch (лимит запросов, авторизация)
+    """
+    if len(commands) > BATCH_LIMIT:
+        raise ValueError(f"В batch не больше {BATCH_LIMIT} команд, передано {len(commands)}")
+    if not commands:
+        return {}, {}
+
+    cmd = {name: f"{method}?{build_query(params)}" for name, (method, params) in commands.items()}
+    result = call_method('batch', {'halt': 1 if halt else 0, 'cmd': cmd})
+
+    results = result.get('result') or {}
+    errors = {
+        name: BitrixError(error.get('error', ''), error.get('error_description', 'Неизвестная ошибка'))
+        for name, error in (result.get('result_error') or {}).items()
+    }
+    # Ответ без ошибок PHP отдаёт пустым списком вместо словаря
+    if isinstance(results, list):
+        results = {}
+    return results, errors
+
+
+def pack_batches(groups):
+    """
+    Разложить группы команд по вызовам batch, не разрывая группу
+    (ссылки $result работают только внутри одного вызова)
+
+    Args:
+        groups: итератор (метка, dict команд), например (заказ, его команды)
+
+    Yields:
+        список (метка, dict команд), суммарно не больше BATCH_LIMIT команд
+    """
+    pack, size = [], 0
+    for tag, commands in groups:
+        if pack and size + len(commands) > BATCH_LIMIT:
+            yield pack
+            pack, size = [], 0
+        pack.append((tag, commands))
+        size += len(commands)
+    if pack:
+        yield pack
+
+
 def create_deal(company_name, total_price, address=""):
     """
     Создаёт новую сделку в Битрикс24
@@ -33,21 +205,15 @@ def create_deal(company_name, total_price, address=""):
     """
     url = f"{get_webhook_url()}crm.deal.add.json"
     data = {
-        "fields": {
-            "TITLE": f"Заказ - {company_name}",
-            "ADDRESS": address,
-            "CATEGORY_ID": 0,
-            "STAGE_ID": "C0:NEW",
-            "OPPORTUNITY": total_price,
-            "CURRENCY_ID": "RUB"
-        }
+        "fields": deal_fields(company_name, total_price, address)
     }
 
     try:
-        response = requests.post(url, json=data)
+        response = post(url, json=data)
         result = response.json()
         
         if result.get("result"):
+            deal_cache.invalidate(result["result"])
             return result["result"]
         else:
             error_msg = result.get("error_description", "Неизвестная ошибка")
@@ -77,10 +243,12 @@ def update_deal(deal_id, total_price):
     }
 
     try:
-        response = requests.post(url, json=payload)
+        response = post(url, json=payload)
         result = response.json()
         
         if result.get("result"):
+            # После ответа: чтение между сбросом и обновлением вернуло бы в кэш старую сделку
+            deal_cache.invalidate(deal_id)
             return True
         else:
             error_msg = result.get("error_description", "Неизвестная ошибка")
@@ -92,7 +260,7 @@ def update_deal(deal_id, total_price):
 
 def get_deal_by_id(deal_id):
     """
-    Получает сделку по ID
+    Получает сделку по ID (через кэш сделок, см. cache.py)
     
     Args:
         deal_id: ID сделки
@@ -100,54 +268,86 @@ def get_deal_by_id(deal_id):
     Returns:
         dict с данными сделки или None
     """
+    return deal_cache.get_or_load(deal_id, _fetch_deal)
+
+
+def _fetch_deal(deal_id):
     url = f"{get_webhook_url()}crm.deal.get.json"
     data = {"id": deal_id}
 
     try:
-        response = requests.post(url, json=data)
+        response = post(url, json=data)
         result = response.json()
         return result.get("result")
     except Exception as e:
         raise Exception(f"Ошибка получения сделки: {str(e)}")
 
 
-def upload_file_to_bitrix(file_path, folder_id=None):
+def upload_to_url(upload_url, filename, content, folder_id):
+    """
+    Второй шаг загрузки: отправить содержимое на uploadUrl,
+    полученный от disk.folder.uploadfile
+
+    Returns:
+        ID загруженного файла
+    """
+    files = {"file": (filename, content, "application/pdf")}
+    data = {"id": folder_id}
+
+    final_response = post(upload_url, files=files, data=data)
+
+    if final_response.status_code == 200:
+        final_result = final_response.json()
+        if final_result.get("result", {}).get("ID"):
+            return final_result["result"]["ID"]
+        else:
+            error_msg = final_result.get("error_description", "Неизвестная ошибка")
+            raise Exception(f"Ошибка загрузки файла: {error_msg}")
+    else:
+        raise Exception(f"HTTP ошибка {final_response.status_code} при загрузке файла")
+
+
+def upload_file_to_bitrix(file, folder_id=None, filename=None):
     """
     Загружает файл в папку диска Битрикс24
     
     Args:
-        file_path: путь к файлу
+        file: путь к файлу, bytes или бинарный файловый объект (например BytesIO)
         folder_id: ID папки в Битрикс24 (из .env)
+        filename: имя файла (обязательно, если file — не путь)
     
     Returns:
         ID загруженного файла или None
     """
-    if not os.path.isfile(file_path):
-        raise Exception(f"Файл не найден: {file_path}")
+    if isinstance(file, (str, os.PathLike)):
+        if not os.path.isfile(file):
+            raise Exception(f"Файл не найден: {file}")
+        filename = filename or os.path.basename(file)
+        with open(file, "rb") as f:
+            content = f.read()
+    elif isinstance(file, (bytes, bytearray)):
+        content = bytes(file)
+    else:
+        content = file.read()
+
+    if not filename:
+        raise Exception("Не указано имя файла для загрузки")
 
     if folder_id is None:
-        folder_id = int(os.getenv('BITRIX24_FOLDER_ID', '0'))
-        if folder_id == 0:
-            raise Exception("BITRIX24_FOLDER_ID не установлен в .env")
+        folder_id = get_folder_id()
 
     # Уникальное имя файла
-    base_name, ext = os.path.splitext(os.path.basename(file_path))
-    unique_name = f"{base_name}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{ext}"
-
-    with open(file_path, "rb") as f:
-        content = f.read()
-
-    encoded_content = base64.b64encode(content).decode("utf-8")
+    unique_name = unique_filename(filename)
 
+    # Шаг 1: получаем URL для загрузки
     url = f"{get_webhook_url()}disk.folder.uploadfile"
     payload = {
         "id": folder_id,
-        "name": unique_name,
-        "content": encoded_content
+        "name": unique_name
     }
 
     try:
-        response = requests.post(url, json=payload)
+        response = post(url, json=payload)
         result = response.json()
 
         if not result.get("result", {}).get("uploadUrl"):
@@ -156,21 +356,8 @@ def upload_file_to_bitrix(file_path, folder_id=None):
 
         upload_url = result["result"]["uploadUrl"]
 
-        # Загружаем файл на полученный URL
-        files = {"file": (unique_name, open(file_path, "rb"), "application/pdf")}
-        data = {"id": folder_id}
-
-        final_response = requests.post(upload_url, files=files, data=data)
-
-        if final_response.status_code == 200:
-            final_result = final_response.json()
-            if final_result.get("result", {}).get("ID"):
-                return final_result["result"]["ID"]
-            else:
-                error_msg = final_result.get("error_description", "Неизвестная ошибка")
-                raise Exception(f"Ошибка загрузки файла: {error_msg}")
-        else:
-            raise Exception(f"HTTP ошибка {final_response.status_code} при загрузке файла")
+        # Шаг 2: загружаем содержимое прямо из памяти
+        return upload_to_url(upload_url, unique_name, content, folder_id)
 
     except Exception as e:
         raise Exception(f"Не удалось загрузить файл в Битрикс: {str(e)}")
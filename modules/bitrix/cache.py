@@ -0,0 +1,103 @@
+# modules/bitrix/cache.py
+"""
+Кэш сделок Битрикс24 (read-through, TTL + LRU)
+
+get_deal_by_id сначала смотрит сюда; промах идёт на портал, ответ
+хранится BITRIX_DEAL_CACHE_TTL секунд. Размер ограничен
+BITRIX_DEAL_CACHE_SIZE записями — вытесняется давно не читанная.
+Кэш свой у каждого воркера и общий для его потоков. Сделки, которые мы
+создаём или меняем сами (sync, create_deal/update_deal), из кэша
+удаляются; свежие стадии из входящих событий — кладутся в него.
+Кэш хранит и отдаёт копии: изменение полученной сделки его не портит.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class DealCache:
+    """Потокобезопасный кэш dict сделок по ID"""
+
+    def __init__(self, app=None, ttl=60.0, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'remote_calls': 0, 'remote_seconds': 0.0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('BITRIX_DEAL_CACHE_TTL', 60.0)
+        self.max_size = app.config.get('BITRIX_DEAL_CACHE_SIZE', 1000)
+        self.clear()
+        app.extensions['bitrix_deal_cache'] = self
+
+    def get(self, deal_id):
+        """Копия сделки из кэша или None (просроченная запись удаляется)"""
+        key = int(deal_id)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                self._items.pop(key, None)
+                self._stats['misses'] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats['hits'] += 1
+            deal = item[1]
+        return copy.deepcopy(deal)
+
+    def put(self, deal_id, deal):
+        deal = copy.deepcopy(deal)
+        with self._lock:
+            self._items[int(deal_id)] = (time.monotonic() + self.ttl, deal)
+            self._items.move_to_end(int(deal_id))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get_or_load(self, deal_id, load):
+        """
+        Сделка из кэша, при промахе — load(deal_id) с портала
+
+        Пустой ответ (сделки нет) не кэшируется.
+        """
+        deal = self.get(deal_id)
+        if deal is not None:
+            return deal
+
+        started = time.perf_counter()
+        try:
+            deal = load(deal_id)
+        finally:
+            with self._lock:
+                self._stats['remote_calls'] += 1
+                self._stats['remote_seconds'] += time.perf_counter() - started
+        if deal is not None:
+            self.put(deal_id, deal)
+        return deal
+
+    def invalidate(self, *deal_ids):
+        with self._lock:
+            for deal_id in deal_ids:
+                if deal_id:
+                    self._items.pop(int(deal_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def metrics(self):
+        """Попадания, промахи и время запросов к порталу в этом процессе"""
+        with self._lock:
+            data = dict(self._stats)
+            data['size'] = len(self._items)
+        lookups = data['hits'] + data['misses']
+        data['hit_ratio'] = data['hits'] / lookups if lookups else 0.0
+        data['remote_avg_ms'] = (data['remote_seconds'] / data['remote_calls'] * 1000
+                                 if data['remote_calls'] else 0.0)
+        return data
+
+
+deal_cache = DealCache()
@@ -0,0 +1,182 @@
+# modules/bitrix/events.py
+"""
+Входящие события Битрикс24 (исходящий вебхук портала ONCRMDEALUPDATE)
+
+Событие несёт только ID сделки, поэтому обработчик запроса лишь проверяет
+токен приложения и кладёт ID в очередь — ответ уходит сразу. Очередь
+разбирается в фоне раз в BITRIX_EVENT_DEBOUNCE секунд: серия событий
+по одной сделке схлопывается в одну, сделки без заказа отсеиваются одним
+запросом по индексу orders.bitrix_deal_id (без обращений к порталу),
+стадии остальных читаются crm.deal.get пачками batch по 50 сделок
+(прочитанные сделки обновляют кэш cache.deal_cache).
+Стадия переводится в Order.status по BITRIX_STAGE_STATUSES.
+
+Если обработка упала (сеть, лимит запросов портала, ошибка БД), сделки
+возвращаются в очередь и разбираются снова с нарастающей паузой: вдвое
+длиннее после каждой неудачи подряд, не дольше BITRIX_EVENT_RETRY_MAX.
+
+Очередь своя у каждого воркера gunicorn: одна сделка, события по которой
+попали в разные воркеры, может быть прочитана дважды — это безопасно,
+обновление статуса идемпотентно.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from extensions import db
+from models import Order
+from .api import BATCH_LIMIT, call_batch
+from .cache import deal_cache
+
+DEAL_UPDATE_EVENT = 'ONCRMDEALUPDATE'
+
+
+def stage_status(stage_id, mapping):
+    """
+    Статус заказа для стадии сделки или None
+
+    Стадии воронок отличаются префиксом (C0:WON, C3:WON) — сначала ищется
+    полный STAGE_ID, затем стадия без префикса.
+    """
+    if not stage_id:
+        return None
+    return mapping.get(stage_id) or mapping.get(stage_id.rsplit(':', 1)[-1])
+
+
+class DealEventQueue:
+    """Очередь сделок, изменённых в Битрикс24, с отложенной обработкой"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.debounce = 2.0
+        self.stage_statuses = {}
+        self.run_async = True
+        self.retry_max = 60.0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._scheduled = False
+        self._failures = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bitrix-events')
+        self._stats = {'received_total': 0, 'deduplicated_total': 0, 'fetched_total': 0,
+                       'updated_total': 0, 'failed_total': 0, 'last_error': None}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.debounce = app.config.get('BITRIX_EVENT_DEBOUNCE', 2.0)
+        self.stage_statuses = app.config.get('BITRIX_STAGE_STATUSES', {})
+        self.run_async = app.config.get('BITRIX_EVENTS_ASYNC', True)
+        self.retry_max = app.config.get('BITRIX_EVENT_RETRY_MAX', 60.0)
+        app.extensions['bitrix_events'] = self
+
+    def push(self, deal_ids):
+        """
+        Поставить сделки в очередь; повтор сделки, уже ждущей обработки,
+        не добавляет работы
+
+        В синхронном режиме (тесты) очередь разбирается сразу.
+        """
+        with self._lock:
+            for deal_id in deal_ids:
+                self._stats['received_total'] += 1
+                if deal_id in self._pending:
+                    self._stats['deduplicated_total'] += 1
+                self._pending.add(deal_id)
+            schedule = self.run_async and self._pending and not self._scheduled
+            if schedule:
+                self._scheduled = True
+
+        if not self.run_async:
+            return self.flush()
+        if schedule:
+            self._executor.submit(self._flush_later, self.debounce)
+
+    def _flush_later(self, delay):
+        time.sleep(delay)
+        with self._lock:
+            # События, пришедшие во время обработки, запланируют следующий проход
+            self._scheduled = False
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                with self._lock:
+                    self._stats['last_error'] = str(e)
+                    self._failures += 1
+                    retry = not self._scheduled
+                    self._scheduled = True
+                    delay = min(self.debounce * 2 ** self._failures, self.retry_max)
+                if retry:
+                    self._executor.submit(self._flush_later, delay)
+            else:
+                with self._lock:
+                    self._failures = 0
+
+    def flush(self):
+        """
+        Обработать накопленные сделки; возвращает число обновлённых заказов
+
+        При ошибке сделки возвращаются в очередь, исключение пробрасывается.
+        """
+        with self._lock:
+            deal_ids = sorted(self._pending)
+            self._pending.clear()
+        if not deal_ids:
+            return 0
+        try:
+            return self.process(deal_ids)
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._pending.update(deal_ids)
+                self._stats['failed_total'] += 1
+            raise
+
+    def process(self, deal_ids):
+        """
+        Обновить статусы заказов по стадиям сделок
+
+        Returns:
+            число заказов, у которых изменился статус
+        """
+        # Сделка изменилась на портале — прежняя копия в кэше устарела
+        deal_cache.invalidate(*deal_ids)
+        rows = db.session.query(Order.bitrix_deal_id).filter(Order.bitrix_deal_id.in_(deal_ids)).all()
+        known = sorted({row.bitrix_deal_id for row in rows})
+
+        statuses = {}
+        for start in range(0, len(known), BATCH_LIMIT):
+            chunk = known[start:start + BATCH_LIMIT]
+            results, _ = call_batch({f'deal_{deal_id}': ('crm.deal.get', {'id': deal_id}) for deal_id in chunk})
+            with self._lock:
+                self._stats['fetched_total'] += len(chunk)
+            for deal_id in chunk:
+                deal = results.get(f'deal_{deal_id}')
+                if deal:
+                    deal_cache.put(deal_id, deal)
+                else:
+                    deal_cache.invalidate(deal_id)
+                status = stage_status((deal or {}).get('STAGE_ID'), self.stage_statuses)
+                if status:
+                    statuses.setdefault(status, []).append(deal_id)
+
+        updated = 0
+        for status, ids in statuses.items():
+            updated += Order.query.filter(Order.bitrix_deal_id.in_(ids), Order.status != status).update(
+                {Order.status: status}, synchronize_session=False
+            )
+        db.session.commit()
+        with self._lock:
+            self._stats['updated_total'] += updated
+        return updated
+
+    def metrics(self):
+        """Полученные, схлопнутые и обработанные события в этом процессе"""
+        with self._lock:
+            data = dict(self._stats)
+            data['pending'] = len(self._pending)
+        return data
+
+
+deal_events = DealEventQueue()
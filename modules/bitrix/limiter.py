@@ -0,0 +1,204 @@
+"""
+Ограничение частоты запросов к Битрикс24 (token bucket)
+
+Битрикс24 пропускает около 2 запросов в секунду на портал с запасом
+в ~50 запросов, сверх этого отвечает QUERY_LIMIT_EXCEEDED. Корзина общая
+для всех воркеров gunicorn: её состояние хранится в SQLite-файле и
+меняется в транзакции BEGIN IMMEDIATE. Без файла (тесты, скрипты) корзина
+живёт в памяти процесса.
+
+Скорость адаптивная: ответ QUERY_LIMIT_EXCEEDED вдвое снижает её и
+обнуляет запас, каждый успешный запрос понемногу возвращает её к
+настроенной — так массовая синхронизация держится у потолка портала.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    rate REAL NOT NULL
+)
+"""
+
+
+class RateLimitTimeout(Exception):
+    """Не дождались разрешения на запрос"""
+
+
+class TokenBucket:
+    """Корзина токенов с общей для воркеров скоростью"""
+
+    def __init__(self, app=None, rate=2.0, burst=50, path=None):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = rate / 10
+        self.path = path
+        self.max_wait = None
+        self._last_rate = rate
+        self._lock = threading.Lock()
+        self._memory = None
+        self._stats = {'acquired': 0, 'waited_seconds': 0.0, 'limit_errors': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rate = app.config.get('BITRIX_RATE_LIMIT', 2.0)
+        self.burst = app.config.get('BITRIX_RATE_BURST', 50)
+        self.min_rate = self.rate / 10
+        self.path = app.config.get('BITRIX_RATE_LIMIT_PATH')
+        self.max_wait = app.config.get('BITRIX_RATE_MAX_WAIT')
+        self._last_rate = self.rate
+        self._memory = None
+        self.init_storage()
+        app.extensions['bitrix_rate_limiter'] = self
+
+    def init_storage(self):
+        """Создать файл корзины (если корзина общая для воркеров)"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _update(self, fn):
+        """
+        Прочитать состояние корзины, применить fn(state, now) и сохранить
+
+        fn меняет dict state (tokens, updated, rate) и возвращает результат.
+        """
+        now = time.time()
+        if not self.path:
+            with self._lock:
+                if self._memory is None:
+                    self._memory = {'tokens': float(self.burst), 'updated': now, 'rate': self.rate}
+                return fn(self._memory, now)
+
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated, rate FROM bucket WHERE name = ?', ('bitrix',)).fetchone()
+            state = (dict(zip(('tokens', 'updated', 'rate'), row)) if row
+                     else {'tokens': float(self.burst), 'updated': now, 'rate': self.rate})
+            result = fn(state, now)
+            conn.execute(
+                'INSERT OR REPLACE INTO bucket (name, tokens, updated, rate) VALUES (?, ?, ?, ?)',
+                ('bitrix', state['tokens'], state['updated'], state['rate'])
+            )
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def _refill(self, state, now):
+        state['rate'] = min(state['rate'], self.rate)
+        state['tokens'] = min(self.burst, state['tokens'] + (now - state['updated']) * state['rate'])
+        state['updated'] = now
+
+    def acquire(self, timeout=None):
+        """
+        Дождаться токена на один запрос
+
+        Args:
+            timeout: сколько ждать, сек (по умолчанию BITRIX_RATE_MAX_WAIT)
+
+        Returns:
+            сколько секунд ждали
+
+        Raises:
+            RateLimitTimeout: токен не освободился за timeout секунд
+        """
+        if timeout is None:
+            timeout = self.max_wait
+        started = time.monotonic()
+
+        def take(state, now):
+            self._refill(state, now)
+            self._last_rate = state['rate']
+            if state['tokens'] >= 1:
+                state['tokens'] -= 1
+                return 0.0
+            return (1 - state['tokens']) / state['rate']
+
+        while True:
+            wait = self._update(take)
+            if wait == 0.0:
+                waited = time.monotonic() - started
+                with self._lock:
+                    self._stats['acquired'] += 1
+                    self._stats['waited_seconds'] += waited
+                return waited
+            if timeout is not None and time.monotonic() - started + wait > timeout:
+                raise RateLimitTimeout('Превышен лимит запросов к Битрикс24, повторите позже')
+            time.sleep(min(wait, 1.0))
+
+    def penalize(self):
+        """Битрикс ответил QUERY_LIMIT_EXCEEDED: вдвое снизить скорость и обнулить запас"""
+        def slow_down(state, now):
+            self._refill(state, now)
+            state['rate'] = max(self.min_rate, state['rate'] / 2)
+            state['tokens'] = 0.0
+            self._last_rate = state['rate']
+            return state['rate']
+
+        with self._lock:
+            self._stats['limit_errors'] += 1
+        return self._update(slow_down)
+
+    def reward(self):
+        """Успешный запрос: вернуть скорость к настроенной (на 5% за запрос)"""
+        if self._last_rate >= self.rate:
+            return self._last_rate
+
+        def speed_up(state, now):
+            if state['rate'] < self.rate:
+                self._refill(state, now)
+                state['rate'] = min(self.rate, state['rate'] + self.rate * 0.05)
+            self._last_rate = state['rate']
+            return state['rate']
+
+        return self._update(speed_up)
+
+    def _read(self):
+        """
+        Состояние корзины без изменения: обычный SELECT, без BEGIN IMMEDIATE —
+        метрики не конкурируют с acquire() за блокировку записи
+        """
+        if not self.path:
+            with self._lock:
+                return dict(self._memory) if self._memory is not None else None
+
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            row = conn.execute('SELECT tokens, updated, rate FROM bucket WHERE name = ?', ('bitrix',)).fetchone()
+        finally:
+            conn.close()
+        return dict(zip(('tokens', 'updated', 'rate'), row)) if row else None
+
+    def current_rate(self):
+        state = self._read()
+        return min(state['rate'], self.rate) if state else self.rate
+
+    def metrics(self):
+        """Запросы, суммарное ожидание и ошибки лимита в этом процессе"""
+        with self._lock:
+            data = dict(self._stats)
+        data['rate'] = self.current_rate()
+        data['max_rate'] = self.rate
+        return data
+
+
+rate_limiter = TokenBucket()
@@ -1,11 +1,12 @@
 # modules/bitrix/routes.py
-from flask import Blueprint, jsonify, current_app
+import hmac
+from flask import Blueprint, jsonify, request, current_app
 from models import Order
-from extensions import db
-from .api import create_deal, update_deal, upload_file_to_bitrix
-from modules.pdf.commercial import generate_commercial_pdf
-from modules.pdf.specification import generate_specification_pdf
-import os
+from modules.singleflight import coalescer
+from .limiter import rate_limiter
+from .events import DEAL_UPDATE_EVENT, deal_events
+from .cache import deal_cache
+from . import sync
 
 bitrix_bp = Blueprint('bitrix', __name__)
 
@@ -18,45 +19,80 @@ def sync_order(order_id):
         return jsonify({'success': False, 'error': 'Заказ не найден'}), 404
 
     try:
-        # Создаём/обновляем сделку
-        if order.bitrix_deal_id:
-            update_deal(order.bitrix_deal_id, order.total_price)
-            action = 'updated'
-        else:
-            deal_id = create_deal(
-                company_name=order.customer_name,
-                total_price=order.total_price,
-                address=order.city or ""
-            )
-            order.bitrix_deal_id = deal_id
-            db.session.commit()
-            action = 'created'
-
-        # Генерируем и загружаем PDF
-        exports_dir = current_app.config.get('PDF_EXPORTS_DIR', 'data/exports')
-        os.makedirs(exports_dir, exist_ok=True)
-        files_uploaded = []
-
-        # Коммерческое предложение
-        kp_path = os.path.join(exports_dir, f'KP_{order_id}.pdf')
-        generate_commercial_pdf(order, kp_path)
-        upload_file_to_bitrix(kp_path)
-        files_uploaded.append(f'КП_{order_id}.pdf')
-
-        # Разблюдовка
-        spec_path = os.path.join(exports_dir, f'Spec_{order_id}.pdf')
-        generate_specification_pdf(order, spec_path)
-        upload_file_to_bitrix(spec_path)
-        files_uploaded.append(f'Разблюдовка_{order_id}.pdf')
+        # Повторное нажатие во время синхронизации ждёт её результата
+        deadline = current_app.config.get('PDF_RENDER_DEADLINE', 30)
+        data = coalescer.do(
+            ('bitrix_sync', order_id, order.state_hash()),
+            lambda: sync.sync_order(order, deadline),
+            timeout=current_app.config.get('BITRIX_SYNC_TIMEOUT', 120)
+        )
 
         return jsonify({
             'success': True,
-            'data': {
-                'bitrix_deal_id': order.bitrix_deal_id,
-                'action': action,
-                'files_uploaded': files_uploaded
-            }
+            'data': data
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@bitrix_bp.route('/sync', methods=['POST'])
+def sync_orders():
+    """
+    Синхронизация нескольких заказов: команды всех заказов упаковываются
+    в вызовы batch (до 50 команд), а не по запросу на каждую операцию
+
+    JSON: {"ids": [1, 2, 3]}
+    """
+    ids = (request.get_json(silent=True) or {}).get('ids') or []
+    orders = Order.query.filter(Order.id.in_(ids)).order_by(Order.id).all()
+    if not orders:
+        return jsonify({'success': False, 'error': 'Заказы не найдены'}), 404
+
+    deadline = current_app.config.get('PDF_RENDER_DEADLINE', 30)
+    results = {}
+    batches = 0
+    try:
+        for pack_results in sync.sync_orders(orders, deadline):
+            results.update(pack_results)
+            batches += 1
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'data': {'results': results}}), 500
+
+    return jsonify({
+        'success': all(r['success'] for r in results.values()),
+        'data': {'results': results, 'batches': batches}
+    })
+
+
+@bitrix_bp.route('/events', methods=['POST'])
+def deal_event():
+    """
+    Исходящий вебхук портала: событие ONCRMDEALUPDATE
+
+    Форма: event, data[FIELDS][ID], auth[application_token].
+    Сделка ставится в очередь (events.deal_events), ответ — сразу.
+    """
+    expected = current_app.config.get('BITRIX_APP_TOKEN')
+    token = request.form.get('auth[application_token]', '')
+    if not expected or not hmac.compare_digest(token, expected):
+        return jsonify({'success': False, 'error': 'Неверный токен приложения'}), 403
+
+    if request.form.get('event', '').upper() != DEAL_UPDATE_EVENT:
+        return jsonify({'success': True, 'data': {'queued': False}})
+
+    deal_id = request.form.get('data[FIELDS][ID]', type=int)
+    if not deal_id:
+        return jsonify({'success': False, 'error': 'Не передан ID сделки'}), 400
+
+    deal_events.push([deal_id])
+    return jsonify({'success': True, 'data': {'queued': True}})
+
+
+@bitrix_bp.route('/metrics', methods=['GET'])
+def bitrix_metrics():
+    """Ограничитель запросов к Битрикс24, очередь входящих событий и кэш сделок"""
+    data = rate_limiter.metrics()
+    data['events'] = deal_events.metrics()
+    data['deal_cache'] = deal_cache.metrics()
+    return jsonify({'success': True, 'data': data})
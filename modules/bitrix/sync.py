@@ -0,0 +1,261 @@
+# modules/bitrix/sync.py
+"""
+Синхронизация заказов со сделками Битрикс24
+
+Команды заказов упаковываются в вызовы batch; все запросы идут через
+общий ограничитель частоты (limiter.rate_limiter). Что уже отправлено,
+хранится в BitrixSyncState: неизменившийся заказ не стоит ни одного
+запроса, изменившийся — только запросов на изменившиеся части.
+
+Массовая повторная синхронизация из консоли:
+    flask bitrix resync [--status STATUS] [--ids 1,2,3]
+"""
+
+import hashlib
+import json
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from extensions import db
+from models import Order, BitrixSyncState
+from modules.pdf.service import pdf_renderer, export_filename, download_name
+from .api import (BATCH_LIMIT, call_batch, pack_batches, deal_fields, get_folder_id, unique_filename,
+                  upload_to_url)
+from .limiter import rate_limiter
+from .cache import deal_cache
+
+# Документы, которые прикладываются к сделке
+DOCUMENTS = ('kp', 'spec')
+
+
+def deal_hash(order):
+    """Хэш полей заказа, которые попадают в сделку"""
+    fields = deal_fields(order.customer_name, order.total_price, order.city or "")
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def load_sync_states(orders):
+    """Состояние синхронизации заказов одним запросом: order_id -> BitrixSyncState"""
+    ids = [order.id for order in orders]
+    states = {state.order_id: state for state in BitrixSyncState.query.filter(BitrixSyncState.order_id.in_(ids))}
+    for order in orders:
+        if order.id not in states:
+            states[order.id] = BitrixSyncState(order=order, files={})
+            db.session.add(states[order.id])
+    return states
+
+
+def order_commands(order, folder_id, state):
+    """
+    Команды batch для заказа — только для того, что изменилось
+    с последней синхронизации (state):
+
+    сделка создаётся или обновляется, если изменились её поля;
+    для документов, если изменилось состояние заказа, запрашиваются
+    адреса загрузки. Прежние версии файлов и комментарий в ленте —
+    после загрузки (followup_commands).
+
+    Returns:
+        dict команд; пустой — заказ не менялся
+    """
+    deal_key = f'deal_{order.id}'
+    commands = {}
+    if not order.bitrix_deal_id:
+        commands[deal_key] = ('crm.deal.add', {
+            'fields': deal_fields(order.customer_name, order.total_price, order.city or "")
+        })
+    elif state.deal_id != order.bitrix_deal_id or state.deal_hash != deal_hash(order):
+        commands[deal_key] = ('crm.deal.update', {
+            'id': order.bitrix_deal_id,
+            'fields': {'OPPORTUNITY': order.total_price}
+        })
+
+    state_hash = order.state_hash()
+    files = state.files or {}
+    for kind in DOCUMENTS:
+        if files.get(kind, {}).get('hash') != state_hash:
+            commands[f'{kind}_{order.id}'] = ('disk.folder.uploadfile', {
+                'id': folder_id,
+                'name': unique_filename(export_filename(kind, order.id))
+            })
+    return commands
+
+
+def followup_commands(order, replaced, uploaded, deal_changed):
+    """
+    Команды после загрузки документов: прежние версии загруженных
+    документов — в корзину диска, в ленту сделки — комментарий о том,
+    что действительно отправлено
+
+    Args:
+        replaced: ID прежних файлов, заменённых загруженными
+        uploaded: виды загруженных документов
+        deal_changed: сделка создана или обновлена
+    """
+    commands = {f'delete_{order.id}_{file_id}': ('disk.file.markdeleted', {'id': file_id})
+                for file_id in replaced}
+    if uploaded or deal_changed:
+        commands[f'comment_{order.id}'] = ('crm.timeline.comment.add', {'fields': {
+            'ENTITY_ID': order.bitrix_deal_id,
+            'ENTITY_TYPE': 'deal',
+            'COMMENT': f'Расчёт обновлён: {order.total_price or 0:,.2f} руб. '
+                       f'Документы: {", ".join(download_name(kind, order.id) for kind in uploaded) or "без изменений"}'
+        }})
+    return commands
+
+
+def sync_pack(pack, folder_id, deadline):
+    """
+    Выполнить один batch для группы заказов, загрузить документы
+    и вторым batch убрать прежние версии и написать комментарии
+
+    Старый файл удаляется только после успешной загрузки нового: при
+    ошибке рендеринга или загрузки у сделки остаётся прежний документ.
+
+    Args:
+        pack: список ((заказ, состояние синхронизации), его команды) из pack_batches
+
+    Returns:
+        dict order_id -> результат синхронизации заказа
+    """
+    commands = {}
+    for _, group in pack:
+        commands.update(group)
+    results, errors = call_batch(commands) if commands else ({}, {})
+
+    synced = {}
+    followups = []
+    for (order, state), group in pack:
+        deal_key = f'deal_{order.id}'
+        if deal_key in errors:
+            synced[order.id] = {'success': False, 'error': str(errors[deal_key])}
+            continue
+
+        if not group:
+            action = 'unchanged'
+        elif order.bitrix_deal_id:
+            action = 'updated'
+        else:
+            action = 'created'
+            order.bitrix_deal_id = int(results[deal_key])
+        if deal_key in group:
+            state.deal_hash = deal_hash(order)
+            deal_cache.invalidate(order.bitrix_deal_id)
+        state.deal_id = order.bitrix_deal_id
+
+        state_hash = order.state_hash()
+        files = dict(state.files or {})
+        uploaded, replaced, failed = [], [], []
+        for kind in DOCUMENTS:
+            key = f'{kind}_{order.id}'
+            if key not in group:
+                continue
+            try:
+                if key in errors:
+                    raise errors[key]
+                pdf = pdf_renderer.render_cached(order, kind, timeout=deadline)
+                file_id = upload_to_url(results[key]['uploadUrl'], group[key][1]['name'], pdf, folder_id)
+            except Exception as e:
+                failed.append(f'{download_name(kind, order.id)}: {e}')
+                continue
+            previous = files.get(kind, {}).get('id')
+            if previous and previous != file_id:
+                replaced.append(previous)
+            files[kind] = {'id': file_id, 'hash': state_hash}
+            uploaded.append(kind)
+
+        state.files = files
+        if group:
+            state.synced_at = datetime.utcnow()
+        followup = followup_commands(order, replaced, uploaded, deal_key in group)
+        if followup:
+            followups.append((order.id, followup))
+        synced[order.id] = {
+            'success': not failed,
+            'bitrix_deal_id': order.bitrix_deal_id,
+            'action': action,
+            'files_uploaded': [download_name(kind, order.id) for kind in uploaded],
+        }
+        if failed:
+            synced[order.id]['error'] = '; '.join(failed)
+
+    # Загруженное уже на портале — состояние сохраняется до второго batch
+    db.session.commit()
+    for followup_pack in pack_batches(followups):
+        commands = {}
+        for _, group in followup_pack:
+            commands.update(group)
+        try:
+            _, errors = call_batch(commands)
+        except Exception as e:
+            errors = {name: e for name in commands}
+        for order_id, group in followup_pack:
+            failed = [f'{group[name][0]}: {errors[name]}' for name in group if name in errors]
+            if failed:
+                # Документы уже загружены: синхронизация успешна, но в корзине — не всё
+                synced[order_id]['warning'] = '; '.join(failed)
+    return synced
+
+
+def sync_order(order, deadline):
+    """
+    Создать/обновить сделку и загрузить документы: один batch и загрузка
+    файлов; если заказ не менялся с последней синхронизации — ничего
+    """
+    folder_id = get_folder_id()
+    state = load_sync_states([order])[order.id]
+    pack = [((order, state), order_commands(order, folder_id, state))]
+    result = sync_pack(pack, folder_id, deadline)[order.id]
+    if not result.pop('success'):
+        raise Exception(result['error'])
+    return result
+
+
+def sync_orders(orders, deadline):
+    """
+    Синхронизировать заказы пачками batch
+
+    Yields:
+        dict order_id -> результат по каждой выполненной пачке
+    """
+    folder_id = get_folder_id()
+    for start in range(0, len(orders), BATCH_LIMIT):
+        chunk = orders[start:start + BATCH_LIMIT]
+        states = load_sync_states(chunk)
+        groups = (((order, states[order.id]), order_commands(order, folder_id, states[order.id]))
+                  for order in chunk)
+        for pack in pack_batches(groups):
+            yield sync_pack(pack, folder_id, deadline)
+
+
+@click.group('bitrix')
+def bitrix_cli():
+    """Обслуживание интеграции с Битрикс24"""
+
+
+@bitrix_cli.command('resync')
+@click.option('--status', default=None, help='Только заказы с этим статусом')
+@click.option('--ids', default=None, help='Список id через запятую')
+@with_appcontext
+def resync_command(status, ids):
+    """Повторно синхронизировать заказы со сделками (с учётом лимита запросов)"""
+    query = Order.query.order_by(Order.id)
+    if status:
+        query = query.filter(Order.status == status)
+    if ids:
+        query = query.filter(Order.id.in_([int(i) for i in ids.split(',')]))
+
+    deadline = current_app.config.get('PDF_RENDER_DEADLINE', 30)
+    started = time.monotonic()
+    done = failed = 0
+    for results in sync_orders(query.all(), deadline):
+        for order_id, result in results.items():
+            done += 1
+            if not result['success']:
+                failed += 1
+                click.echo(f'Заказ {order_id}: {result["error"]}')
+        elapsed = time.monotonic() - started
+        click.echo(f'Синхронизировано {done}, ошибок {failed}, '
+                   f'{done / elapsed:.1f} заказов/с, лимит {rate_limiter.current_rate():.2f} запр/с')
@@ -18,6 +18,9 @@ from .core import (
     calculate_jv_zigzag
 )
 
+# Поддерживаемые типы систем
+SYSTEM_TYPES = ('Slider L', 'Slider X', 'JV Line', 'JV Zig-Zag')
+
 
 def calculate_system(system_data: dict) -> dict:
     """
@@ -0,0 +1,45 @@
+"""
+Обход спецификации комплектующих (BOM) из результата расчёта
+"""
+
+# Категории в порядке вывода в разблюдовке
+BOM_CATEGORIES = ['profiles', 'seals', 'interpanel_seals', 'hardware', 'consumables', 'fasteners']
+
+# Названия категорий для документов
+BOM_CATEGORY_TITLES = {
+    'profiles': 'Профили',
+    'seals': 'Уплотнители',
+    'interpanel_seals': 'Межстворчатые уплотнители',
+    'hardware': 'Фурнитура',
+    'consumables': 'Расходные материалы',
+    'fasteners': 'Крепёж',
+}
+
+# Категории, которые учитываются в погонных метрах
+METERED_CATEGORIES = ('profiles', 'seals', 'interpanel_seals')
+
+
+def bom_quantity(cat_key, item):
+    """
+    Количество и единица измерения позиции
+
+    Returns:
+        (qty, unit)
+    """
+    if cat_key in METERED_CATEGORIES:
+        return item.get('total_m', 0), 'п.м'
+    return item.get('qty', item.get('pieces', 0)), item.get('unit', 'шт')
+
+
+def iter_bom(calc_data):
+    """
+    Обойти все позиции расчёта
+
+    Yields:
+        (cat_key, item, qty, unit)
+    """
+    calc_data = calc_data or {}
+    for cat_key in BOM_CATEGORIES:
+        for item in calc_data.get(cat_key) or []:
+            qty, unit = bom_quantity(cat_key, item)
+            yield cat_key, item, qty, unit
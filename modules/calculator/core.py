@@ -2,8 +2,12 @@
 """
 Точный расчёт комплектующих для систем безрамного остекления
 Системы: Slider L, Slider X, Line, Zig-Zag
+
+checkpoint(...) отмечает начало этапа для профилирования (см. profiling.py)
 """
 
+from .profiling import checkpoint
+
 def calculate_slider_l(width, height, panels, opening="влево", 
                        left_edge="боковой профиль", right_edge="боковой профиль",
                        handle_type="круглая", handle_count=2, 
@@ -32,6 +36,7 @@ def calculate_slider_l(width, height, panels, opening="влево",
     """
     
     # ===== 1. ОПРЕДЕЛЕНИЕ ТИПА СИСТЕМЫ (3 или 5 дорожек) =====
+    checkpoint('tracks')
     is_center_opening = opening == "от центра"
     
     if is_center_opening:
@@ -70,6 +75,7 @@ def calculate_slider_l(width, height, panels, opening="влево",
             raise ValueError(f"Для открывания '{opening}' допустимо 2-3 створки (3 дорожки) или 4-5 створок (5 дорожек)")
     
     # ===== 2. РАСЧЁТ ШИРИНЫ СТЕКЛА =====
+    checkpoint('glass_width')
     side_profiles_count = 0
     if left_edge == "боковой профиль":
         side_profiles_count += 1
@@ -92,10 +98,12 @@ def calculate_slider_l(width, height, panels, opening="влево",
     glass_width = round((glass_width + 0.05) // 0.1 * 0.1, 1)
     
     # ===== 3. РАСЧЁТ МАССЫ СТВОРКИ =====
+    checkpoint('weight')
     glass_area = (glass_width / 1000) * (glass_height / 1000)
     glass_weight_kg = glass_area * (glass_thickness * 2.5)
     
     # ===== 4. ПРОФИЛИ С ЗАПАСОМ НА РЕЗКУ =====
+    checkpoint('profiles')
     top_profile_length = width
     top_profile_cut_waste = 75 + 5 * 0
     top_profile_total = top_profile_length + top_profile_cut_waste
@@ -116,6 +124,7 @@ def calculate_slider_l(width, height, panels, opening="влево",
     sash_profile_total = sash_profile_length_per_panel * panels + sash_profile_cut_waste
     
     # ===== 5. ЗАГЛУШКИ =====
+    checkpoint('plugs')
     side_plugs = 0
     middle_plugs = 0
     
@@ -156,19 +165,23 @@ def calculate_slider_l(width, height, panels, opening="влево",
     total_plugs = side_plugs + middle_plugs
     
     # ===== 6. ДЕМПФЕРЫ =====
+    checkpoint('dampers')
     dampers_qty = middle_plugs
     
     # ===== 7. РОЛИКИ =====
+    checkpoint('rollers')
     rollers_base = panels * 2
     rollers_extra = panels * 2 if glass_weight_kg > 90 else 0
     rollers_total = rollers_base + rollers_extra
     
     # ===== 8. РУЧКИ И ЗАДВИЖКИ =====
+    checkpoint('handles')
     handle_code = "S-040" if handle_type == "круглая" else "S-050"
     handles_qty = handle_count
     latches_qty = latch_count
     
     # ===== 9. УПЛОТНИТЕЛИ =====
+    checkpoint('seals')
     seal_top_length_m = (top_profile_length * track_count * 2) / 1000
     seal_side_length_m = (side_profile_length * 2 * 2) / 1000
     
@@ -195,6 +208,7 @@ def calculate_slider_l(width, height, panels, opening="влево",
         aa070_total_m = 0
     
     # ===== 10. КРЕПЁЖ =====
+    checkpoint('fasteners')
     top_screws = 2
     remaining_top = width - 200
     if remaining_top > 0:
@@ -209,6 +223,7 @@ def calculate_slider_l(width, height, panels, opening="влево",
     latch_screws = latches_qty * 2
     
     # ===== 11. РАСЧЁТ КЛЕЯ И АКТИВАТОРА =====
+    checkpoint('glue')
     # Для слайдера: клей наносится на 2 стороны створочника (сверху и снизу)
     glue_per_panel_m = (glass_width / 1000) * 2
     total_glue_length_m = glue_per_panel_m * panels
@@ -218,6 +233,7 @@ def calculate_slider_l(width, height, panels, opening="влево",
     activator_bottles = glue_tubes
     
     # ===== ФОРМИРОВАНИЕ РЕЗУЛЬТАТА =====
+    checkpoint('result')
     result = {
         "system_info": {
             "type": "Slider L",
@@ -452,6 +468,7 @@ def calculate_slider_x(width, height, panels, opening="влево",
     """
     
     # ===== 1. ОПРЕДЕЛЕНИЕ ТИПА СИСТЕМЫ (3 или 5 дорожек) =====
+    checkpoint('tracks')
     is_center_opening = opening == "от центра"
     
     if is_center_opening:
@@ -490,6 +507,7 @@ def calculate_slider_x(width, height, panels, opening="влево",
             raise ValueError(f"Для открывания '{opening}' допустимо 2-3 створки (3 дорожки) или 4-5 створок (5 дорожек)")
     
     # ===== 2. РАСЧЁТ ШИРИНЫ СТЕКЛА =====
+    checkpoint('glass_width')
     side_profiles_count = 0
     if left_edge == "боковой профиль":
         side_profiles_count += 1
@@ -512,10 +530,12 @@ def calculate_slider_x(width, height, panels, opening="влево",
     glass_width = round((glass_width + 0.05) // 0.1 * 0.1, 1)
     
     # ===== 3. РАСЧЁТ МАССЫ СТВОРКИ =====
+    checkpoint('weight')
     glass_area = (glass_width / 1000) * (glass_height / 1000)
     glass_weight_kg = glass_area * (glass_thickness * 2.5)
     
     # ===== 4. ПРОФИЛИ С ЗАПАСОМ НА РЕЗКУ =====
+    checkpoint('profiles')
     top_profile_length = width
     top_profile_cut_waste = 75 + 5 * 0
     top_profile_total = top_profile_length + top_profile_cut_waste
@@ -536,6 +556,7 @@ def calculate_slider_x(width, height, panels, opening="влево",
     sash_profile_total = sash_profile_length_per_panel * panels + sash_profile_cut_waste
     
     # ===== 5. ЗАГЛУШКИ (ТАКАЯ ЖЕ ЛОГИКА КАК У SLIDER L) =====
+    checkpoint('plugs')
     side_plugs = 0
     middle_plugs = 0
     
@@ -574,18 +595,22 @@ def calculate_slider_x(width, height, panels, opening="влево",
     total_plugs = side_plugs + middle_plugs
     
     # ===== 6. ДЕМПФЕРЫ =====
+    checkpoint('dampers')
     dampers_qty = middle_plugs
     
     # ===== 7. РОЛИКИ =====
+    checkpoint('rollers')
     rollers_base = panels * 2
     rollers_extra = panels * 2 if glass_weight_kg > 100 else 0  # 100 кг вместо 90 кг
     rollers_total = rollers_base + rollers_extra
     
     # ===== 8. РУЧКИ =====
+    checkpoint('handles')
     handle_code = "S-040" if handle_type == "круглая" else "S-050"
     handles_qty = handle_count
     
     # ===== 9. ЗАДВИЖКИ =====
+    checkpoint('latches')
     if is_center_opening:
         if panels % 2 == 0:
             external_latches = 2
@@ -598,6 +623,7 @@ def calculate_slider_x(width, height, panels, opening="влево",
         internal_latches = 1
     
     # ===== 10. УПЛОТНИТЕЛИ =====
+    checkpoint('seals')
     seal_top_length_m = (top_profile_length * track_count * 2) / 1000
     seal_side_length_m = (side_profile_length * 2 * 2) / 1000
     
@@ -624,6 +650,7 @@ def calculate_slider_x(width, height, panels, opening="влево",
         aa070_total_m = 0
     
     # ===== 11. КРЕПЁЖ =====
+    checkpoint('fasteners')
     top_screws = 2
     remaining_top = width - 200
     if remaining_top > 0:
@@ -639,6 +666,7 @@ def calculate_slider_x(width, height, panels, opening="влево",
     latch_screws = (external_latches + internal_latches) * 2
     
     # ===== 12. РАСЧЁТ КЛЕЯ И АКТИВАТОРА =====
+    checkpoint('glue')
     # Для слайдера: клей наносится на 2 стороны створочника (сверху и снизу)
     glue_per_panel_m = (glass_width / 1000) * 2
     total_glue_length_m = glue_per_panel_m * panels
@@ -647,6 +675,7 @@ def calculate_slider_x(width, height, panels, opening="влево",
     activator_bottles = glue_tubes
     
     # ===== ФОРМИРОВАНИЕ РЕЗУЛЬТАТА =====
+    checkpoint('result')
     result = {
         "system_info": {
             "type": "Slider X",
@@ -895,6 +924,7 @@ def calculate_jv_line(width, height, panels,
     """
     
     # ===== 1. ОПРЕДЕЛЕНИЕ ПАРАМЕТРОВ СИСТЕМЫ =====
+    checkpoint('parameters')
     side_profiles_count = 0
     if left_edge == "боковой профиль":
         side_profiles_count += 1
@@ -909,6 +939,7 @@ def calculate_jv_line(width, height, panels,
     total_joint_gap = (panels - 1) * joint_gap
     
     # ===== 2. РАСЧЁТ ШИРИНЫ СТЕКЛА =====
+    checkpoint('glass_width')
     standard_width = (width - total_gap - total_joint_gap) / panels
     glass_widths = [standard_width] * panels
     glass_widths = [round((gw + 0.05) // 0.1 * 0.1, 1) for gw in glass_widths]
@@ -918,12 +949,14 @@ def calculate_jv_line(width, height, panels,
     glass_height = height - 150
     
     # ===== 3. РАСЧЁТ ГЛУБИНЫ ПАРКОВКИ =====
+    checkpoint('parking')
     parking_depth = 200 + 35 * panels
     parking_width = standard_width - 100
     if parking_width < 0:
         parking_width = 0
     
     # ===== 4. ПРОФИЛИ С ЗАПАСОМ НА РЕЗКУ =====
+    checkpoint('profiles')
     ln010_length = width - 200 + parking_width - 78 + parking_depth + 44
     ln010_cut_waste = 75 + 5 * 0
     ln010_total = ln010_length + ln010_cut_waste
@@ -947,6 +980,7 @@ def calculate_jv_line(width, height, panels,
     ln040_qty = 2
     
     # ===== 5. КОМПЛЕКТУЮЩИЕ =====
+    checkpoint('hardware')
     ln050_code = "LN-050-L" if opening == "влево" else "LN-050-R"
     ln050_qty = 1
     
@@ -979,6 +1013,7 @@ def calculate_jv_line(width, height, panels,
     ln160_qty = 1
     
     # ===== 6. ЗАГЛУШКИ =====
+    checkpoint('plugs')
     joints_count = panels - 1 if panels > 1 else 0
     
     if opening == "влево":
@@ -997,6 +1032,7 @@ def calculate_jv_line(width, height, panels,
     ln_bsr_qty = 1
     
     # ===== 7. УПЛОТНИТЕЛИ =====
+    checkpoint('seals')
     aa010_qty = 0
     for gw in glass_widths:
         if gw < 800:
@@ -1012,6 +1048,7 @@ def calculate_jv_line(width, height, panels,
     aa090_qty = 1 if panels > 2 else 0
     
     # ===== 8. РАСЧЁТ КЛЕЯ И АКТИВАТОРА =====
+    checkpoint('glue')
     # Для лайна: клей наносится на 4 стороны створочника (сверху, снизу, слева, справа)
     glue_per_panel_m = (standard_width / 1000) * 4
     total_glue_length_m = glue_per_panel_m * panels
@@ -1020,6 +1057,7 @@ def calculate_jv_line(width, height, panels,
     activator_bottles = glue_tubes
     
     # ===== ФОРМИРОВАНИЕ РЕЗУЛЬТАТА =====
+    checkpoint('result')
     result = {
         "system_info": {
             "type": "JV Line",
@@ -1287,12 +1325,14 @@ def calculate_jv_zigzag(width, height, panels,
     """
     
     # ===== ВАЛИДАЦИЯ =====
+    checkpoint('validation')
     if panels % 1 == 0:
         raise ValueError(f"Количество створок должно быть дробным (1.5, 2.5, 3.5, 4.5), получено: {panels}")
     if panels < 1.5 or panels > 4.5:
         raise ValueError(f"Количество створок должно быть от 1.5 до 4.5, получено: {panels}")
     
     # ===== 1. РАСЧЁТ ШИРИНЫ СТЕКЛА =====
+    checkpoint('glass_width')
     integer_panels = int(panels)  # целое количество полноценных створок
     
     if glass_width_override is not None:
@@ -1326,6 +1366,7 @@ def calculate_jv_zigzag(width, height, panels,
     total_panels = integer_panels + 1
     
     # ===== 2. ПРОВЕРКА ВЛЕЗАНИЯ СИСТЕМЫ В ПРОЁМ =====
+    checkpoint('fit_check')
     # Зазоры для одной стороны:
     # - слева (у стены): 15 мм (боковой профиль)
     # - между створками: 7 мм на каждый стык (всего стыков = total_panels - 1)
@@ -1351,6 +1392,7 @@ def calculate_jv_zigzag(width, height, panels,
         )
     
     # ===== 3. ПРОФИЛИ С ЗАПАСОМ НА РЕЗКУ =====
+    checkpoint('profiles')
     # Профиль несущий (LN-010)
     ln010_length = width
     ln010_cut_waste = 75 + 5 * 0
@@ -1377,6 +1419,7 @@ def calculate_jv_zigzag(width, height, panels,
     ln040_qty = 1  # для одной стороны только 1 боковой профиль
     
     # ===== 4. КОМПЛЕКТУЮЩИЕ =====
+    checkpoint('hardware')
     # Роликовые каретки (на все створки кроме поворотной)
     rollers_qty = total_panels - 1 if total_panels > 1 else 0
     
@@ -1397,6 +1440,7 @@ def calculate_jv_zigzag(width, height, panels,
     ln150_qty = 1  # 1 шт на систему
     
     # ===== 5. ЗАГЛУШКИ =====
+    checkpoint('plugs')
     # Количество стыков между створками
     joints_count = total_panels - 1
     
@@ -1421,10 +1465,12 @@ def calculate_jv_zigzag(width, height, panels,
     ln_bsr_qty = ln_tsr_qty
     
     # ===== 6. ПЕТЛИ =====
+    checkpoint('hinges')
     ln210_qty = joints_count  # Верхние петли
     ln220_qty = joints_count  # Нижние петли
     
     # ===== 7. УПЛОТНИТЕЛИ =====
+    checkpoint('seals')
     # AA-010: полосовая щётка (1.6 м = 1600 мм, вставляется в 2 паза на створку)
     aa010_qty = 0
     brush_length_mm = 1600
@@ -1445,6 +1491,7 @@ def calculate_jv_zigzag(width, height, panels,
     aa070_qty = 2 if total_panels >= 2 else 1
     
     # ===== 8. РАСЧЁТ КЛЕЯ И АКТИВАТОРА =====
+    checkpoint('glue')
     # Для зиг-зага: клей наносится на 4 стороны створочника (сверху, снизу, слева, справа)
     glue_per_panel_m = (standard_width / 1000) * 4
     total_glue_length_m = glue_per_panel_m * total_panels
@@ -1454,15 +1501,18 @@ def calculate_jv_zigzag(width, height, panels,
     activator_bottles = glue_tubes
     
     # ===== 9. КРЕПЁЖ =====
+    checkpoint('fasteners')
     total_plugs = ln_tsl_qty + ln_tsr_qty + ln_bsl_qty + ln_bsr_qty
     ln208_qty = total_plugs  # Саморезы для заглушек (по 1 шт на заглушку)
     ln209_qty = (ln210_qty + ln220_qty) * 2  # Саморезы для петель (по 2 шт на петлю)
     
     # ===== 10. РАСЧЁТ МАССЫ СТВОРКИ =====
+    checkpoint('weight')
     glass_area = (standard_width / 1000) * (glass_height / 1000)
     glass_weight_kg = glass_area * 25  # 10мм закалённое стекло ≈ 25 кг/м²
     
     # ===== ФОРМИРОВАНИЕ РЕЗУЛЬТАТА =====
+    checkpoint('result')
     result = {
         "system_info": {
             "type": "JV Zig-Zag",
@@ -0,0 +1,125 @@
+# modules/calculator/profiling.py
+"""
+Профилирование этапов калькуляторов
+
+Калькуляторы в core.py отмечают начало каждого этапа вызовом
+checkpoint('rollers'); этап длится до следующей отметки или до конца
+расчёта. Без активного профиля checkpoint ничего не делает (одна
+проверка ContextVar), поэтому отметки остаются в коде всегда.
+
+    with profile_calculation(memory=True) as profile:
+        calculate_system(params)
+    profile.report()  # [{'stage': 'tracks', 'ms': 0.02, 'alloc_bytes': 1200}, ...]
+
+Память считается через tracemalloc (прирост занятой памяти за этап и
+пик). tracemalloc замедляет весь процесс, пока включён, поэтому
+memory=True — только для отдельных запросов (заголовок отладки,
+выборка в продакшене). Трассировка общая для потоков воркера: она
+включается первым профилем с памятью и выключается последним, а
+память одновременных расчётов в других потоках попадает в замер.
+"""
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_active = ContextVar('calculation_profile', default=None)
+
+# Профили с памятью, которым сейчас нужна трассировка, и включили ли её мы
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+
+
+def _start_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class CalculationProfile:
+    """Время и память по этапам одного расчёта"""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = []
+        self._stage = None
+        self._started = None
+        self._memory_at = 0
+
+    def checkpoint(self, stage):
+        self._close()
+        self._stage = stage
+        if self.memory:
+            tracemalloc.reset_peak()
+            self._memory_at = tracemalloc.get_traced_memory()[0]
+        self._started = time.perf_counter()
+
+    def _close(self):
+        if self._stage is None:
+            return
+        seconds = time.perf_counter() - self._started
+        entry = {'stage': self._stage, 'seconds': seconds}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            entry['alloc_bytes'] = current - self._memory_at
+            entry['peak_bytes'] = peak - self._memory_at
+        self.stages.append(entry)
+        self._stage = None
+
+    def report(self):
+        """Этапы для ответа API: время в мс, память в байтах"""
+        result = []
+        for entry in self.stages:
+            item = {'stage': entry['stage'], 'ms': round(entry['seconds'] * 1000, 3)}
+            if 'alloc_bytes' in entry:
+                item['alloc_bytes'] = entry['alloc_bytes']
+                item['peak_bytes'] = entry['peak_bytes']
+            result.append(item)
+        return result
+
+
+def checkpoint(stage):
+    """Начало этапа расчёта (без активного профиля — ничего)"""
+    profile = _active.get()
+    if profile is not None:
+        profile.checkpoint(stage)
+
+
+@contextmanager
+def profile_calculation(enabled=True, memory=False):
+    """
+    Профилировать расчёты внутри блока
+
+    Yields:
+        CalculationProfile или None, если enabled=False
+    """
+    if not enabled:
+        yield None
+        return
+
+    profile = CalculationProfile(memory=memory)
+    if memory:
+        _start_tracing()
+    token = _active.set(profile)
+    try:
+        yield profile
+    finally:
+        profile._close()
+        _active.reset(token)
+        if memory:
+            _stop_tracing()
@@ -0,0 +1,82 @@
+"""
+Сжатие ответов: gzip и brotli
+
+JSON (заказ с calculated_data всех систем) и PDF крупнее COMPRESS_MIN_SIZE
+сжимаются по заголовку Accept-Encoding клиента: brotli, если установлен
+пакет brotli и клиент его принимает, иначе gzip. Сжимаются только
+ответы 200 с известной длиной: потоковые (ZIP массовой выгрузки),
+частичные (Range) и уже сжатые ответы отдаются как есть. ETag сжатого
+ответа становится слабым — байты отличаются от исходных.
+
+PDF из ReportLab уже сжаты внутри (потоки страниц — deflate), выигрыш
+на них небольшой; основной эффект — на JSON.
+"""
+
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость
+    brotli = None
+
+
+class ResponseCompressor:
+    """Сжатие ответов в after_request"""
+
+    def __init__(self, app=None):
+        self.mimetypes = frozenset()
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mimetypes = frozenset(app.config.get('COMPRESS_MIMETYPES', ()))
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+        self.gzip_level = app.config.get('COMPRESS_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESS_BR_QUALITY', 4)
+        app.after_request(self.after_request)
+        app.extensions['compression'] = self
+
+    @property
+    def encodings(self):
+        """Поддерживаемые кодировки в порядке предпочтения"""
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def after_request(self, response):
+        if response.mimetype not in self.mimetypes or response.status_code != 200:
+            return response
+        if 'Content-Encoding' in response.headers:
+            return response
+        length = response.content_length
+        if length is None and not response.direct_passthrough and not response.is_streamed:
+            length = response.calculate_content_length()
+        if length is None:
+            return response
+
+        # От Accept-Encoding зависит тело ответа — кэши должны это учитывать
+        response.vary.add('Accept-Encoding')
+        if length < self.min_size:
+            return response
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        # send_file отдаёт файл напрямую; для сжатия его нужно прочитать
+        response.direct_passthrough = False
+        response.set_data(self.compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+response_compressor = ResponseCompressor()
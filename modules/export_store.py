@@ -0,0 +1,300 @@
+"""
+Хранилище файлов экспорта с ограничением размера
+
+Все файлы каталога экспорта (PDF задач, кэш документов) записываются через
+ExportStore. Индекс — SQLite-файл в том же каталоге: размер и время
+последнего обращения каждого файла, общий для всех воркеров gunicorn,
+поэтому ни поиск, ни вытеснение не сканируют каталог. При превышении
+квоты удаляются давно не использованные файлы (LRU), файлы старше
+EXPORT_STORE_MAX_AGE_DAYS удаляются независимо от квоты.
+
+Общий размер хранится в индексе (таблица totals, её ведут триггеры),
+поэтому запись файла проверяет квоту и возраст двумя чтениями по ключу
+и индексу, а вытеснение запускается, только когда порог превышен.
+Запись файла и его строки индекса, как и удаление строки вместе с
+файлом, выполняются под блокировкой записи индекса: вытеснение не
+может удалить файл, который в этот момент записывается заново.
+
+Обслуживание из консоли:
+    flask exports report
+    flask exports prune [--max-mb N] [--max-age-days N]
+    flask exports reindex
+"""
+
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+import click
+from flask.cli import with_appcontext
+from flask import current_app
+
+INDEX_NAME = '.index.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed);
+CREATE INDEX IF NOT EXISTS ix_entries_created ON entries (created);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    size INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS entries_size_ai AFTER INSERT ON entries BEGIN
+    UPDATE totals SET size = size + new.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_size_ad AFTER DELETE ON entries BEGIN
+    UPDATE totals SET size = size - old.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_size_au AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET size = size - old.size + new.size WHERE id = 1;
+END;
+-- Индекс, созданный до появления totals: начальный размер по существующим записям
+INSERT OR IGNORE INTO totals (id, size) SELECT 1, COALESCE(SUM(size), 0) FROM entries;
+"""
+
+
+def atomic_write(path, data):
+    """Записать файл через временный + rename: читатели не видят недописанный файл"""
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ExportStore:
+    """Каталог экспорта с индексом, квотой и вытеснением по давности обращения"""
+
+    def __init__(self, app=None):
+        self.root = 'data/exports'
+        self.max_bytes = 1024 * 1024 * 1024
+        self.max_age = 30 * 86400
+        self._stats = {'hits': 0, 'misses': 0, 'evicted_files': 0, 'evicted_bytes': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.root = app.config.get('PDF_EXPORTS_DIR', 'data/exports')
+        self.max_bytes = int(app.config.get('EXPORT_STORE_MAX_MB', 1024) * 1024 * 1024)
+        self.max_age = app.config.get('EXPORT_STORE_MAX_AGE_DAYS', 30) * 86400
+        self.init_index()
+        app.extensions['export_store'] = self
+        app.cli.add_command(exports_cli)
+
+    def init_index(self):
+        """Создать каталог и таблицу индекса"""
+        os.makedirs(self.root, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(f'BEGIN IMMEDIATE;\n{_SCHEMA}\nCOMMIT;')
+
+    @contextmanager
+    def _connect(self):
+        """Соединение с индексом: транзакция фиксируется при выходе"""
+        conn = sqlite3.connect(os.path.join(self.root, INDEX_NAME), timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def path(self, key):
+        """Абсолютный путь файла по ключу (относительному пути в каталоге)"""
+        return os.path.join(self.root, key)
+
+    def put(self, key, data):
+        """
+        Атомарно записать файл и учесть его в индексе; при превышении квоты
+        вытеснить давно не использованные файлы
+
+        Returns:
+            путь к записанному файлу
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            atomic_write(path, data)
+            now = time.time()
+            conn.execute(
+                'INSERT INTO entries (key, size, created, accessed) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET size = excluded.size, '
+                'created = excluded.created, accessed = excluded.accessed',
+                (key, len(data), now, now)
+            )
+            total = conn.execute('SELECT size FROM totals WHERE id = 1').fetchone()[0]
+            oldest = conn.execute('SELECT MIN(created) FROM entries').fetchone()[0]
+        if total > self.max_bytes or (self.max_age and oldest is not None and oldest < now - self.max_age):
+            self.prune(keep=key)
+        return path
+
+    def get(self, key):
+        """Содержимое файла (bytes) или None; обращение продлевает жизнь файла"""
+        path = self.open_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def open_path(self, key):
+        """
+        Путь к существующему файлу (для send_file) или None
+
+        Файл, удалённый мимо индекса, убирается из индекса.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+            found = cursor.rowcount > 0
+            if found and not os.path.exists(self.path(key)):
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                found = False
+        self._stats['hits' if found else 'misses'] += 1
+        return self.path(key) if found else None
+
+    def delete(self, key):
+        """Удалить файл и запись индекса"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._remove_file(key)
+
+    def prune(self, max_bytes=None, max_age=None, keep=None):
+        """
+        Удалить файлы старше max_age и самые давние по обращению сверх max_bytes
+
+        Args:
+            keep: ключ, который не удалять (только что записанный файл)
+
+        Returns:
+            (удалено файлов, освобождено байт)
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+
+        victims = []
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if max_age:
+                victims += conn.execute(
+                    'SELECT key, size FROM entries WHERE created < ? AND key IS NOT ?',
+                    (time.time() - max_age, keep)
+                ).fetchall()
+            total = conn.execute('SELECT size FROM totals WHERE id = 1').fetchone()[0]
+            total -= sum(size for _, size in victims)
+            if total > max_bytes:
+                expired = {key for key, _ in victims}
+                for key, size in conn.execute(
+                        'SELECT key, size FROM entries WHERE key IS NOT ? ORDER BY accessed', (keep,)):
+                    if total <= max_bytes:
+                        break
+                    if key in expired:
+                        continue
+                    victims.append((key, size))
+                    total -= size
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key, _ in victims])
+            # Файлы — под той же блокировкой: put того же ключа ждёт и пишет файл уже после удаления
+            for key, _ in victims:
+                self._remove_file(key)
+
+        freed = sum(size for _, size in victims)
+        self._stats['evicted_files'] += len(victims)
+        self._stats['evicted_bytes'] += freed
+        return len(victims), freed
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def reindex(self):
+        """
+        Перестроить индекс по содержимому каталога (файлы, записанные до
+        появления индекса или мимо него)
+
+        Returns:
+            количество файлов в индексе
+        """
+        rows = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith(INDEX_NAME) or name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                stat = os.stat(path)
+                key = os.path.relpath(path, self.root)
+                rows.append((key, stat.st_size, stat.st_mtime, max(stat.st_atime, stat.st_mtime)))
+
+        with self._connect() as conn:
+            conn.execute('DELETE FROM entries')
+            conn.executemany('INSERT INTO entries (key, size, created, accessed) VALUES (?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def report(self):
+        """Сводка по хранилищу: файлов, байт, квота, самые старые обращения"""
+        with self._connect() as conn:
+            files, size, oldest = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(accessed) FROM entries').fetchone()
+        return {
+            'files': files,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'max_age_days': self.max_age / 86400,
+            'oldest_access_age_days': round((time.time() - oldest) / 86400, 2) if oldest else None,
+        }
+
+    def metrics(self):
+        """Попадания и вытеснения в этом процессе"""
+        return dict(self._stats)
+
+
+export_store = ExportStore()
+
+
+@click.group('exports')
+def exports_cli():
+    """Обслуживание каталога экспорта"""
+
+
+@exports_cli.command('report')
+@with_appcontext
+def report_command():
+    """Показать размер каталога экспорта"""
+    store = current_app.extensions['export_store']
+    for key, value in store.report().items():
+        click.echo(f'{key}: {value}')
+
+
+@exports_cli.command('prune')
+@click.option('--max-mb', type=float, default=None, help='Квота, МБ (по умолчанию из конфигурации)')
+@click.option('--max-age-days', type=float, default=None, help='Максимальный возраст файла, дней')
+@with_appcontext
+def prune_command(max_mb, max_age_days):
+    """Удалить старые файлы и файлы сверх квоты"""
+    store = current_app.extensions['export_store']
+    files, freed = store.prune(
+        max_bytes=None if max_mb is None else int(max_mb * 1024 * 1024),
+        max_age=None if max_age_days is None else max_age_days * 86400
+    )
+    click.echo(f'Удалено файлов: {files}, освобождено: {freed / 1024 / 1024:.1f} МБ')
+
+
+@exports_cli.command('reindex')
+@with_appcontext
+def reindex_command():
+    """Перестроить индекс по файлам каталога"""
+    store = current_app.extensions['export_store']
+    click.echo(f'Файлов в индексе: {store.reindex()}')
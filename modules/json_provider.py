@@ -0,0 +1,99 @@
+"""
+JSON-провайдеры Flask: orjson и стандартный json
+
+Ответ с заказом несёт calculated_data всех систем, и стандартный json
+на заказах в десятки систем заметно тормозит. OrjsonProvider собирает
+ответ сразу в bytes через orjson (на порядок быстрее), дату и время
+пишет в ISO 8601 сам. Провайдер выбирается настройкой JSON_PROVIDER
+('orjson' или 'stdlib'); без установленного orjson приложение
+работает на StdlibJSONProvider — ответы те же:
+
+- дата и время — ISO 8601 (а не HTTP-дата, как у Flask по умолчанию);
+- Decimal и UUID — строкой;
+- кириллица не экранируется (JSON_AS_ASCII = False);
+- ключи не сортируются: порядок полей как в to_dict().
+
+Вызовы с аргументами (json.dumps(obj, indent=2) и т.п.) всегда идут
+через стандартный json.
+"""
+
+import dataclasses
+import decimal
+import logging
+import uuid
+from datetime import date, datetime, time
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def _default(obj):
+    """Типы, которых нет в JSON (общие для обоих провайдеров)"""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Стандартный json с теми же соглашениями, что у OrjsonProvider"""
+
+    default = staticmethod(_default)
+    sort_keys = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.ensure_ascii = app.config.get('JSON_AS_ASCII', False)
+
+
+class OrjsonProvider(StdlibJSONProvider):
+    """JSON через orjson; аргументы json.dumps/loads — через стандартный json"""
+
+    def _dumps_bytes(self, obj, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Как у Flask: в режиме отладки ответ с отступами
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self._dumps_bytes(obj, pretty) + b'\n', mimetype=self.mimetype)
+
+
+PROVIDERS = {'orjson': OrjsonProvider, 'stdlib': StdlibJSONProvider}
+
+
+def init_app(app):
+    """Поставить приложению провайдер из JSON_PROVIDER"""
+    name = app.config.get('JSON_PROVIDER', 'orjson')
+    if name not in PROVIDERS:
+        raise ValueError(f'JSON_PROVIDER: допустимо {", ".join(PROVIDERS)}')
+    if name == 'orjson' and orjson is None:
+        logger.warning('orjson не установлен, JSON через стандартный json')
+        name = 'stdlib'
+    app.json = PROVIDERS[name](app)
+    return app.json
@@ -0,0 +1,253 @@
+"""
+Метрики запросов: время по endpoint, SQL, этапы (калькулятор, PDF, Битрикс24)
+
+Каждый запрос попадает в гистограмму http_request_duration_seconds и
+счётчик http_requests_total; SQL-запросы считаются через события
+SQLAlchemy (before/after_cursor_execute), этапы — через timed(stage).
+Итоги запроса уходят в браузер заголовком Server-Timing:
+
+    Server-Timing: db;dur=3.2;desc="SQL x4", calc;dur=12.0, app;dur=20.5
+
+Воркер копит приращения в памяти и раз в METRICS_FLUSH_INTERVAL секунд
+прибавляет их к общим значениям в SQLite-файле METRICS_PATH, поэтому
+GET /metrics (формат Prometheus) отдаёт сумму по всем воркерам gunicorn,
+и счётчики не сбрасываются при перезапуске воркера (--max-requests).
+Без файла (тесты, скрипты) метрики только свои у процесса.
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Границы корзин гистограмм, сек
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Имя метрики -> (тип, описание)
+METRICS = {
+    'http_requests_total': ('counter', 'Запросы по endpoint, методу и коду ответа'),
+    'http_request_duration_seconds': ('histogram', 'Время обработки запроса'),
+    'db_statements_total': ('counter', 'SQL-запросы по endpoint'),
+    'db_statement_seconds_total': ('counter', 'Время SQL-запросов по endpoint'),
+    'db_slow_statements_total': ('counter', 'SQL дольше QUERY_SLOW_MS по endpoint (query_audit)'),
+    'db_repeated_statements_total': ('counter', 'Повторяющиеся в одном запросе SQL, N+1 (query_audit)'),
+    'stage_duration_seconds': ('histogram', 'Время этапов: calculator, pdf_render, bitrix'),
+    'calculator_stage_seconds': ('histogram', 'Время этапов калькулятора (профилированные расчёты)'),
+    'calculator_stage_alloc_bytes_total': ('counter', 'Прирост памяти по этапам калькулятора, байт'),
+}
+
+# Этап -> имя в Server-Timing
+TIMING_NAMES = {'calculator': 'calc', 'pdf_render': 'pdf', 'bitrix': 'bitrix'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+)
+"""
+
+
+def _endpoint():
+    if not has_request_context():
+        return 'background'
+    return request.endpoint or 'unmatched'
+
+
+class RequestMetrics:
+    """Метрики процесса с периодическим сбросом в общий файл"""
+
+    def __init__(self, app=None):
+        self.path = None
+        self.flush_interval = 5.0
+        self._lock = threading.Lock()
+        self._values = {}
+        self._last_flush = time.monotonic()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config.get('METRICS_PATH')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5.0)
+        with self._lock:
+            self._values = {}
+        if self.path:
+            self.init_storage()
+            atexit.register(self.flush)
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        app.extensions['request_metrics'] = self
+
+    def init_storage(self):
+        """Создать общий для воркеров файл метрик"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---------- Запись ----------
+
+    def inc(self, name, labels, value=1.0):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def observe(self, name, labels, seconds):
+        """Значение в гистограмму name (корзины _bucket, _sum, _count)"""
+        items = tuple(sorted(labels.items()))
+        # Пустые корзины тоже пишутся: в выводе у гистограммы всегда полный набор границ
+        updates = [((f'{name}_bucket', items + (('le', str(bound)),)), 1 if seconds <= bound else 0)
+                   for bound in BUCKETS]
+        updates += [((f'{name}_bucket', items + (('le', '+Inf'),)), 1),
+                    ((f'{name}_sum', items), seconds),
+                    ((f'{name}_count', items), 1)]
+        with self._lock:
+            for key, value in updates:
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    @contextmanager
+    def timed(self, stage):
+        """Замерить этап: гистограмма stage_duration_seconds и Server-Timing запроса"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe('stage_duration_seconds', {'stage': stage}, seconds)
+            if has_request_context() and 'metrics_stages' in g:
+                g.metrics_stages[stage] = g.metrics_stages.get(stage, 0.0) + seconds
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_stages = {}
+        g.metrics_sql = [0, 0.0]
+
+    def _finish_request(self, response):
+        if 'metrics_started' not in g:
+            return response
+        seconds = time.perf_counter() - g.metrics_started
+        endpoint = _endpoint()
+        self.observe('http_request_duration_seconds', {'endpoint': endpoint, 'method': request.method}, seconds)
+        self.inc('http_requests_total', {'endpoint': endpoint, 'method': request.method,
+                                         'status': str(response.status_code)})
+
+        count, sql_seconds = g.metrics_sql
+        timings = [f'db;dur={sql_seconds * 1000:.1f};desc="SQL x{count}"']
+        timings += [f'{TIMING_NAMES.get(stage, stage)};dur={value * 1000:.1f}'
+                    for stage, value in g.metrics_stages.items()]
+        timings.append(f'app;dur={seconds * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        if self.path and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return response
+
+    # ---------- Общий файл ----------
+
+    def flush(self):
+        """Прибавить накопленные приращения к общим значениям в METRICS_PATH"""
+        if not self.path:
+            return
+        with self._lock:
+            values, self._values = self._values, {}
+            self._last_flush = time.monotonic()
+        if not values:
+            return
+        rows = [(name, json.dumps(labels), value) for (name, labels), value in values.items()]
+        try:
+            conn = sqlite3.connect(self.path, timeout=10)
+            try:
+                conn.executemany(
+                    'INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) '
+                    'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                    rows
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # Файл занят — приращения остаются до следующего сброса
+            with self._lock:
+                for key, value in values.items():
+                    self._values[key] = self._values.get(key, 0.0) + value
+
+    def collect(self):
+        """Все значения: dict (имя, метки) -> значение (по всем воркерам, если есть файл)"""
+        if not self.path:
+            with self._lock:
+                return dict(self._values)
+        self.flush()
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            rows = conn.execute('SELECT name, labels, value FROM samples').fetchall()
+        finally:
+            conn.close()
+        return {(name, tuple(tuple(pair) for pair in json.loads(labels))): value for name, labels, value in rows}
+
+    def render(self):
+        """Текст в формате Prometheus exposition"""
+        def base_name(name):
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                    return name[:-len(suffix)]
+            return name
+
+        def sort_key(item):
+            (name, labels), _ = item
+            plain = tuple(pair for pair in labels if pair[0] != 'le')
+            le = dict(labels).get('le')
+            return (base_name(name), plain, name, float(le) if le else 0.0)
+
+        lines = []
+        current = None
+        for (name, labels), value in sorted(self.collect().items(), key=sort_key):
+            base = base_name(name)
+            if base != current:
+                kind, help_text = METRICS.get(base, ('untyped', ''))
+                lines.append(f'# HELP {base} {help_text}')
+                lines.append(f'# TYPE {base} {kind}')
+                current = base
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f'{name}{{{label_text}}} {value:g}' if labels else f'{name} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_query_started')
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    endpoint = _endpoint()
+    request_metrics.inc('db_statements_total', {'endpoint': endpoint})
+    request_metrics.inc('db_statement_seconds_total', {'endpoint': endpoint}, seconds)
+    if has_request_context() and 'metrics_sql' in g:
+        g.metrics_sql[0] += 1
+        g.metrics_sql[1] += seconds
+
+
+request_metrics = RequestMetrics()
+timed = request_metrics.timed
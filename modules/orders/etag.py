@@ -0,0 +1,57 @@
+# modules/orders/etag.py
+"""
+ETag и условные GET для заказа
+
+Версия ответа заказа — его id, счётчик orders.version (растёт при
+изменении систем, см. models/order.py) и orders.updated_at. Всё это
+читается одним запросом по первичному ключу, без систем, поэтому
+повторный запрос с If-None-Match отвечается 304 без сборки ответа:
+
+    GET /api/orders/5                        -> 200, ETag: "order-5-3-20240501123000123456"
+    GET /api/orders/5  If-None-Match: <ETag> -> 304
+
+ETag общий для всех представлений заказа (?fields=, ?format=,
+/systems): у кэша браузера ключ — полный URL с параметрами.
+Сжатый ответ получает слабый ETag (modules/compression.py) — сравнение
+If-None-Match слабое, поэтому он тоже подходит.
+"""
+
+from flask import current_app, request
+from sqlalchemy import inspect
+from extensions import db
+from models.order import Order
+
+
+def order_etag(order_id):
+    """ETag заказа или None, если заказа нет (один запрос по первичному ключу)"""
+    row = db.session.query(Order.version, Order.updated_at).filter(Order.id == order_id).first()
+    if row is None:
+        return None
+    stamp = row.updated_at.strftime('%Y%m%d%H%M%S%f') if row.updated_at else '0'
+    return f'order-{order_id}-{row.version}-{stamp}'
+
+
+def not_modified(etag):
+    """Ответ 304, если у клиента эта версия (If-None-Match), иначе None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = current_app.response_class(status=304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag):
+    """ETag и требование перепроверять копию при каждом использовании"""
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def ensure_version_column():
+    """
+    Добавить orders.version в БД, созданную до его появления.
+    Вызывается при старте приложения, внутри app_context.
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns('orders')}
+    if 'version' not in columns:
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ALTER TABLE orders ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
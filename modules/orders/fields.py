@@ -0,0 +1,193 @@
+# modules/orders/fields.py
+"""
+Выбор полей в ответах API заказов (?fields=, ?include=, ?format=)
+
+    GET /api/orders?fields=id,customer_name,total_price
+    GET /api/orders/5?fields=id,status,systems.position,systems.price
+    GET /api/orders/5?include=systems.calculated_data&fields=id,systems.position
+    GET /api/orders/5/systems?fields=position,price&format=columnar
+
+fields — ровно эти поля; поля систем — с префиксом systems. (одно
+слово systems — все поля систем). include — поля сверх набора по
+умолчанию или сверх fields, например systems для списка заказов.
+Без параметров ответы прежние: список — заказы без систем, заказ —
+с системами целиком.
+
+Выбранные поля превращаются в список колонок SELECT, поэтому тяжёлые
+колонки (calculated_data систем, notes) без запроса не читаются из
+базы вовсе. Число систем (systems_count) — один GROUP BY на страницу,
+системы — один запрос на все заказы страницы.
+
+format=columnar отдаёт список столбцами: {"position": [1, 2],
+"price": [...]} — на длинных списках систем ответ в разы короче,
+чем список объектов с повторяющимися ключами.
+"""
+
+from extensions import db
+from models.order import Order, OrderSystem
+
+# Поля в порядке Order.to_dict() / OrderSystem.to_dict()
+ORDER_FIELDS = ('id', 'bitrix_deal_id', 'customer_name', 'city', 'ral_color', 'discount_percent',
+                'with_glass', 'with_assembly', 'with_install', 'status', 'total_price', 'notes',
+                'systems_count', 'created_at', 'updated_at')
+SYSTEM_FIELDS = ('position', 'system_type', 'width', 'height', 'panels', 'opening', 'left_edge',
+                 'right_edge', 'handle_type', 'handle_count', 'latch_count', 'glass_thickness',
+                 'seal_type', 'handle_height', 'floor_lock', 'closer', 'painting', 'custom_ral_color',
+                 'calculated_data', 'price')
+
+# Вычисляемые поля (не колонки таблицы)
+_COMPUTED = {'systems_count'}
+
+FORMATS = ('objects', 'columnar')
+
+
+class FieldSelection:
+    """Какие поля заказа и систем отдавать (systems=None — без систем)"""
+
+    def __init__(self, order=ORDER_FIELDS, systems=None, columnar=False):
+        self.order = tuple(order)
+        self.systems = tuple(systems) if systems is not None else None
+        self.columnar = columnar
+
+
+def _split(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def _ordered(names, allowed):
+    """Поля в каноническом порядке, без повторов"""
+    return [name for name in allowed if name in names]
+
+
+def _parse_format(args):
+    fmt = args.get('format', 'objects')
+    if fmt not in FORMATS:
+        raise ValueError(f'format: допустимо {", ".join(FORMATS)}')
+    return fmt == 'columnar'
+
+
+def parse_selection(args, with_systems=False):
+    """
+    Выбор полей заказа из параметров запроса
+
+    Args:
+        args: request.args
+        with_systems: отдавать ли системы, если fields не задан
+
+    Raises:
+        ValueError: неизвестное поле или формат
+    """
+    order, systems, unknown = set(), None, []
+
+    def add(name):
+        nonlocal systems
+        if name == 'systems':
+            systems = set(SYSTEM_FIELDS)
+        elif name.startswith('systems.'):
+            field = name[len('systems.'):]
+            if field not in SYSTEM_FIELDS:
+                unknown.append(name)
+            systems = (systems or set()) | {field}
+        elif name in ORDER_FIELDS:
+            order.add(name)
+        else:
+            unknown.append(name)
+
+    if 'fields' in args:
+        for name in _split(args['fields']):
+            add(name)
+    else:
+        order = set(ORDER_FIELDS)
+        systems = set(SYSTEM_FIELDS) if with_systems else None
+    for name in _split(args.get('include')):
+        add(name)
+
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    return FieldSelection(
+        order=_ordered(order, ORDER_FIELDS),
+        systems=_ordered(systems, SYSTEM_FIELDS) if systems is not None else None,
+        columnar=_parse_format(args)
+    )
+
+
+def parse_system_fields(args):
+    """
+    Выбор полей для списка систем заказа
+
+    Returns:
+        (поля, columnar)
+    """
+    fields = set(_split(args['fields'])) if 'fields' in args else set(SYSTEM_FIELDS)
+    fields |= set(_split(args.get('include')))
+    unknown = sorted(fields - set(SYSTEM_FIELDS))
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    return _ordered(fields, SYSTEM_FIELDS), _parse_format(args)
+
+
+def columnar(items, fields):
+    """Список словарей -> словарь столбцов"""
+    return {field: [item[field] for item in items] for field in fields}
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def load_systems(order_ids, fields):
+    """
+    Системы заказов одним запросом: {order_id: [словари систем по позиции]}
+
+    Читаются только колонки из fields.
+    """
+    columns = [getattr(OrderSystem, field) for field in fields]
+    rows = (db.session.query(OrderSystem.order_id, *columns)
+            .filter(OrderSystem.order_id.in_(order_ids))
+            .order_by(OrderSystem.order_id, OrderSystem.position))
+    systems = {order_id: [] for order_id in order_ids}
+    for row in rows:
+        systems[row[0]].append(dict(zip(fields, row[1:])))
+    return systems
+
+
+def load_orders(query, selection):
+    """
+    Заказы из запроса query (фильтры, сортировка, страница уже заданы)
+    с выбранными полями
+
+    Returns:
+        список словарей заказов (в format=columnar системы каждого заказа — столбцами)
+    """
+    fields = selection.order
+    columns = [field for field in fields if field not in _COMPUTED]
+    # id нужен для систем и их числа, даже если не запрошен
+    rows = query.with_entities(Order.id, *[getattr(Order, field) for field in columns]).all()
+    order_ids = [row[0] for row in rows]
+
+    counts = {}
+    if 'systems_count' in fields and order_ids:
+        counts = dict(
+            db.session.query(OrderSystem.order_id, db.func.count(OrderSystem.id))
+            .filter(OrderSystem.order_id.in_(order_ids))
+            .group_by(OrderSystem.order_id)
+        )
+    systems = load_systems(order_ids, selection.systems) if selection.systems is not None and order_ids else {}
+
+    orders = []
+    for row in rows:
+        values = dict(zip(columns, row[1:]))
+        item = {}
+        for field in fields:
+            if field == 'systems_count':
+                item[field] = counts.get(row[0], 0)
+            elif field in ('created_at', 'updated_at'):
+                item[field] = _isoformat(values[field])
+            else:
+                item[field] = values[field]
+        if selection.systems is not None:
+            order_systems = systems.get(row[0], [])
+            item['systems'] = (columnar(order_systems, selection.systems) if selection.columnar
+                               else order_systems)
+        orders.append(item)
+    return orders
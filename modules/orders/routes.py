@@ -3,20 +3,35 @@
 API эндпоинты для работы с заказами
 """
 
-from flask import Blueprint, request, jsonify
+import hmac
+import random
+from flask import Blueprint, request, jsonify, current_app
 from extensions import db
 from models.order import Order, OrderSystem
 from modules.calculator import calculate_system
+from modules.calculator.profiling import profile_calculation
+from modules.orders.etag import not_modified, order_etag, with_etag
+from modules.orders.fields import columnar, load_orders, load_systems, parse_selection, parse_system_fields
+from modules.metrics import request_metrics, timed
+from modules.pricing.catalog import apply_prices, parse_as_of
 
 orders_bp = Blueprint('orders', __name__)
 
 
 @orders_bp.route('/orders', methods=['GET'])
 def list_orders():
-    """Получить список заказов"""
+    """
+    Получить список заказов
+
+    ?fields=, ?include=, ?format=columnar — выбор полей (см. fields.py)
+    """
     status = request.args.get('status')
     limit = request.args.get('limit', 50, type=int)
     offset = request.args.get('offset', 0, type=int)
+    try:
+        selection = parse_selection(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
 
     query = Order.query
 
@@ -24,11 +39,14 @@ def list_orders():
         query = query.filter(Order.status == status)
 
     total = query.count()
-    orders = query.order_by(Order.created_at.desc()).offset(offset).limit(limit).all()
+    orders = load_orders(query.order_by(Order.created_at.desc()).offset(offset).limit(limit), selection)
+    if selection.columnar:
+        fields = selection.order + (('systems',) if selection.systems is not None else ())
+        orders = columnar(orders, fields)
 
     return jsonify({
         'success': True,
-        'data': [o.to_dict() for o in orders],
+        'data': orders,
         'total': total,
         'limit': limit,
         'offset': offset
@@ -65,16 +83,30 @@ def create_order():
 
 @orders_bp.route('/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
-    """Получить заказ по ID"""
-    order = Order.query.get(order_id)
+    """
+    Получить заказ по ID
 
-    if not order:
+    ?fields=, ?include=, ?format=columnar — выбор полей (см. fields.py);
+    If-None-Match с текущим ETag — ответ 304 (см. etag.py)
+    """
+    try:
+        selection = parse_selection(request.args, with_systems=True)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    etag = order_etag(order_id)
+    if etag is None:
         return jsonify({'success': False, 'error': 'Заказ не найден'}), 404
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
 
-    return jsonify({
+    orders = load_orders(Order.query.filter(Order.id == order_id), selection)
+
+    return with_etag(jsonify({
         'success': True,
-        'data': order.to_dict(include_systems=True)
-    })
+        'data': orders[0]
+    }), etag)
 
 
 @orders_bp.route('/orders/<int:order_id>', methods=['PUT'])
@@ -124,6 +156,34 @@ def delete_order(order_id):
 
 # === Системы в заказе ===
 
+@orders_bp.route('/orders/<int:order_id>/systems', methods=['GET'])
+def list_systems(order_id):
+    """
+    Системы заказа
+
+    ?fields=, ?include=, ?format=columnar — выбор полей (см. fields.py);
+    If-None-Match с текущим ETag — ответ 304 (см. etag.py)
+    """
+    try:
+        fields, as_columns = parse_system_fields(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    etag = order_etag(order_id)
+    if etag is None:
+        return jsonify({'success': False, 'error': 'Заказ не найден'}), 404
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    systems = load_systems([order_id], fields)[order_id]
+    return with_etag(jsonify({
+        'success': True,
+        'data': columnar(systems, fields) if as_columns else systems,
+        'total': len(systems)
+    }), etag)
+
+
 @orders_bp.route('/orders/<int:order_id>/systems', methods=['POST'])
 def add_system(order_id):
     """Добавить систему в заказ"""
@@ -140,9 +200,12 @@ def add_system(order_id):
         if field not in data:
             return jsonify({'success': False, 'error': f'{field} обязателен'}), 400
 
-    # Расчёт комплектующих
+    # Расчёт комплектующих (с профилем этапов — по заголовку X-Calc-Profile или выборке)
+    profile_enabled, profile_memory = _calculation_profile_mode()
     try:
-        calculated = calculate_system(data)
+        with timed('calculator'), profile_calculation(profile_enabled, profile_memory) as profile:
+            calculated = calculate_system(data)
+        apply_prices(calculated, data['system_type'])
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
@@ -179,10 +242,36 @@ def add_system(order_id):
     order.recalculate_total()
     db.session.commit()
 
-    return jsonify({
+    response = {
         'success': True,
         'data': system.to_dict()
-    }), 201
+    }
+    if profile is not None:
+        _record_profile(data['system_type'], profile)
+        response['profile'] = profile.report()
+    return jsonify(response), 201
+
+
+def _calculation_profile_mode():
+    """(профилировать ли расчёт, считать ли память) для текущего запроса"""
+    header = request.headers.get('X-Calc-Profile')
+    token = current_app.config.get('CALC_PROFILE_TOKEN')
+    if header and current_app.config.get('CALC_PROFILE_HEADER', True) and (
+            not token or hmac.compare_digest(header.encode('utf-8'), token.encode('utf-8'))):
+        return True, True
+    sample = current_app.config.get('CALC_PROFILE_SAMPLE', 0)
+    if sample and random.random() < sample:
+        return True, current_app.config.get('CALC_PROFILE_SAMPLE_MEMORY', False)
+    return False, False
+
+
+def _record_profile(system_type, profile):
+    """Этапы расчёта в /metrics"""
+    for entry in profile.stages:
+        labels = {'system': system_type, 'stage': entry['stage']}
+        request_metrics.observe('calculator_stage_seconds', labels, entry['seconds'])
+        if 'alloc_bytes' in entry:
+            request_metrics.inc('calculator_stage_alloc_bytes_total', labels, max(entry['alloc_bytes'], 0))
 
 
 @orders_bp.route('/orders/<int:order_id>/systems/<int:position>', methods=['DELETE'])
@@ -202,3 +291,34 @@ def delete_system(order_id, position):
         'success': True,
         'message': f'Система на позиции {position} удалена'
     })
+
+
+@orders_bp.route('/orders/<int:order_id>/reprice', methods=['POST'])
+def reprice_order(order_id):
+    """Переоценить системы заказа по ценам на дату (по умолчанию — дату создания заказа)"""
+    order = Order.query.get(order_id)
+
+    if not order:
+        return jsonify({'success': False, 'error': 'Заказ не найден'}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        as_of = parse_as_of(data['as_of']) if data.get('as_of') else order.created_at
+    except ValueError:
+        return jsonify({'success': False, 'error': 'as_of должен быть в формате ISO 8601'}), 400
+
+    for system in order.systems:
+        calculated = dict(system.calculated_data or {})
+        calculated['summary'] = dict(calculated.get('summary') or {})
+        apply_prices(calculated, system.system_type, as_of=as_of)
+        system.calculated_data = calculated
+        system.price = calculated['summary']['total_price']
+
+    order.recalculate_total()
+    db.session.commit()
+
+    return jsonify({
+        'success': True,
+        'as_of': as_of.isoformat(),
+        'data': order.to_dict(include_systems=True)
+    })
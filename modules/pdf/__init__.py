@@ -1,4 +1,4 @@
 # modules/pdf/__init__.py
 """
-Модуль генерации PDF документов
+Модуль генерации документов заказа (PDF, XLSX)
 """
@@ -0,0 +1,106 @@
+"""
+Массовая выгрузка PDF по заказам в ZIP-архив
+
+Архив отдаётся потоком: записи добавляются по мере готовности PDF,
+поэтому клиент начинает получать данные сразу. Одновременно в работе
+не больше window документов, заказы читаются пачками — память не зависит
+от количества заказов. Неизменившиеся заказы берутся из кэша экспорта.
+"""
+
+import io
+import time
+import zipfile
+from concurrent.futures import wait, FIRST_COMPLETED
+from .service import pdf_renderer, iter_order_snapshots, download_name, RenderQueueFull
+
+
+class _ZipStream(io.RawIOBase):
+    """Поток без seek для zipfile: накапливает записанное до следующей выдачи"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_pdf_zip(query, kinds, window=4):
+    """
+    Сгенерировать ZIP с PDF для заказов из запроса
+
+    Args:
+        query: запрос Order с фильтрами
+        kinds: ['kp', 'spec']
+        window: сколько документов одновременно в рендеринге
+
+    Yields:
+        куски ZIP-архива (bytes)
+    """
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED)
+    pending = {}  # future -> (kind, snapshot)
+    failed = []
+
+    def add_entry(kind, snapshot, data):
+        archive.writestr(download_name(kind, snapshot.id), data)
+
+    def collect(block):
+        """Записать в архив завершённые рендеринги"""
+        if block and pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        else:
+            done = [f for f in pending if f.done()]
+        for future in done:
+            kind, snapshot = pending.pop(future)
+            try:
+                data = future.result()[0]
+            except Exception as e:
+                failed.append(f'{download_name(kind, snapshot.id)}: {e}')
+                continue
+            pdf_renderer.write_cached(kind, snapshot, data)
+            add_entry(kind, snapshot, data)
+
+    for snapshot in iter_order_snapshots(query):
+        for kind in kinds:
+            cached = pdf_renderer.read_cached(kind, snapshot)
+            if cached is not None:
+                add_entry(kind, snapshot, cached)
+                yield stream.pop()
+                continue
+
+            while len(pending) >= window:
+                collect(block=True)
+                yield stream.pop()
+
+            while True:
+                try:
+                    pending[pdf_renderer.submit_snapshot(kind, snapshot)] = (kind, snapshot)
+                    break
+                except RenderQueueFull:
+                    # Очередь занята обычными запросами — ждём свои задачи или паузу
+                    if pending:
+                        collect(block=True)
+                        yield stream.pop()
+                    else:
+                        time.sleep(0.2)
+
+            collect(block=False)
+            yield stream.pop()
+
+    while pending:
+        collect(block=True)
+        yield stream.pop()
+
+    if failed:
+        archive.writestr('errors.txt', '\n'.join(failed))
+    archive.close()
+    yield stream.pop()
@@ -1,59 +1,204 @@
-# modules/pdf/routes.py
-from flask import Blueprint, send_file, jsonify, current_app
-from models import Order
-from .specification import generate_specification_pdf
-from .commercial import generate_commercial_pdf
-import os
+import tempfile
+from datetime import datetime, timedelta
+from io import BytesIO
+from flask import Blueprint, Response, send_file, jsonify, request, current_app, stream_with_context
+from extensions import db
+from models import Order, PdfRenderJob
+from modules.export_store import export_store
+from modules.singleflight import coalescer, SingleFlightTimeout
+from .bulk import stream_pdf_zip
+from .service import (pdf_renderer, iter_order_snapshots, download_name,
+                      RENDERERS, RenderQueueFull, RenderTimeout)
+from .xlsx import write_specification_xlsx
 
 pdf_bp = Blueprint('pdf', __name__)
 
-@pdf_bp.route('/orders/<int:order_id>/pdf/spec', methods=['GET'])
-def download_specification(order_id):
-    """Скачать разблюдовку (спецификацию комплектующих) для заказа"""
+
+def _render_response(order_id, kind):
+    """
+    Сгенерировать PDF и отдать файл, если он готов до дедлайна.
+
+    ?wait=<сек> — сколько ждать (по умолчанию PDF_RENDER_DEADLINE),
+    ?async=1 — не ждать, сразу вернуть id задачи.
+    Одновременные запросы одного и того же документа для одного состояния
+    заказа ждут одну общую генерацию.
+    """
     order = Order.query.get(order_id)
     if not order:
         return jsonify({'success': False, 'error': 'Заказ не найден'}), 404
 
-    # Путь для сохранения PDF
-    output_dir = current_app.config.get('PDF_EXPORTS_DIR', 'data/exports')
-    os.makedirs(output_dir, exist_ok=True)
-    
-    output_path = os.path.join(output_dir, f'Spec_{order_id}.pdf')
+    wait = request.args.get('wait', current_app.config.get('PDF_RENDER_DEADLINE', 30), type=float)
 
     try:
-        generate_specification_pdf(order, output_path)
+        if request.args.get('async', '').lower() in ('1', 'true'):
+            job, _ = pdf_renderer.submit(order, kind, persist=True)
+            return _job_accepted(job.to_dict())
+
+        pdf_bytes = coalescer.do(
+            ('pdf', kind, order_id, order.state_hash()),
+            lambda: pdf_renderer.render_cached(order, kind, timeout=wait),
+            timeout=wait
+        )
+    except RenderTimeout as e:
+        return _job_accepted(e.job)
+    except (RenderQueueFull, SingleFlightTimeout) as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({'success': False, 'error': f'Ошибка генерации PDF: {str(e)}'}), 500
 
     return send_file(
-        output_path,
+        BytesIO(pdf_bytes),
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=f'Разблюдовка_{order_id}.pdf'
+        download_name=download_name(kind, order_id)
     )
 
 
+def _job_accepted(job):
+    """Ответ 202: PDF будет готов позже"""
+    return jsonify({
+        'success': True,
+        'data': job,
+        'status_url': f'/api/pdf/jobs/{job["id"]}'
+    }), 202
+
+
+@pdf_bp.route('/orders/<int:order_id>/pdf/spec', methods=['GET'])
+def download_specification(order_id):
+    """Скачать разблюдовку (спецификацию комплектующих) для заказа"""
+    return _render_response(order_id, 'spec')
+
+
 @pdf_bp.route('/orders/<int:order_id>/pdf/kp', methods=['GET'])
 def download_commercial(order_id):
     """Скачать коммерческое предложение для заказа"""
-    order = Order.query.get(order_id)
-    if not order:
-        return jsonify({'success': False, 'error': 'Заказ не найден'}), 404
+    return _render_response(order_id, 'kp')
 
-    # Путь для сохранения PDF
-    output_dir = current_app.config.get('PDF_EXPORTS_DIR', 'data/exports')
-    os.makedirs(output_dir, exist_ok=True)
 
-    output_path = os.path.join(output_dir, f'KP_{order_id}.pdf')
+@pdf_bp.route('/pdf/jobs/<job_id>', methods=['GET'])
+def render_job_status(job_id):
+    """Статус задачи генерации PDF"""
+    job = db.session.get(PdfRenderJob, job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
 
-    try:
-        generate_commercial_pdf(order, output_path)
-    except Exception as e:
-        return jsonify({'success': False, 'error': f'Ошибка генерации PDF: {str(e)}'}), 500
+    data = job.to_dict()
+    if job.status == 'done' and job.file_key:
+        data['file_url'] = f'/api/pdf/jobs/{job.id}/file'
+    return jsonify({'success': True, 'data': data})
+
+
+@pdf_bp.route('/pdf/jobs/<job_id>/file', methods=['GET'])
+def render_job_file(job_id):
+    """Скачать результат задачи генерации PDF"""
+    job = db.session.get(PdfRenderJob, job_id)
+    if not job or job.status != 'done' or not job.file_key:
+        return jsonify({'success': False, 'error': 'PDF ещё не готов'}), 404
+
+    path = export_store.open_path(job.file_key)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Файл удалён из хранилища, сформируйте PDF заново'}), 410
 
     return send_file(
-        output_path,
+        path,
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=f'КП_{order_id}.pdf'
+        download_name=download_name(job.kind, job.order_id)
+    )
+
+
+def _export_query(data):
+    """
+    Запрос заказов для массовой выгрузки по фильтру из JSON
+    (ids, status, date_from, date_to)
+
+    Returns:
+        (query, None) или (None, ответ с ошибкой)
+    """
+    query = Order.query
+    if data.get('ids'):
+        query = query.filter(Order.id.in_(data['ids']))
+    if data.get('status'):
+        query = query.filter(Order.status == data['status'])
+    try:
+        if data.get('date_from'):
+            query = query.filter(Order.created_at >= datetime.strptime(data['date_from'], '%Y-%m-%d'))
+        if data.get('date_to'):
+            query = query.filter(
+                Order.created_at < datetime.strptime(data['date_to'], '%Y-%m-%d') + timedelta(days=1))
+    except (TypeError, ValueError):
+        return None, (jsonify({'success': False, 'error': 'Дата в формате YYYY-MM-DD'}), 400)
+
+    if not query.with_entities(Order.id).first():
+        return None, (jsonify({'success': False, 'error': 'Заказы не найдены'}), 404)
+    return query.order_by(Order.id), None
+
+
+def _xlsx_response(query, filename):
+    """Разблюдовка заказов из запроса одним XLSX (через временный файл)"""
+    output = tempfile.TemporaryFile()
+    write_specification_xlsx(iter_order_snapshots(query), output)
+    output.seek(0)
+    return send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=filename
     )
+
+
+@pdf_bp.route('/orders/<int:order_id>/xlsx/spec', methods=['GET'])
+def download_specification_xlsx(order_id):
+    """Скачать разблюдовку заказа в XLSX"""
+    query = Order.query.filter(Order.id == order_id)
+    if not query.with_entities(Order.id).first():
+        return jsonify({'success': False, 'error': 'Заказ не найден'}), 404
+    return _xlsx_response(query, f'Разблюдовка_{order_id}.xlsx')
+
+
+@pdf_bp.route('/exports/xlsx', methods=['POST'])
+def bulk_export_xlsx():
+    """
+    Разблюдовка нескольких заказов одним XLSX с общим листом «Итого»
+
+    JSON: ids, status, date_from, date_to — как в /exports/pdf
+    """
+    query, error = _export_query(request.get_json(silent=True) or {})
+    if error:
+        return error
+    return _xlsx_response(query, f'Разблюдовка_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
+
+
+@pdf_bp.route('/exports/pdf', methods=['POST'])
+def bulk_export_pdf():
+    """
+    Массовая выгрузка PDF по заказам одним ZIP-архивом (потоком)
+
+    JSON:
+        ids: список id заказов
+        status: статус заказа
+        date_from, date_to: диапазон даты создания (YYYY-MM-DD)
+        kinds: какие документы ('kp', 'spec'), по умолчанию оба
+    """
+    data = request.get_json(silent=True) or {}
+    kinds = data.get('kinds') or list(RENDERERS)
+    if any(kind not in RENDERERS for kind in kinds):
+        return jsonify({'success': False, 'error': f'kinds: допустимо {", ".join(RENDERERS)}'}), 400
+
+    query, error = _export_query(data)
+    if error:
+        return error
+
+    window = current_app.config.get('PDF_EXPORT_WINDOW', 4)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return Response(
+        stream_with_context(stream_pdf_zip(query, kinds, window=window)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=orders_{stamp}.zip'}
+    )
+
+
+@pdf_bp.route('/pdf/metrics', methods=['GET'])
+def render_metrics():
+    """Метрики генерации PDF в этом воркере"""
+    return jsonify({'success': True, 'data': pdf_renderer.metrics()})
@@ -0,0 +1,400 @@
+"""
+Сервис фоновой генерации PDF
+
+ReportLab-рендеринг выполняется в пуле процессов, а не в потоке запроса.
+Запрос ставит задачу в очередь и либо ждёт результат до дедлайна, либо
+сразу получает id задачи (GET /api/pdf/jobs/<id>). PDF рендерится в память
+и отдаётся из буфера; в каталог экспорта (modules.export_store) пишутся
+результаты задач, которые скачают позже, и кэш документов по состоянию
+заказа. Размер пула и длина очереди ограничены,
+чтобы генерация PDF не вытесняла обычные API-запросы.
+"""
+
+import importlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, datetime
+from types import SimpleNamespace
+from sqlalchemy import inspect
+from extensions import db
+from models.export import PdfRenderJob
+from models.order import Order, OrderSystem, order_state_hash
+from modules.export_store import export_store
+from modules.metrics import timed
+
+# kind -> (модуль и функция генератора, префикс файла в каталоге экспорта, имя для скачивания).
+# Генераторы (и ReportLab) импортируются при первом рендеринге, а не при старте воркера
+RENDERERS = {
+    'kp': ('modules.pdf.commercial:generate_commercial_pdf', 'KP', 'КП'),
+    'spec': ('modules.pdf.specification:generate_specification_pdf', 'Spec', 'Разблюдовка'),
+}
+
+
+def get_generator(kind):
+    """Функция генерации PDF для kind"""
+    module_name, func_name = RENDERERS[kind][0].split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def warm_up():
+    """Инициализатор процесса пула: ReportLab, шрифты и стили до первого заказа"""
+    from .theme import warm_up as build_theme
+    build_theme()
+
+
+class RenderQueueFull(Exception):
+    """Очередь генерации переполнена"""
+
+
+class RenderTimeout(Exception):
+    """PDF не готов к дедлайну; результат будет сохранён в задаче job"""
+
+    def __init__(self, job):
+        super().__init__(f'PDF не готов, задача {job["id"]}')
+        self.job = job
+
+
+def snapshot_order(order, systems=None, document_date=None):
+    """
+    Снимок заказа без привязки к сессии SQLAlchemy (передаётся в другой процесс)
+
+    Генераторы читают те же атрибуты, что и у модели: order.systems — список.
+
+    Args:
+        systems: уже загруженные системы заказа (иначе — запрос order.systems)
+        document_date: дата в документах (по умолчанию сегодня)
+    """
+    if systems is None:
+        systems = order.systems
+    systems = [
+        SimpleNamespace(**{c.key: getattr(s, c.key) for c in OrderSystem.__table__.columns})
+        for s in systems
+    ]
+    data = {c.key: getattr(order, c.key) for c in Order.__table__.columns}
+    snapshot = SimpleNamespace(systems=systems, **data)
+    snapshot.state_hash = order_state_hash(snapshot, systems)
+    snapshot.document_date = document_date or date.today()
+    return snapshot
+
+
+def iter_order_snapshots(query, chunk_size=50):
+    """
+    Снимки заказов из запроса пачками: два запроса на пачку
+    (заказы и все их системы) вместо запроса систем на каждый заказ
+
+    Yields:
+        снимок заказа (см. snapshot_order)
+    """
+    ids = [order_id for (order_id,) in query.with_entities(Order.id).all()]
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        orders = {o.id: o for o in Order.query.filter(Order.id.in_(chunk)).all()}
+        systems = {}
+        for system in (OrderSystem.query
+                       .filter(OrderSystem.order_id.in_(chunk))
+                       .order_by(OrderSystem.order_id, OrderSystem.position)):
+            systems.setdefault(system.order_id, []).append(system)
+        for order_id in chunk:
+            if order_id in orders:
+                yield snapshot_order(orders[order_id], systems.get(order_id, []))
+        # Пачка обработана — освобождаем объекты сессии
+        db.session.expunge_all()
+
+
+def export_filename(kind, order_id):
+    """Имя файла заказа в каталоге экспорта"""
+    return f'{RENDERERS[kind][1]}_{order_id}.pdf'
+
+
+def job_filename(kind, order_id, job_id):
+    """
+    Ключ результата задачи в каталоге экспорта
+
+    У каждой задачи свой файл: задачи по одному заказу (в разных его
+    состояниях) не перезаписывают результаты друг друга.
+    """
+    return f'jobs/{RENDERERS[kind][1]}_{order_id}_{job_id}.pdf'
+
+
+def ensure_job_file_key_column():
+    """
+    Добавить pdf_render_jobs.file_key в БД, созданную до его появления.
+    Вызывается при старте приложения, внутри app_context.
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns('pdf_render_jobs')}
+    if 'file_key' not in columns:
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ALTER TABLE pdf_render_jobs ADD COLUMN file_key VARCHAR(200)')
+
+
+def download_name(kind, order_id):
+    """Имя файла для пользователя"""
+    return f'{RENDERERS[kind][2]}_{order_id}.pdf'
+
+
+def _render_worker(kind, snapshot):
+    """
+    Выполняется в процессе пула: отрисовать PDF в память
+
+    Returns:
+        (bytes PDF, секунды рендеринга)
+    """
+    generator = get_generator(kind)
+    started = time.perf_counter()
+    data = generator(snapshot).getvalue()
+    return data, time.perf_counter() - started
+
+
+class PdfRenderService:
+    """Пул процессов генерации PDF с ограничением очереди и метриками"""
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._app = None
+        self._workers = 1
+        self._queue_limit = 8
+        self._pending = 0
+        # Задачи в работе: job_id -> сохранить ли результат в каталог экспорта
+        self._persist = {}
+        self._stats = {
+            'rendered_total': 0,
+            'failed_total': 0,
+            'rejected_total': 0,
+            'render_seconds_sum': 0.0,
+            'render_seconds_max': 0.0,
+            'last_render_seconds': 0.0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self._workers = app.config.get('PDF_RENDER_WORKERS', 1)
+        self._queue_limit = app.config.get('PDF_RENDER_QUEUE_LIMIT', 8)
+        app.extensions['pdf_renderer'] = self
+
+    def _get_executor(self):
+        """Пул создаётся лениво и заново после fork (у каждого воркера gunicorn свой)"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            # Шрифты и стили собираются при старте процесса, а не в первом запросе
+            self._executor = ProcessPoolExecutor(max_workers=self._workers, initializer=warm_up)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def submit(self, order, kind, persist=False, document_date=None):
+        """
+        Поставить генерацию PDF в очередь
+
+        Args:
+            persist: сохранить результат в каталог экспорта (для скачивания позже)
+            document_date: дата в документе (по умолчанию сегодня)
+
+        Returns:
+            (PdfRenderJob, Future[(bytes, seconds)])
+
+        Raises:
+            RenderQueueFull: в очереди уже PDF_RENDER_QUEUE_LIMIT задач
+        """
+        self._reserve()
+        try:
+            job = PdfRenderJob(id=uuid.uuid4().hex, order_id=order.id, kind=kind)
+            db.session.add(job)
+            db.session.commit()
+            snapshot = snapshot_order(order, document_date=document_date)
+        except Exception:
+            self._release()
+            raise
+
+        future = self._dispatch(kind, snapshot, job.id, persist)
+        return job, future
+
+    def submit_snapshot(self, kind, snapshot):
+        """
+        Поставить в очередь рендеринг готового снимка, без записи задачи в БД
+        (массовый экспорт)
+
+        Returns:
+            Future[(bytes, seconds)]
+
+        Raises:
+            RenderQueueFull: в очереди уже PDF_RENDER_QUEUE_LIMIT задач
+        """
+        self._reserve()
+        return self._dispatch(kind, snapshot, None)
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self._queue_limit:
+                self._stats['rejected_total'] += 1
+                raise RenderQueueFull('Очередь генерации PDF переполнена, повторите позже')
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _dispatch(self, kind, snapshot, job_id, persist=False):
+        """
+        Отправить снимок на рендеринг; слот очереди освобождает _finish,
+        когда future завершится (в том числе ошибкой постановки в пул)
+        """
+        if job_id is not None:
+            with self._lock:
+                self._persist[job_id] = persist
+        if self._workers <= 0:
+            # Без пула: рендеринг прямо в запросе (тесты, отладка)
+            future = Future()
+            try:
+                future.set_result(_render_worker(kind, snapshot))
+            except Exception as e:
+                future.set_exception(e)
+            self._finish(job_id, future)
+        else:
+            try:
+                future = self._get_executor().submit(_render_worker, kind, snapshot)
+            except Exception as e:
+                # Пул сломан (BrokenProcessPool: процесс убит OOM) — следующий вызов создаст новый
+                self._executor = None
+                future = Future()
+                future.set_exception(e)
+                self._finish(job_id, future)
+                return future
+            future.add_done_callback(lambda f: self._finish(job_id, f))
+        return future
+
+    def persist(self, job, future):
+        """
+        Сохранить результат задачи в каталог экспорта, когда он будет готов
+
+        Задача в работе получит файл в _finish до статуса done, поэтому
+        по done всегда есть что скачать. Для уже завершённой задачи
+        запись выполняется сразу.
+        """
+        with self._lock:
+            if job.id in self._persist:
+                self._persist[job.id] = True
+                return
+        self._store(job.id, future)
+
+    def render(self, order, kind, timeout=None, document_date=None):
+        """
+        Сгенерировать PDF через пул и дождаться результата
+
+        Returns:
+            bytes PDF
+
+        Raises:
+            RenderTimeout: не успели за timeout; результат будет сохранён
+                в каталог экспорта и доступен по id задачи
+        """
+        job, future = self.submit(order, kind, document_date=document_date)
+        try:
+            with timed('pdf_render'):
+                return future.result(timeout=timeout)[0]
+        except FutureTimeoutError:
+            self.persist(job, future)
+            raise RenderTimeout(job.to_dict())
+
+    def _store(self, job_id, future):
+        """Записать результат завершённой задачи в каталог экспорта"""
+        if future.exception() is not None:
+            return
+        with self._app.app_context():
+            job = db.session.get(PdfRenderJob, job_id)
+            if job is not None:
+                self._write_file(job, future.result()[0])
+                db.session.commit()
+
+    @staticmethod
+    def _write_file(job, data):
+        key = job_filename(job.kind, job.order_id, job.id)
+        job.file_path = export_store.put(key, data)
+        job.file_key = key
+
+    def _finish(self, job_id, future):
+        """Учесть результат в метриках и в задаче (с файлом, если его нужно сохранить)"""
+        error = future.exception()
+        with self._lock:
+            self._pending -= 1
+            persist = self._persist.pop(job_id, False)
+            if error is None:
+                seconds = future.result()[1]
+                self._stats['rendered_total'] += 1
+                self._stats['render_seconds_sum'] += seconds
+                self._stats['render_seconds_max'] = max(self._stats['render_seconds_max'], seconds)
+                self._stats['last_render_seconds'] = seconds
+            else:
+                self._stats['failed_total'] += 1
+
+        if job_id is None:
+            return
+        with self._app.app_context():
+            job = db.session.get(PdfRenderJob, job_id)
+            if job is None:
+                return
+            job.finished_at = datetime.utcnow()
+            if error is None and persist:
+                try:
+                    self._write_file(job, future.result()[0])
+                except Exception as e:
+                    error = e
+            if error is None:
+                job.status = 'done'
+                job.render_ms = int(future.result()[1] * 1000)
+            else:
+                job.status = 'failed'
+                job.error = str(error)
+            db.session.commit()
+
+    @staticmethod
+    def cache_key(kind, order_id, state_hash, document_date):
+        """
+        Ключ PDF в кэше экспорта для данного состояния заказа
+
+        В документах стоит дата оформления, поэтому PDF неизменившегося
+        заказа годен только в день рендеринга.
+        """
+        return f'cache/{RENDERERS[kind][1]}_{order_id}_{state_hash[:16]}_{document_date:%Y%m%d}.pdf'
+
+    def read_cached(self, kind, snapshot):
+        """PDF из кэша экспорта (bytes) или None, если заказ с тех пор менялся"""
+        return export_store.get(self.cache_key(kind, snapshot.id, snapshot.state_hash, snapshot.document_date))
+
+    def write_cached(self, kind, snapshot, data):
+        """Сохранить PDF в кэш экспорта"""
+        export_store.put(self.cache_key(kind, snapshot.id, snapshot.state_hash, snapshot.document_date), data)
+
+    def render_cached(self, order, kind, timeout=None):
+        """
+        PDF для текущего состояния заказа: из кэша экспорта или новый рендеринг
+
+        Returns:
+            bytes PDF
+
+        Raises:
+            RenderTimeout: см. render
+        """
+        today = date.today()
+        key = self.cache_key(kind, order.id, order.state_hash(), today)
+        data = export_store.get(key)
+        if data is None:
+            data = self.render(order, kind, timeout=timeout, document_date=today)
+            export_store.put(key, data)
+        return data
+
+    def metrics(self):
+        """Метрики процесса: глубина очереди и время рендеринга"""
+        with self._lock:
+            data = dict(self._stats)
+            data['queue_depth'] = self._pending
+        data['workers'] = self._workers
+        data['queue_limit'] = self._queue_limit
+        return data
+
+
+pdf_renderer = PdfRenderService()
@@ -5,20 +5,35 @@
 """
 
 from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
 from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from datetime import datetime
-from .fonts import register_fonts
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from datetime import date
+from io import BytesIO
+from modules.calculator.bom import iter_bom
+from .theme import get_theme
 
 
-def generate_specification_pdf(order, output_path):
-    """Генерация разблюдовки в формате оригинала"""
+def generate_specification_pdf(order, output=None):
+    """
+    Генерация разблюдовки в формате оригинала
+
+    Args:
+        order: заказ (модель или снимок из service.snapshot_order)
+        output: путь к файлу или бинарный файловый объект;
+            None — PDF рендерится в память
+
+    Returns:
+        output (путь/файловый объект) или BytesIO с PDF, перемотанный в начало
+    """
+
+    if output is None:
+        buffer = BytesIO()
+        generate_specification_pdf(order, buffer)
+        buffer.seek(0)
+        return buffer
 
     doc = SimpleDocTemplate(
-        output_path,
+        output,
         pagesize=A4,
         topMargin=12*mm,
         bottomMargin=12*mm,
@@ -27,31 +42,20 @@ def generate_specification_pdf(order, output_path):
     )
 
     elements = []
-    styles = getSampleStyleSheet()
-    font_name, font_bold = register_fonts()
-
-    # Цветовая схема (как в оригинале)
-    color_profiles = colors.HexColor('#cce5ff')      # Голубой для профилей
-    color_hardware = colors.HexColor('#ccffcc')      # Зеленый для фурнитуры
-    color_seals = colors.HexColor('#ffffcc')         # Желтый для уплотнителей
-    color_header = colors.HexColor('#e0e0e0')        # Серый для заголовков
+    theme = get_theme()
 
     # ========== ЗАГОЛОВОК ==========
-    title_style = ParagraphStyle(
-        'Title',
-        fontSize=16,
-        fontName=font_bold,
-        alignment=TA_CENTER,
-        spaceAfter=8
-    )
+    title_style = theme.spec_title
     elements.append(Paragraph(f"ЗАКАЗ № {str(order.id).zfill(3)}", title_style))
     elements.append(Spacer(1, 5*mm))
 
     # ========== ИНФОРМАЦИЯ О ЗАКАЗЕ ==========
-    info_style = ParagraphStyle('Info', fontSize=9, fontName=font_name, leading=12)
+    info_style = theme.spec_info
 
     elements.append(Paragraph(f"Цвет RAL: {order.ral_color or 'RAL 9016'}", info_style))
-    elements.append(Paragraph(f"Дата запуска: {datetime.now().strftime('%d.%m.%Y')}", info_style))
+    # Дата из снимка заказа (входит в ключ кэша PDF), иначе сегодняшняя
+    started = getattr(order, 'document_date', None) or date.today()
+    elements.append(Paragraph(f"Дата запуска: {started.strftime('%d.%m.%Y')}", info_style))
     elements.append(Paragraph(f"Город: {order.city or '—'}", info_style))
     elements.append(Paragraph(f"Заказчик: {order.customer_name}", info_style))
     elements.append(Spacer(1, 8*mm))
@@ -66,16 +70,7 @@ def generate_specification_pdf(order, output_path):
     services_data.append([f"• Подготовка к монтажу: Нет"])
 
     services_table = Table(services_data, colWidths=[190*mm])
-    services_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, 0), font_bold),
-        ('FONTNAME', (0, 1), (0, -1), font_name),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BACKGROUND', (0, 0), (-1, -1), color_header),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('TOPPADDING', (0, 0), (-1, -1), 3),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-    ]))
+    services_table.setStyle(theme.spec_services_table)
     elements.append(services_table)
     elements.append(Spacer(1, 8*mm))
 
@@ -83,111 +78,48 @@ def generate_specification_pdf(order, output_path):
     # Заголовок таблицы
     main_table_data = [['Наименование', 'Ед', 'СП', 'Итого']]
 
-    # Обрабатываем каждую систему
+    # Фон строк по категориям (как в оригинале); подряд идущие строки
+    # одного цвета — одной командой, иначе при разбиении длинной таблицы
+    # на страницы ReportLab перебирает команду на каждую строку
+    table_styles = list(theme.spec_main_commands)
+    band_start, band_color = None, None
+
     for system in order.systems:
         calc_data = system.calculated_data or {}
 
-        # Категории с цветовым кодированием (как в оригинале)
-        categories_with_colors = [
-            ('profiles', color_profiles),
-            ('seals', color_seals),
-            ('interpanel_seals', color_seals),
-            ('hardware', color_hardware),
-            ('consumables', color_profiles),
-            ('fasteners', color_profiles),
-        ]
-
-        for cat_key, cat_color in categories_with_colors:
-            items = calc_data.get(cat_key, [])
-            if not items:
-                continue
-
-            for item in items:
-                name = item.get('name', '—')
-
-                # Определяем единицу и количество
-                if cat_key in ['profiles', 'seals', 'interpanel_seals']:
-                    qty = item.get('total_m', 0)
-                    unit = 'п.м'
-                else:
-                    qty = item.get('qty', item.get('pieces', 0))
-                    unit = item.get('unit', 'шт')
-
-                # Примечание
-                note = item.get('note', '')
-                if note:
-                    name = f"{name} - {note}"
-
-                # Добавляем строку с цветом категории
-                main_table_data.append([
-                    name,
-                    unit,
-                    f"{qty:.3f}" if isinstance(qty, float) else str(qty),
-                    f"{qty:.3f}" if isinstance(qty, float) else str(qty)
-                ])
+        for cat_key, item, qty, unit in iter_bom(calc_data):
+            name = item.get('name', '—')
+
+            # Примечание
+            note = item.get('note', '')
+            if note:
+                name = f"{name} - {note}"
+
+            # Добавляем строку с цветом категории
+            row_idx = len(main_table_data)
+            main_table_data.append([
+                name,
+                unit,
+                f"{qty:.3f}" if isinstance(qty, float) else str(qty),
+                f"{qty:.3f}" if isinstance(qty, float) else str(qty)
+            ])
+            color = theme.category_colors[cat_key]
+            if color != band_color:
+                if band_color is not None:
+                    table_styles.append(('BACKGROUND', (0, band_start), (-1, row_idx - 1), band_color))
+                band_start, band_color = row_idx, color
+
+    if band_color is not None:
+        table_styles.append(('BACKGROUND', (0, band_start), (-1, len(main_table_data) - 1), band_color))
 
     # Создаем основную таблицу
     main_table = Table(main_table_data, colWidths=[130*mm, 20*mm, 20*mm, 20*mm])
-
-    # Стили для таблицы
-    table_styles = [
-        # Заголовок
-        ('BACKGROUND', (0, 0), (-1, 0), color_header),
-        ('FONTNAME', (0, 0), (-1, 0), font_bold),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-        ('ALIGN', (1, 0), (-1, 0), 'CENTER'),
-        ('TOPPADDING', (0, 0), (-1, 0), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-
-        # Общие стили
-        ('FONTNAME', (0, 1), (-1, -1), font_name),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-        ('TOPPADDING', (0, 1), (-1, -1), 3),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 3),
-    ]
-
-    # Применяем цвета к строкам (нужно определить диапазоны по категориям)
-    # Это упрощенная версия - в оригинале цвета зависят от типа комплектующих
-    row_idx = 1
-    for system in order.systems:
-        calc_data = system.calculated_data or {}
-
-        categories_with_colors = [
-            ('profiles', color_profiles),
-            ('seals', color_seals),
-            ('interpanel_seals', color_seals),
-            ('hardware', color_hardware),
-            ('consumables', color_profiles),
-            ('fasteners', color_profiles),
-        ]
-
-        for cat_key, cat_color in categories_with_colors:
-            items = calc_data.get(cat_key, [])
-            if not items:
-                continue
-
-            for item in items:
-                table_styles.append(('BACKGROUND', (0, row_idx), (-1, row_idx), cat_color))
-                row_idx += 1
-
     main_table.setStyle(TableStyle(table_styles))
     elements.append(main_table)
     elements.append(Spacer(1, 10*mm))
 
     # ========== ПАРАМЕТРЫ СИСТЕМ (внизу) ==========
-    elements.append(Paragraph('Параметры систем: Slider', ParagraphStyle(
-        'SectionHeader',
-        fontSize=11,
-        fontName=font_bold,
-        spaceAfter=5
-    )))
+    elements.append(Paragraph('Параметры систем: Slider', theme.spec_section))
 
     for system in order.systems:
         sys_info = system.calculated_data.get('system_info', {}) if system.calculated_data else {}
@@ -206,25 +138,13 @@ def generate_specification_pdf(order, output_path):
 """
 
         # Обернуть в Paragraph для поддержки HTML разметки
-        params_style = ParagraphStyle(
-            'ParamsBox',
-            fontSize=8,
-            fontName=font_name,
-            leading=10
-        )
-        params_paragraph = Paragraph(params_text, params_style)
+        params_paragraph = Paragraph(params_text, theme.spec_params)
 
         params_box = Table([[params_paragraph]], colWidths=[190*mm])
-        params_box.setStyle(TableStyle([
-            ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
+        params_box.setStyle(theme.spec_params_box)
         elements.append(params_box)
         elements.append(Spacer(1, 5*mm))
 
     # Генерируем PDF
     doc.build(elements)
-    return output_path
+    return output
@@ -0,0 +1,239 @@
+# modules/pdf/theme.py
+"""
+Готовые стили и шаблоны оформления PDF
+
+Шрифты, палитры, ParagraphStyle и TableStyle не зависят от заказа, поэтому
+собираются один раз на процесс и переиспользуются всеми рендерингами.
+Сами flowable (Paragraph, Table) при вёрстке хранят своё состояние
+(ширины, разбиение строк), их собираем на каждый документ из готовых
+стилей — это дёшево.
+"""
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.platypus import Table, TableStyle, Paragraph, Spacer
+from .fonts import register_fonts
+
+_theme = None
+
+
+class PdfTheme:
+    """Стили документов КП и разблюдовки"""
+
+    def __init__(self):
+        font_name, font_bold = register_fonts()
+        self.font_name = font_name
+        self.font_bold = font_bold
+
+        # Цвета JOY VISION
+        self.joy_blue = colors.HexColor('#00b0e8')  # Яркий голубой
+        self.joy_dark = colors.HexColor('#1a4d7a')  # Темно-синий
+        self.total_bg = colors.HexColor('#f0f8ff')
+
+        # Цветовая схема разблюдовки (как в оригинале)
+        self.color_profiles = colors.HexColor('#cce5ff')  # Голубой для профилей
+        self.color_hardware = colors.HexColor('#ccffcc')  # Зеленый для фурнитуры
+        self.color_seals = colors.HexColor('#ffffcc')     # Желтый для уплотнителей
+        self.color_header = colors.HexColor('#e0e0e0')    # Серый для заголовков
+        self.category_colors = {
+            'profiles': self.color_profiles,
+            'seals': self.color_seals,
+            'interpanel_seals': self.color_seals,
+            'hardware': self.color_hardware,
+            'consumables': self.color_profiles,
+            'fasteners': self.color_profiles,
+        }
+
+        self._build_commercial()
+        self._build_specification()
+
+    # ---------- Коммерческое предложение ----------
+
+    def _build_commercial(self):
+        font_name, font_bold, joy_blue = self.font_name, self.font_bold, self.joy_blue
+
+        self.kp_header_text = ParagraphStyle('HeaderText', fontSize=16, textColor=colors.white,
+                                             fontName=font_bold)
+        self.kp_logo = ParagraphStyle('Logo', fontSize=18, alignment=TA_RIGHT,
+                                      textColor=self.joy_dark, fontName=font_bold)
+        self.kp_section = ParagraphStyle('Section', fontSize=12, textColor=joy_blue,
+                                         fontName=font_bold, spaceAfter=5)
+        self.kp_grand_total = ParagraphStyle('GrandTotal', fontSize=14, fontName=font_bold,
+                                             alignment=TA_RIGHT)
+        self.kp_footer = ParagraphStyle('Footer', fontSize=9, textColor=colors.grey,
+                                        fontName=font_name, alignment=TA_CENTER)
+        self.kp_contact = ParagraphStyle('Contact', fontSize=9, textColor=joy_blue,
+                                         fontName=font_name, alignment=TA_RIGHT)
+
+        self.kp_header_table = TableStyle([
+            ('BACKGROUND', (0, 0), (0, 0), joy_blue),
+            ('BACKGROUND', (1, 0), (1, 0), colors.white),
+            ('TEXTCOLOR', (0, 0), (0, 0), colors.white),
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 10),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+            ('TOPPADDING', (0, 0), (-1, -1), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ])
+
+        self.kp_info_table = TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), font_bold),
+            ('FONTNAME', (2, 0), (2, -1), font_bold),
+            ('FONTNAME', (1, 0), (1, -1), font_name),
+            ('FONTNAME', (3, 0), (3, -1), font_name),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (2, 0), (2, -1), 'LEFT'),
+            ('LINEBELOW', (0, -1), (-1, -1), 1, joy_blue),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ])
+
+        self.kp_systems_table = TableStyle([
+            # Заголовок
+            ('BACKGROUND', (0, 0), (-1, 0), joy_blue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), font_bold),
+            ('FONTSIZE', (0, 0), (-1, 0), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('TOPPADDING', (0, 0), (-1, 0), 8),
+
+            # Основные строки систем
+            ('FONTNAME', (0, 1), (-1, -4), font_name),
+            ('FONTSIZE', (0, 1), (-1, -4), 9),
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+            ('ALIGN', (5, 1), (-1, -1), 'RIGHT'),
+            ('GRID', (0, 0), (-1, -4), 0.5, colors.grey),
+
+            # Строки деталей (каждая вторая, начиная с 2)
+            ('SPAN', (1, 2), (4, 2)),  # Детали 1-й системы
+            ('FONTSIZE', (1, 2), (1, 2), 7),
+            ('TEXTCOLOR', (1, 2), (1, 2), colors.grey),
+
+            # Итоговые строки
+            ('FONTNAME', (6, -3), (-1, -1), font_bold),
+            ('FONTSIZE', (6, -1), (-1, -1), 11),
+            ('LINEABOVE', (6, -3), (-1, -3), 1, colors.grey),
+            ('LINEABOVE', (6, -1), (-1, -1), 2, joy_blue),
+            ('BACKGROUND', (6, -3), (-1, -1), self.total_bg),
+
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 4),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+            ('TOPPADDING', (0, 1), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+        ])
+
+        self.kp_additional_table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), joy_blue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), font_bold),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+            ('ALIGN', (3, 1), (3, -1), 'RIGHT'),
+            ('FONTNAME', (0, 1), (-1, -1), font_name),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('FONTNAME', (2, -1), (3, -1), font_bold),
+            ('LINEABOVE', (2, -1), (3, -1), 2, joy_blue),
+            ('BACKGROUND', (2, -1), (3, -1), self.total_bg),
+        ])
+
+    def kp_header(self):
+        """Шапка КП: плашка с заголовком и логотип"""
+        table = Table([[
+            Paragraph('<b>Коммерческое предложение</b>', self.kp_header_text),
+            Paragraph('<b>JOY VISION</b><br/><font size=8>СИСТЕМЫ БЕЗРАМНОГО ОСТЕКЛЕНИЯ</font>',
+                      self.kp_logo),
+        ]], colWidths=[100*mm, 80*mm])
+        table.setStyle(self.kp_header_table)
+        return [table, Spacer(1, 8*mm)]
+
+    def kp_footer_flowables(self):
+        """Футер КП: срок действия и контакты"""
+        return [
+            Spacer(1, 15*mm),
+            Paragraph('Предложение действительно 14 дней с даты формирования', self.kp_footer),
+            Spacer(1, 3*mm),
+            Paragraph('info@joyvision.com', self.kp_contact),
+        ]
+
+    # ---------- Разблюдовка ----------
+
+    def _build_specification(self):
+        font_name, font_bold = self.font_name, self.font_bold
+
+        self.spec_title = ParagraphStyle('Title', fontSize=16, fontName=font_bold,
+                                         alignment=TA_CENTER, spaceAfter=8)
+        self.spec_info = ParagraphStyle('Info', fontSize=9, fontName=font_name, leading=12)
+        self.spec_section = ParagraphStyle('SectionHeader', fontSize=11, fontName=font_bold,
+                                           spaceAfter=5)
+        self.spec_params = ParagraphStyle('ParamsBox', fontSize=8, fontName=font_name, leading=10)
+
+        self.spec_services_table = TableStyle([
+            ('FONTNAME', (0, 0), (0, 0), font_bold),
+            ('FONTNAME', (0, 1), (0, -1), font_name),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BACKGROUND', (0, 0), (-1, -1), self.color_header),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 5),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ])
+
+        # Базовые команды таблицы комплектующих; фон строк добавляется по категориям
+        self.spec_main_commands = (
+            # Заголовок
+            ('BACKGROUND', (0, 0), (-1, 0), self.color_header),
+            ('FONTNAME', (0, 0), (-1, 0), font_bold),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+            ('ALIGN', (1, 0), (-1, 0), 'CENTER'),
+            ('TOPPADDING', (0, 0), (-1, 0), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
+
+            # Общие стили
+            ('FONTNAME', (0, 1), (-1, -1), font_name),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 4),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+            ('TOPPADDING', (0, 1), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 3),
+        )
+
+        self.spec_params_box = TableStyle([
+            ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('LEFTPADDING', (0, 0), (-1, -1), 8),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ])
+
+
+def get_theme():
+    """Стили оформления PDF (собираются при первом вызове в процессе)"""
+    global _theme
+    if _theme is None:
+        _theme = PdfTheme()
+    return _theme
+
+
+def reset_theme():
+    """Сбросить собранные стили (бенчмарк, смена шрифтов)"""
+    global _theme
+    _theme = None
+
+
+def warm_up():
+    """Собрать шрифты и стили заранее — вызывается при старте процесса пула"""
+    get_theme()
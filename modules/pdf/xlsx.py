@@ -0,0 +1,97 @@
+# modules/pdf/xlsx.py
+"""
+Выгрузка разблюдовки в XLSX
+
+Книга пишется в режиме openpyxl write-only: строки сразу уходят во
+временный файл листа и не накапливаются в памяти, поэтому размер заказа
+(или числа заказов) на потребление памяти не влияет. Заказы читаются тем
+же путём, что и для PDF (service.iter_order_snapshots).
+
+Листы:
+    «Разблюдовка» — по каждой системе, по категориям комплектующих;
+    «Итого» — суммарное количество по артикулам для склада.
+"""
+
+from modules.calculator.bom import iter_bom, BOM_CATEGORIES, BOM_CATEGORY_TITLES
+
+SPEC_HEADER = ['Заказ', 'Система', 'Категория', 'Артикул', 'Наименование', 'Ед', 'Кол-во']
+TOTAL_HEADER = ['Категория', 'Артикул', 'Наименование', 'Ед', 'Кол-во']
+
+# Цвета категорий как в PDF разблюдовки
+_CATEGORY_FILLS = {
+    'profiles': 'CCE5FF',
+    'seals': 'FFFFCC',
+    'interpanel_seals': 'FFFFCC',
+    'hardware': 'CCFFCC',
+    'consumables': 'CCE5FF',
+    'fasteners': 'CCE5FF',
+}
+
+
+def _header_row(sheet, titles):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    bold = Font(bold=True)
+    fill = PatternFill('solid', fgColor='E0E0E0')
+    row = []
+    for title in titles:
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.font = bold
+        cell.fill = fill
+        row.append(cell)
+    return row
+
+
+def write_specification_xlsx(snapshots, output):
+    """
+    Записать разблюдовку заказов в XLSX
+
+    Args:
+        snapshots: итератор заказов (модели или снимки из service.snapshot_order)
+        output: путь к файлу или бинарный файловый объект
+
+    Returns:
+        количество строк на листе «Разблюдовка» (без заголовка)
+    """
+    # openpyxl — при первой выгрузке, а не при старте воркера
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import PatternFill
+    workbook = Workbook(write_only=True)
+    spec_sheet = workbook.create_sheet('Разблюдовка')
+    total_sheet = workbook.create_sheet('Итого')
+
+    spec_sheet.column_dimensions['E'].width = 60
+    total_sheet.column_dimensions['C'].width = 60
+    spec_sheet.freeze_panes = 'A2'
+    spec_sheet.append(_header_row(spec_sheet, SPEC_HEADER))
+
+    fills = {key: PatternFill('solid', fgColor=color) for key, color in _CATEGORY_FILLS.items()}
+    # (категория, артикул, ед) -> [наименование, кол-во]; растёт с числом
+    # разных артикулов, а не строк
+    totals = {}
+    rows = 0
+
+    for order in snapshots:
+        for system in order.systems:
+            system_title = f'{system.position}. {system.system_type} {system.width}x{system.height}'
+            for cat_key, item, qty, unit in iter_bom(system.calculated_data):
+                code = item.get('code', '')
+                category = WriteOnlyCell(spec_sheet, value=BOM_CATEGORY_TITLES[cat_key])
+                category.fill = fills[cat_key]
+                spec_sheet.append([order.id, system_title, category, code,
+                                   item.get('name', '—'), unit, qty])
+                rows += 1
+
+                total = totals.setdefault((cat_key, code, unit), [item.get('name', '—'), 0])
+                total[1] += qty or 0
+
+    total_sheet.append(_header_row(total_sheet, TOTAL_HEADER))
+    order_index = {key: i for i, key in enumerate(BOM_CATEGORIES)}
+    for (cat_key, code, unit), (name, qty) in sorted(totals.items(),
+                                                     key=lambda kv: (order_index[kv[0][0]], kv[0][1])):
+        total_sheet.append([BOM_CATEGORY_TITLES[cat_key], code, name, unit,
+                            round(qty, 3) if isinstance(qty, float) else qty])
+
+    workbook.save(output)
+    return rows
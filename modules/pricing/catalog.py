@@ -0,0 +1,199 @@
+"""
+Каталог цен по типам систем и стадия ценообразования
+
+Выборка применимых к системе позиций — один запрос по первичному ключу
+price_item_system_types (system_type, price_item_id). Позиции без
+system_types помечены ANY_SYSTEM и входят в каталог любой системы.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from extensions import db
+from models.price import PriceItem, PriceItemSystemType, PriceHistory, ANY_SYSTEM
+from modules.calculator.bom import iter_bom
+
+# Время жизни карты цен в процессе; в своём воркере сбрасывается сразу при правке
+PRICE_MAP_TTL = 60
+
+# Сколько исторических срезов держать в кэше процесса
+MAX_CACHED_SNAPSHOTS = 64
+
+# Дата для цен, существовавших до появления истории
+HISTORY_EPOCH = datetime(1970, 1, 1)
+
+_price_maps = {}
+_price_maps_lock = threading.Lock()
+
+# as_of -> {article: price | None}; прошлые срезы неизменны (история только дописывается)
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def applicable_items_query(system_type, active_only=True):
+    """Запрос позиций прайса, применимых к типу системы"""
+    query = PriceItem.query.join(PriceItemSystemType).filter(
+        PriceItemSystemType.system_type.in_([system_type, ANY_SYSTEM])
+    )
+    if active_only:
+        query = query.filter(PriceItem.is_active == True)
+    return query
+
+
+def get_price_map(system_type):
+    """
+    Карта цен {артикул: цена} для типа системы (кэшируется в процессе)
+    """
+    now = time.monotonic()
+    cached = _price_maps.get(system_type)
+    if cached and now - cached[0] < PRICE_MAP_TTL:
+        return cached[1]
+
+    rows = (db.session.query(PriceItem.article, PriceItem.price)
+            .join(PriceItemSystemType)
+            .filter(PriceItemSystemType.system_type.in_([system_type, ANY_SYSTEM]),
+                    PriceItem.is_active == True)
+            .all())
+    price_map = {article: price or 0 for article, price in rows}
+
+    with _price_maps_lock:
+        _price_maps[system_type] = (now, price_map)
+    return price_map
+
+
+def invalidate_price_maps():
+    """Сбросить кэш карт цен (после правки прайса или импорта)"""
+    with _price_maps_lock:
+        _price_maps.clear()
+
+
+def _query_prices_as_of(articles, as_of):
+    """Цены набора артикулов на момент as_of — один запрос по (article, valid_from)"""
+    latest = (db.session.query(PriceHistory.article,
+                               db.func.max(PriceHistory.valid_from).label('valid_from'))
+              .filter(PriceHistory.article.in_(articles), PriceHistory.valid_from <= as_of)
+              .group_by(PriceHistory.article)
+              .subquery())
+    rows = (db.session.query(PriceHistory.article, PriceHistory.price)
+            .join(latest, db.and_(PriceHistory.article == latest.c.article,
+                                  PriceHistory.valid_from == latest.c.valid_from))
+            .all())
+    return dict(rows)
+
+
+def parse_as_of(text):
+    """
+    Момент из ISO 8601 в наивном UTC, как хранятся даты в БД
+
+    2026-03-01T12:00 (без зоны — уже UTC), 2026-03-01T12:00Z,
+    2026-03-01T15:00+03:00 — один и тот же момент.
+
+    Raises:
+        ValueError: строка не в формате ISO 8601
+    """
+    as_of = datetime.fromisoformat(text)
+    if as_of.tzinfo is not None:
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+    return as_of
+
+
+def prices_as_of(articles, as_of):
+    """
+    Цены артикулов на момент as_of
+
+    Срезы в прошлом кэшируются: повторная отрисовка старого КП
+    не обращается к БД за уже разрешёнными артикулами.
+
+    Returns:
+        {article: price} — только артикулы, у которых была цена на as_of
+    """
+    articles = set(articles)
+    if not articles:
+        return {}
+    if as_of >= datetime.utcnow():
+        return _query_prices_as_of(articles, as_of)
+
+    with _snapshots_lock:
+        snapshot = _snapshots.get(as_of)
+        if snapshot is not None:
+            _snapshots.move_to_end(as_of)
+        missing = articles - snapshot.keys() if snapshot is not None else articles
+
+    if missing:
+        found = _query_prices_as_of(missing, as_of)
+        with _snapshots_lock:
+            snapshot = _snapshots.setdefault(as_of, {})
+            for article in missing:
+                snapshot[article] = found.get(article)
+            _snapshots.move_to_end(as_of)
+            while len(_snapshots) > MAX_CACHED_SNAPSHOTS:
+                _snapshots.popitem(last=False)
+
+    return {a: snapshot[a] for a in articles if snapshot.get(a) is not None}
+
+
+def apply_prices(calculated, system_type, price_map=None, as_of=None):
+    """
+    Стадия ценообразования: оценить комплектующие по прайсу
+
+    Записывает в calculated['summary'] total_price и missing_articles
+    (артикулы расчёта, которых нет в каталоге системы).
+
+    Args:
+        as_of: datetime — взять цены из истории на этот момент
+
+    Returns:
+        calculated
+    """
+    if price_map is None:
+        if as_of is not None:
+            codes = {item.get('code') for _, item, _, _ in iter_bom(calculated)}
+            price_map = prices_as_of(codes - {None}, as_of)
+        else:
+            price_map = get_price_map(system_type)
+
+    total = 0.0
+    missing = []
+    for cat_key, item, qty, unit in iter_bom(calculated):
+        code = item.get('code')
+        if code in price_map:
+            total += price_map[code] * (qty or 0)
+        elif code and code not in missing:
+            missing.append(code)
+
+    summary = calculated.setdefault('summary', {})
+    summary['total_price'] = round(total, 2)
+    summary['missing_articles'] = missing
+    if as_of is not None:
+        summary['priced_as_of'] = as_of.isoformat()
+    return calculated
+
+
+def backfill_system_type_links():
+    """
+    Заполнить таблицу применимости для позиций, созданных до её появления.
+    Вызывается при старте приложения, внутри app_context.
+    """
+    orphans = PriceItem.query.filter(~PriceItem.system_type_links.any()).all()
+    for item in orphans:
+        item.system_types = item.system_types
+    if orphans:
+        db.session.commit()
+
+
+def backfill_price_history():
+    """
+    Завести начальную запись истории для позиций без истории.
+    Вызывается при старте приложения, внутри app_context.
+    """
+    has_history = db.session.query(PriceHistory.id).filter(
+        PriceHistory.article == PriceItem.article
+    ).exists()
+    rows = db.session.query(PriceItem.article, PriceItem.price).filter(~has_history).all()
+    if rows:
+        db.session.execute(PriceHistory.__table__.insert(), [
+            {'article': article, 'price': price or 0, 'valid_from': HISTORY_EPOCH}
+            for article, price in rows
+        ])
+        db.session.commit()
@@ -0,0 +1,113 @@
+"""
+Предпросмотр импорта: разница между файлом прайса и price_items
+
+Считается векторно: outer merge двух DataFrame по артикулу, без циклов
+по строкам и без записи в БД.
+"""
+
+import numpy as np
+import pandas as pd
+from extensions import db
+from models.price import PriceItem
+from .importer import REQUIRED_COLUMNS, ImportFormatError
+
+# Порядок типов изменений в выдаче
+CHANGE_TYPES = ['new', 'removed', 'price', 'category']
+
+
+def read_price_file(file_obj):
+    """
+    Прочитать файл прайса в DataFrame с колонками article/name/price/category
+
+    Строки без артикула отбрасываются, при повторе артикула берётся последняя.
+
+    Returns:
+        (DataFrame, invalid_rows) — invalid_rows: номера строк Excel с нечисловой ценой
+    """
+    df = pd.read_excel(file_obj, dtype={'Артикул': str})
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
+        raise ImportFormatError(f'Нужны колонки: {", ".join(REQUIRED_COLUMNS)}')
+
+    df = pd.DataFrame({
+        'excel_row': df.index + 2,
+        'article': df['Артикул'].astype('string').str.strip(),
+        'name': df['Наименование'].astype('string').str.strip(),
+        'price': pd.to_numeric(df['Цена'], errors='coerce'),
+        'category': df['Категория'].astype('string').str.strip(),
+    })
+    df = df[df['article'].notna() & (df['article'] != '')]
+
+    invalid = df['price'].isna()
+    invalid_rows = df.loc[invalid, 'excel_row'].tolist()
+    df = df[~invalid].drop_duplicates('article', keep='last')
+    return df, invalid_rows
+
+
+def load_current_prices():
+    """Текущий прайс (активные позиции) одним запросом"""
+    rows = db.session.execute(
+        db.select(PriceItem.article, PriceItem.name, PriceItem.price, PriceItem.category)
+        .where(PriceItem.is_active == True)
+    ).all()
+    df = pd.DataFrame(rows, columns=['article', 'name', 'price', 'category'])
+    df['price'] = df['price'].astype(float)
+    return df
+
+
+def compute_price_diff(incoming, current):
+    """
+    Сравнить прайсы
+
+    Returns:
+        (summary dict, DataFrame изменений, отсортированный по артикулу)
+    """
+    merged = incoming.merge(current, on='article', how='outer',
+                            suffixes=('_new', '_old'), indicator=True)
+
+    is_new = merged['_merge'] == 'left_only'
+    is_removed = merged['_merge'] == 'right_only'
+    both = merged['_merge'] == 'both'
+    price_changed = both & ~np.isclose(merged['price_new'].fillna(0), merged['price_old'].fillna(0))
+    category_changed = both & (merged['category_new'].fillna('') != merged['category_old'].fillna(''))
+
+    merged['change'] = np.select(
+        [is_new, is_removed, price_changed, category_changed],
+        ['new', 'removed', 'price', 'category'],
+        default=''
+    )
+    # Строка может одновременно сменить и цену, и категорию
+    merged['category_moved'] = category_changed
+    merged['delta'] = merged['price_new'] - merged['price_old']
+
+    changes = merged[merged['change'] != ''].sort_values('article')
+
+    summary = {
+        'new': int(is_new.sum()),
+        'removed': int(is_removed.sum()),
+        'price_changed': int(price_changed.sum()),
+        'category_moved': int(category_changed.sum()),
+        'unchanged': int((both & ~price_changed & ~category_changed).sum()),
+    }
+    return summary, changes
+
+
+def diff_records(changes, limit, offset):
+    """Страница изменений в виде списка dict для JSON"""
+    page = changes.iloc[offset:offset + limit]
+    page = page[['article', 'change', 'name_new', 'name_old', 'price_old', 'price_new',
+                 'delta', 'category_old', 'category_new', 'category_moved']]
+    page = page.astype(object).where(page.notna(), None)
+    return [
+        {
+            'article': row['article'],
+            'change': row['change'],
+            'name': row['name_new'] or row['name_old'],
+            'old_price': row['price_old'],
+            'new_price': row['price_new'],
+            'delta': round(row['delta'], 2) if row['delta'] is not None else None,
+            'old_category': row['category_old'],
+            'new_category': row['category_new'],
+            'category_moved': bool(row['category_moved']),
+        }
+        for row in page.to_dict('records')
+    ]
@@ -0,0 +1,228 @@
+"""
+Потоковый импорт прайса из Excel в фоне
+
+Файл сохраняется на диск, затем читается openpyxl в режиме read_only
+построчно. Изменения коммитятся пачками вместе с чекпоинтом
+(PriceImportJob.processed_rows), поэтому упавший импорт можно продолжить
+с места остановки, а прогресс виден через GET /api/prices/import/<id>.
+Каждый чекпоинт обновляет updated_at: задача в работе, у которой он
+давно не менялся, брошена (воркер перезапущен посреди импорта) и тоже
+продолжается с чекпоинта.
+"""
+
+import os
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from extensions import db
+from models.price import PriceItem, PriceImportJob
+from .catalog import invalidate_price_maps
+
+REQUIRED_COLUMNS = ['Артикул', 'Наименование', 'Цена', 'Категория']
+
+# Сколько ошибочных строк хранить в задаче
+MAX_STORED_ERRORS = 1000
+
+# Один импорт за раз на воркер: импорты пишут в одни и те же строки
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='price-import')
+
+
+class ImportFormatError(ValueError):
+    """Файл не соответствует ожидаемому формату"""
+
+
+def create_import_job(file_storage, imports_dir):
+    """
+    Сохранить загруженный файл на диск и создать задачу импорта
+
+    Args:
+        file_storage: werkzeug FileStorage из request.files
+        imports_dir: каталог для загруженных файлов
+
+    Returns:
+        PriceImportJob
+    """
+    os.makedirs(imports_dir, exist_ok=True)
+    ext = os.path.splitext(file_storage.filename)[1].lower()
+    path = os.path.join(imports_dir, f'{uuid.uuid4().hex}{ext}')
+    file_storage.save(path)
+
+    job = PriceImportJob(filename=file_storage.filename, file_path=path, errors=[])
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def claim_for_resume(job, stale_seconds):
+    """
+    Забрать задачу на продолжение
+
+    Условный UPDATE по прежнему updated_at: из одновременных запросов
+    на продолжение (в том числе из разных воркеров) задачу получает
+    только один.
+
+    Returns:
+        True, если задача забрана
+    """
+    if not job.is_resumable(stale_seconds):
+        return False
+    claimed = (PriceImportJob.query
+               .filter(PriceImportJob.id == job.id, PriceImportJob.updated_at == job.updated_at)
+               .update({'status': 'pending', 'updated_at': datetime.utcnow()},
+                       synchronize_session=False))
+    db.session.commit()
+    db.session.refresh(job)
+    return claimed == 1
+
+
+def submit_import(app, job_id):
+    """Поставить задачу в фоновый пул воркера"""
+    def run():
+        with app.app_context():
+            run_import(job_id, app.config.get('PRICE_IMPORT_CHUNK_SIZE', 500))
+    return _executor.submit(run)
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def parse_system_types(value):
+    """Ячейка «Системы» -> список типов систем или None"""
+    types = [t.strip() for t in _cell_text(value).split(',') if t.strip()]
+    return types or None
+
+
+def _iter_rows(path):
+    """
+    Построчное чтение первого листа
+
+    Yields:
+        сначала total_rows (или None), затем (номер строки Excel, dict колонка -> значение)
+    """
+    from openpyxl import load_workbook  # при первом импорте, а не при старте воркера
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = [_cell_text(c) for c in header]
+
+        missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+        if missing:
+            raise ImportFormatError(f'Нужны колонки: {", ".join(REQUIRED_COLUMNS)}')
+
+        yield (sheet.max_row - 1) if sheet.max_row else None
+        for excel_row, values in enumerate(rows, start=2):
+            yield excel_row, dict(zip(columns, values))
+    finally:
+        workbook.close()
+
+
+def _apply_chunk(job, chunk, has_systems):
+    """Upsert пачки строк: один запрос на поиск существующих артикулов"""
+    articles = [_cell_text(values['Артикул']) for _, values in chunk]
+    existing = {
+        item.article: item
+        for item in PriceItem.query.filter(PriceItem.article.in_(articles)).all()
+    }
+
+    errors = list(job.errors or [])
+    for (excel_row, values), article in zip(chunk, articles):
+        if not article:
+            continue
+        try:
+            name = _cell_text(values['Наименование'])
+            price = float(values['Цена'])
+            category = _cell_text(values['Категория'])
+            unit = _cell_text(values.get('Ед.изм.')) or 'шт'
+            if not name or not category:
+                raise ValueError('пустое наименование или категория')
+
+            item = existing.get(article)
+            if item:
+                item.name = name
+                item.price = price
+                item.category = category
+                item.unit = unit
+                if has_systems:
+                    item.system_types = parse_system_types(values['Системы'])
+                job.updated += 1
+            else:
+                item = PriceItem(
+                    article=article,
+                    name=name,
+                    price=price,
+                    category=category,
+                    unit=unit,
+                    system_types=parse_system_types(values['Системы']) if has_systems else None
+                )
+                db.session.add(item)
+                existing[article] = item
+                job.created += 1
+        except Exception as e:
+            if len(errors) < MAX_STORED_ERRORS:
+                errors.append({'row': excel_row, 'error': str(e)})
+
+    job.errors = errors
+    job.processed_rows += len(chunk)
+    # Изменения и чекпоинт — в одной транзакции
+    db.session.commit()
+
+
+def run_import(job_id, chunk_size=500):
+    """
+    Выполнить (или продолжить) импорт
+
+    Строки до job.processed_rows пропускаются — они уже закоммичены.
+
+    Returns:
+        PriceImportJob
+    """
+    job = db.session.get(PriceImportJob, job_id)
+    if job is None or job.status == 'done':
+        return job
+
+    job.status = 'running'
+    job.message = None
+    db.session.commit()
+
+    try:
+        rows = _iter_rows(job.file_path)
+        job.total_rows = next(rows)
+        db.session.commit()
+
+        has_systems = None
+        skip = job.processed_rows or 0
+        chunk = []
+        for index, (excel_row, values) in enumerate(rows):
+            if has_systems is None:
+                has_systems = 'Системы' in values
+            if index < skip:
+                continue
+            chunk.append((excel_row, values))
+            if len(chunk) >= chunk_size:
+                _apply_chunk(job, chunk, has_systems)
+                chunk = []
+        if chunk:
+            _apply_chunk(job, chunk, has_systems)
+
+        job.total_rows = job.processed_rows
+        job.status = 'done'
+        job.message = f'Импортировано: создано {job.created}, обновлено {job.updated}'
+        db.session.commit()
+        os.remove(job.file_path)
+
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(PriceImportJob, job_id)
+        job.status = 'failed'
+        job.message = str(e)
+        db.session.commit()
+
+    finally:
+        invalidate_price_maps()
+
+    return job
@@ -3,11 +3,12 @@
 API эндпоинты для работы с ценами
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from extensions import db
-from models.price import PriceItem
-import pandas as pd
-from io import BytesIO
+from models.price import PriceItem, PriceItemSystemType, PriceImportJob, PriceHistory, ANY_SYSTEM
+from .search import apply_search, substring_search
+from .catalog import invalidate_price_maps, parse_as_of, prices_as_of
+from .importer import create_import_job, claim_for_resume, submit_import, run_import, ImportFormatError
 
 pricing_bp = Blueprint('pricing', __name__)
 
@@ -16,6 +17,7 @@ pricing_bp = Blueprint('pricing', __name__)
 def list_prices():
     """Получить прайс-лист"""
     category = request.args.get('category')
+    system_type = request.args.get('system_type')
     search = request.args.get('search')
     active_only = request.args.get('active', 'true').lower() == 'true'
 
@@ -27,16 +29,24 @@ def list_prices():
     if category:
         query = query.filter(PriceItem.category == category)
 
-    if search:
-        search_term = f'%{search}%'
-        query = query.filter(
-            db.or_(
-                PriceItem.article.ilike(search_term),
-                PriceItem.name.ilike(search_term)
-            )
+    if system_type:
+        query = query.join(PriceItemSystemType).filter(
+            PriceItemSystemType.system_type.in_([system_type, ANY_SYSTEM])
         )
 
-    items = query.order_by(PriceItem.category, PriceItem.article).all()
+    ranked = False
+    filtered = query
+    if search:
+        query, ranked = apply_search(query, search)
+
+    if not ranked:
+        query = query.order_by(PriceItem.category, PriceItem.article)
+
+    items = query.all()
+    if search and not items:
+        # По началу слов ничего — подстрока в середине слова ("01" в S-01)
+        items = (substring_search(filtered, search)
+                 .order_by(PriceItem.category, PriceItem.article).all())
 
     return jsonify({
         'success': True,
@@ -70,6 +80,7 @@ def create_price():
 
     db.session.add(item)
     db.session.commit()
+    invalidate_price_maps()
 
     return jsonify({
         'success': True,
@@ -92,6 +103,7 @@ def update_price(article):
             setattr(item, field, data[field])
 
     db.session.commit()
+    invalidate_price_maps()
 
     return jsonify({
         'success': True,
@@ -99,6 +111,44 @@ def update_price(article):
     })
 
 
+@pricing_bp.route('/prices/<article>/history', methods=['GET'])
+def price_history(article):
+    """История цены артикула (от новых к старым)"""
+    rows = (PriceHistory.query
+            .filter(PriceHistory.article == article)
+            .order_by(PriceHistory.valid_from.desc())
+            .all())
+
+    if not rows:
+        return jsonify({'success': False, 'error': 'Артикул не найден'}), 404
+
+    return jsonify({
+        'success': True,
+        'data': [row.to_dict() for row in rows]
+    })
+
+
+@pricing_bp.route('/prices/as-of', methods=['GET'])
+def list_prices_as_of():
+    """Цены артикулов на момент ?date=2026-03-01T12:00 (&articles=S-010,S-020)"""
+    try:
+        as_of = parse_as_of(request.args.get('date', ''))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'date обязателен в формате ISO 8601'}), 400
+
+    articles = request.args.get('articles')
+    if articles:
+        articles = [a.strip() for a in articles.split(',') if a.strip()]
+    else:
+        articles = [a for (a,) in db.session.query(PriceHistory.article).distinct()]
+
+    return jsonify({
+        'success': True,
+        'as_of': as_of.isoformat(),
+        'data': prices_as_of(articles, as_of)
+    })
+
+
 @pricing_bp.route('/prices/<article>', methods=['DELETE'])
 def delete_price(article):
     """Деактивировать позицию прайса"""
@@ -110,6 +160,7 @@ def delete_price(article):
     # Мягкое удаление
     item.is_active = False
     db.session.commit()
+    invalidate_price_maps()
 
     return jsonify({
         'success': True,
@@ -119,7 +170,7 @@ def delete_price(article):
 
 @pricing_bp.route('/prices/import', methods=['POST'])
 def import_prices():
-    """Импорт цен из Excel"""
+    """Импорт цен из Excel (в фоне; прогресс — GET /prices/import/<job_id>)"""
     if 'file' not in request.files:
         return jsonify({'success': False, 'error': 'Файл не передан'}), 400
 
@@ -128,64 +179,102 @@ def import_prices():
     if not file.filename.endswith(('.xlsx', '.xlsm')):
         return jsonify({'success': False, 'error': 'Только .xlsx/.xlsm файлы'}), 400
 
-    try:
-        # Читаем Excel файл
-        df = pd.read_excel(BytesIO(file.read()))
-
-        # Ожидаем колонки: Артикул, Наименование, Ед.изм., Цена, Категория
-        required_cols = ['Артикул', 'Наименование', 'Цена', 'Категория']
-        if not all(col in df.columns for col in required_cols):
-            return jsonify({
-                'success': False,
-                'error': f'Нужны колонки: {", ".join(required_cols)}'
-            }), 400
-
-        created = 0
-        updated = 0
-        errors = []
-
-        for idx, row in df.iterrows():
-            article = str(row['Артикул']).strip()
-            if not article or article == 'nan':
-                continue
-
-            try:
-                item = PriceItem.query.filter_by(article=article).first()
-
-                if item:
-                    # Обновляем существующую позицию
-                    item.name = row['Наименование']
-                    item.price = float(row['Цена'])
-                    item.category = row['Категория']
-                    item.unit = row.get('Ед.изм.', 'шт')
-                    updated += 1
-                else:
-                    # Создаём новую позицию
-                    item = PriceItem(
-                        article=article,
-                        name=row['Наименование'],
-                        price=float(row['Цена']),
-                        category=row['Категория'],
-                        unit=row.get('Ед.изм.', 'шт')
-                    )
-                    db.session.add(item)
-                    created += 1
-
-            except Exception as e:
-                errors.append(f'Строка {idx + 2}: {str(e)}')
-
-        db.session.commit()
+    if request.args.get('dry_run', '').lower() in ('1', 'true'):
+        return _import_dry_run(file)
+
+    job = create_import_job(file, current_app.config['PRICE_IMPORTS_DIR'])
 
+    if current_app.config.get('PRICE_IMPORT_ASYNC', True):
+        submit_import(current_app._get_current_object(), job.id)
         return jsonify({
             'success': True,
-            'message': f'Импортировано: создано {created}, обновлено {updated}',
-            'created': created,
-            'updated': updated,
-            'errors': errors
-        })
-
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+            'data': _job_dict(job),
+            'status_url': f'/api/prices/import/{job.id}'
+        }), 202
+
+    job = run_import(job.id, current_app.config.get('PRICE_IMPORT_CHUNK_SIZE', 500))
+    return _import_result(job)
+
+
+@pricing_bp.route('/prices/import/<int:job_id>', methods=['GET'])
+def import_status(job_id):
+    """Статус и прогресс импорта"""
+    job = db.session.get(PriceImportJob, job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Импорт не найден'}), 404
+
+    return jsonify({'success': True, 'data': _job_dict(job)})
+
+
+@pricing_bp.route('/prices/import/<int:job_id>/resume', methods=['POST'])
+def resume_import(job_id):
+    """Продолжить упавший или брошенный импорт с последнего чекпоинта"""
+    job = db.session.get(PriceImportJob, job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Импорт не найден'}), 404
+
+    if not claim_for_resume(job, current_app.config.get('PRICE_IMPORT_STALE_SECONDS', 600)):
+        return jsonify({'success': False, 'error': f'Импорт в статусе {job.status}'}), 400
+
+    if current_app.config.get('PRICE_IMPORT_ASYNC', True):
+        submit_import(current_app._get_current_object(), job.id)
+        return jsonify({'success': True, 'data': _job_dict(job)}), 202
+
+    job = run_import(job.id, current_app.config.get('PRICE_IMPORT_CHUNK_SIZE', 500))
+    return _import_result(job)
+
+
+def _import_dry_run(file):
+    """Разница между файлом и текущим прайсом, без записи в БД"""
+    # pandas — только для предпросмотра, не при старте воркера
+    from .diff import read_price_file, load_current_prices, compute_price_diff, diff_records
+    change = request.args.get('change')
+    limit = request.args.get('limit', 100, type=int)
+    offset = request.args.get('offset', 0, type=int)
+
+    try:
+        incoming, invalid_rows = read_price_file(file.stream)
+    except ImportFormatError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    summary, changes = compute_price_diff(incoming, load_current_prices())
+    summary['invalid_rows'] = invalid_rows
+
+    if change:
+        if change == 'category':
+            changes = changes[changes['category_moved']]
+        else:
+            changes = changes[changes['change'] == change]
+
+    return jsonify({
+        'success': True,
+        'dry_run': True,
+        'summary': summary,
+        'data': diff_records(changes, limit, offset),
+        'total': len(changes),
+        'limit': limit,
+        'offset': offset
+    })
+
+
+def _job_dict(job):
+    """Задача импорта для ответа (resumable — с порогом брошенной задачи из конфига)"""
+    return job.to_dict(current_app.config.get('PRICE_IMPORT_STALE_SECONDS', 600))
+
+
+def _import_result(job):
+    """Ответ на импорт, выполненный прямо в запросе"""
+    if job.status == 'failed':
+        return jsonify({'success': False, 'error': job.message, 'data': _job_dict(job)}), 400
+
+    return jsonify({
+        'success': True,
+        'message': job.message,
+        'created': job.created,
+        'updated': job.updated,
+        'errors': job.errors,
+        'data': _job_dict(job)
+    })
 
 
 @pricing_bp.route('/prices/categories', methods=['GET'])
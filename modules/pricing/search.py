@@ -0,0 +1,205 @@
+"""
+Поисковый индекс по артикулам и наименованиям прайс-листа
+
+SQLite: внешняя FTS5-таблица price_items_fts (content=price_items),
+синхронизируется триггерами при любом INSERT/UPDATE/DELETE — и при импорте,
+и при ручном редактировании.
+PostgreSQL: GIN-индекс pg_trgm по lower(article || ' ' || name).
+Прочие СУБД: прежний ILIKE без индекса.
+
+Совпадение одинаковое на SQLite и PostgreSQL: каждое слово запроса —
+начало какого-либо слова артикула или наименования (FTS5 "слово"*,
+в PostgreSQL — регулярное выражение с границей слова, его тоже
+ускоряет триграммный индекс). Слова разделяет всё, кроме букв, цифр,
+'-' и '.'.
+
+Расширение pg_trgm создаётся при развёртывании (нужны права владельца
+БД, см. INSTALL_UBUNTU.md), а не при старте приложения:
+
+    sudo -u postgres psql -d joyvision_db -c "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+
+Без расширения поиск работает, но без индекса и сортировки по похожести.
+
+Если по началу слов ничего не найдено, GET /api/prices повторяет поиск
+подстрокой (ILIKE '%строка%', без индекса): так по-прежнему находятся
+«01» в S-01 или «рофиль» в «Профиль» — см. substring_search.
+"""
+
+import logging
+import re
+from sqlalchemy import event, literal_column, table, column
+from extensions import db
+from models.price import PriceItem
+
+FTS_TABLE = 'price_items_fts'
+PG_TRGM_INDEX = 'ix_price_items_search_trgm'
+
+# Лёгкое описание FTS-таблицы для построения запросов (не входит в metadata,
+# т.к. виртуальные таблицы create_all создавать не умеет)
+price_items_fts = table(FTS_TABLE, column('rowid'), column('rank'))
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        article, name,
+        content='price_items', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2 tokenchars '-.'"
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS price_items_fts_ai AFTER INSERT ON price_items BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, article, name) VALUES (new.id, new.article, new.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS price_items_fts_ad AFTER DELETE ON price_items BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, article, name)
+        VALUES ('delete', old.id, old.article, old.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS price_items_fts_au AFTER UPDATE OF article, name ON price_items BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, article, name)
+        VALUES ('delete', old.id, old.article, old.name);
+        INSERT INTO {FTS_TABLE}(rowid, article, name) VALUES (new.id, new.article, new.name);
+    END""",
+]
+
+_PG_DDL = [
+    f"""CREATE INDEX IF NOT EXISTS {PG_TRGM_INDEX} ON price_items
+        USING gin ((lower(article || ' ' || name)) gin_trgm_ops)""",
+]
+
+# Символы, которые FTS5 трактует как синтаксис запроса
+_TERM_RE = re.compile(r'[^\w\-.]+', re.UNICODE)
+
+# Начало слова для регулярного выражения PostgreSQL: как tokenchars '-.' у FTS5
+_PG_WORD_START = '(^|[^[:alnum:].-])'
+
+logger = logging.getLogger(__name__)
+
+# Установлено ли pg_trgm в базе (проверяется в ensure_search_index)
+_pg_trgm = None
+
+
+def _has_pg_trgm(connection):
+    return connection.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").first() is not None
+
+
+def _create_index(connection):
+    """Создать индекс для текущего диалекта (идемпотентно)"""
+    global _pg_trgm
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).first()
+        for ddl in _SQLITE_DDL:
+            connection.exec_driver_sql(ddl)
+        if not exists:
+            # Индекс строится поверх уже существующих данных
+            connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        _pg_trgm = _has_pg_trgm(connection)
+        if not _pg_trgm:
+            logger.warning('Расширение pg_trgm не установлено: поиск по прайсу без индекса. '
+                           'Выполните CREATE EXTENSION pg_trgm (см. INSTALL_UBUNTU.md)')
+            return
+        for ddl in _PG_DDL:
+            connection.exec_driver_sql(ddl)
+
+
+def _drop_index(connection):
+    """Удалить FTS-таблицу вместе с таблицей price_items"""
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+@event.listens_for(PriceItem.__table__, 'after_create')
+def _after_create(target, connection, **kw):
+    _drop_index(connection)
+    _create_index(connection)
+
+
+@event.listens_for(PriceItem.__table__, 'before_drop')
+def _before_drop(target, connection, **kw):
+    _drop_index(connection)
+
+
+def ensure_search_index():
+    """
+    Создать поисковый индекс для уже существующей БД.
+    Вызывается при старте приложения, внутри app_context.
+    """
+    with db.engine.begin() as connection:
+        _create_index(connection)
+
+
+def rebuild_search_index():
+    """Полностью перестроить индекс (после массовых правок в обход ORM)"""
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.dialect.name == 'postgresql' and _has_pg_trgm(connection):
+            connection.exec_driver_sql(f'REINDEX INDEX {PG_TRGM_INDEX}')
+
+
+def _split_terms(search):
+    """Разбить строку поиска на слова без синтаксиса FTS"""
+    return [t for t in _TERM_RE.split(search.lower()) if t.strip('-.')]
+
+
+def _fts_match_expression(terms):
+    """"s-01" "проф" -> '"s-01"* AND "проф"*' (поиск по префиксу каждого слова)"""
+    return ' AND '.join(f'"{t}"*' for t in terms)
+
+
+def _pg_word_prefix_pattern(term):
+    """"s-01" -> '(^|[^[:alnum:].-])s\\-01' (слово, начинающееся с term)"""
+    return _PG_WORD_START + re.sub(r'(\W)', r'\\\1', term)
+
+
+def apply_search(query, search):
+    """
+    Добавить к запросу PriceItem фильтр поиска и сортировку по релевантности
+
+    Args:
+        query: запрос PriceItem.query с уже наложенными фильтрами
+        search: строка поиска от пользователя
+
+    Returns:
+        (query, ranked) — ranked=True, если запрос уже отсортирован по релевантности
+    """
+    terms = _split_terms(search)
+    if not terms:
+        return query, False
+
+    dialect = db.engine.dialect.name
+
+    if dialect == 'sqlite':
+        match = literal_column(FTS_TABLE).op('MATCH')(_fts_match_expression(terms))
+        query = (query
+                 .join(price_items_fts, price_items_fts.c.rowid == PriceItem.id)
+                 .filter(match)
+                 .order_by(price_items_fts.c.rank))
+        return query, True
+
+    if dialect == 'postgresql':
+        haystack = db.func.lower(PriceItem.article + ' ' + PriceItem.name)
+        for term in terms:
+            query = query.filter(haystack.op('~')(_pg_word_prefix_pattern(term)))
+        if not _pg_trgm:
+            return query, False
+        query = query.order_by(db.func.similarity(haystack, ' '.join(terms)).desc())
+        return query, True
+
+    return substring_search(query, search), False
+
+
+def substring_search(query, search):
+    """
+    Фильтр поиска подстрокой в артикуле или наименовании (ILIKE, без индекса)
+
+    Прочие СУБД ищут только так; на SQLite и PostgreSQL — запасной поиск,
+    когда по началу слов ничего не нашлось.
+    """
+    search_term = f'%{search}%'
+    return query.filter(
+        db.or_(
+            PriceItem.article.ilike(search_term),
+            PriceItem.name.ilike(search_term)
+        )
+    )
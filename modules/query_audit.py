@@ -0,0 +1,223 @@
+"""
+Поиск медленных SQL-запросов и N+1
+
+Слушает события SQLAlchemy (before/after_cursor_execute) на всех движках:
+
+- запрос дольше QUERY_SLOW_MS пишется в лог joyvision.sql вместе с планом
+  (EXPLAIN QUERY PLAN для SQLite, EXPLAIN для PostgreSQL);
+- в проверяемом запросе к приложению одинаковые SQL (текст без учёта
+  параметров), выполненные QUERY_REPEAT_THRESHOLD раз и больше, —
+  признак N+1: в лог уходят endpoint, число повторов и стек кода
+  приложения, откуда пришёл запрос.
+
+Проверяется доля QUERY_AUDIT_SAMPLE запросов к приложению (1.0 при
+разработке, несколько процентов в продакшене); медленные SQL ловятся
+всегда. Находки считаются в /metrics (db_slow_statements_total,
+db_repeated_statements_total) и хранятся последними в reports().
+
+В тестах — фикстура query_budget (tests/conftest.py):
+
+    with query_budget(3):
+        client.get('/api/orders')
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from modules.metrics import request_metrics
+
+logger = logging.getLogger('joyvision.sql')
+
+# Корень проекта: в стеке показываются только его файлы
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Сколько последних находок хранить
+MAX_REPORTS = 100
+
+
+def app_stack(limit=8):
+    """Стек вызова без кода библиотек: 'путь:строка в функции'"""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(_PROJECT_ROOT) and os.sep + 'site-packages' + os.sep not in frame.filename
+        and frame.filename != __file__
+    ]
+    return [f'{os.path.relpath(f.filename, _PROJECT_ROOT)}:{f.lineno} в {f.name}' for f in frames[-limit:]]
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Блок выполнил больше SQL, чем заявлено"""
+
+
+class QueryCounter:
+    """Счётчик SQL текущего потока (см. QueryAudit.count)"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class QueryAudit:
+    """Детектор медленных запросов и N+1"""
+
+    def __init__(self, app=None):
+        self.slow_seconds = 0.2
+        self.repeat_threshold = 5
+        self.sample_rate = 1.0
+        self.explain = True
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._reports = deque(maxlen=MAX_REPORTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_seconds = app.config.get('QUERY_SLOW_MS', 200) / 1000
+        self.repeat_threshold = app.config.get('QUERY_REPEAT_THRESHOLD', 5)
+        self.sample_rate = app.config.get('QUERY_AUDIT_SAMPLE', 1.0)
+        self.explain = app.config.get('QUERY_AUDIT_EXPLAIN', True)
+
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['query_audit'] = self
+
+    # ---------- Запрос к приложению ----------
+
+    def _start_request(self):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            g.query_audit = {}
+
+    def _finish_request(self, response):
+        statements = g.pop('query_audit', None)
+        if not statements:
+            return response
+        for statement, (count, stack) in statements.items():
+            if count >= self.repeat_threshold:
+                self._report('repeated', statement, count=count, stack=stack)
+        return response
+
+    # ---------- События SQLAlchemy ----------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_audit_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_audit_started')
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+
+        for counter in getattr(self._local, 'counters', ()):
+            counter.statements.append(statement)
+
+        if has_request_context() and 'query_audit' in g:
+            count, stack = g.query_audit.get(statement, (0, None))
+            count += 1
+            # Стек снимается один раз — на повторе, который делает запрос подозрительным
+            if count == self.repeat_threshold:
+                stack = app_stack()
+            g.query_audit[statement] = (count, stack)
+
+        if seconds >= self.slow_seconds:
+            plan = self._explain(conn, cursor, statement, parameters) if self.explain and not executemany else None
+            self._report('slow', statement, seconds=seconds, plan=plan, stack=app_stack())
+
+    def _explain(self, conn, cursor, statement, parameters):
+        """План запроса на том же соединении (DBAPI, мимо событий SQLAlchemy)"""
+        if not statement.lstrip().upper().startswith('SELECT'):
+            return None
+        prefix = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}.get(conn.dialect.name)
+        if prefix is None:
+            return None
+        dbapi_connection = cursor.connection
+        # Ошибка в транзакции PostgreSQL обрывает её целиком: EXPLAIN — в точке сохранения,
+        # чтобы его сбой не сломал транзакцию запроса
+        savepoint = conn.dialect.name == 'postgresql' and not getattr(dbapi_connection, 'autocommit', False)
+        try:
+            explain_cursor = dbapi_connection.cursor()
+            try:
+                if savepoint:
+                    explain_cursor.execute('SAVEPOINT query_audit_explain')
+                try:
+                    explain_cursor.execute(prefix + statement, parameters)
+                    plan = [' '.join(str(col) for col in row) for row in explain_cursor.fetchall()]
+                except Exception:
+                    if savepoint:
+                        explain_cursor.execute('ROLLBACK TO SAVEPOINT query_audit_explain')
+                    raise
+                finally:
+                    if savepoint:
+                        explain_cursor.execute('RELEASE SAVEPOINT query_audit_explain')
+                return plan
+            finally:
+                explain_cursor.close()
+        except Exception as e:
+            return [f'EXPLAIN не выполнен: {e}']
+
+    # ---------- Находки ----------
+
+    def _report(self, kind, statement, **details):
+        endpoint = (request.endpoint or 'unmatched') if has_request_context() else 'background'
+        report = {'kind': kind, 'endpoint': endpoint, 'statement': statement, **details}
+        with self._lock:
+            self._reports.append(report)
+
+        if kind == 'slow':
+            request_metrics.inc('db_slow_statements_total', {'endpoint': endpoint})
+            logger.warning('Медленный SQL (%.0f мс) в %s: %s\nПлан: %s\nСтек: %s',
+                           details['seconds'] * 1000, endpoint, statement,
+                           '; '.join(details['plan'] or []), ' <- '.join(reversed(details['stack'])))
+        else:
+            request_metrics.inc('db_repeated_statements_total', {'endpoint': endpoint})
+            logger.warning('N+1: SQL выполнен %d раз за запрос %s: %s\nСтек: %s',
+                           details['count'], endpoint, statement, ' <- '.join(reversed(details['stack'] or [])))
+
+    def reports(self):
+        """Последние находки (новые в конце)"""
+        with self._lock:
+            return list(self._reports)
+
+    @contextmanager
+    def count(self):
+        """Посчитать SQL, выполненные в этом потоке внутри блока"""
+        counter = QueryCounter()
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = self._local.counters = []
+        counters.append(counter)
+        try:
+            yield counter
+        finally:
+            counters.remove(counter)
+
+    @contextmanager
+    def budget(self, max_queries):
+        """
+        Блок должен уложиться в max_queries SQL
+
+        Raises:
+            QueryBudgetExceeded: со списком выполненных запросов
+        """
+        with self.count() as counter:
+            yield counter
+        if counter.count > max_queries:
+            listing = '\n'.join(f'  {i + 1}. {s}' for i, s in enumerate(counter.statements))
+            raise QueryBudgetExceeded(f'Выполнено {counter.count} SQL при бюджете {max_queries}:\n{listing}')
+
+
+query_audit = QueryAudit()
@@ -0,0 +1,241 @@
+"""
+Объединение одновременных одинаковых запросов (single-flight)
+
+Пока вычисление по ключу выполняется, повторные вызовы с тем же ключом
+не запускают его заново, а ждут и получают тот же результат (или ту же
+ошибку). Внутри воркера — через threading.Event, между воркерами
+gunicorn — через файловую блокировку: второй воркер ждёт освобождения
+блокировки и забирает сохранённый результат.
+
+Ключ включает хэш состояния заказа, поэтому повторно используется
+только результат для того же содержимого.
+
+Файлы результатов живут SINGLEFLIGHT_RESULT_TTL секунд; раз в
+SINGLEFLIGHT_REAP_INTERVAL секунд воркер удаляет устаревшие результаты
+и свободные файлы блокировок (занятую блокировку не трогает).
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: только объединение внутри процесса
+    fcntl = None
+
+
+class SingleFlightTimeout(Exception):
+    """Не дождались результата другого вызова (в этом или другом воркере)"""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одновременных вызовов по ключу"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._locks_dir = None
+        self._result_ttl = 10
+        self._reap_interval = 60
+        self._last_reap = time.monotonic()
+        self._stats = {'leader_total': 0, 'shared_total': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._locks_dir = app.config.get('SINGLEFLIGHT_DIR')
+        self._result_ttl = app.config.get('SINGLEFLIGHT_RESULT_TTL', 10)
+        self._reap_interval = app.config.get('SINGLEFLIGHT_REAP_INTERVAL', 60)
+        if self._locks_dir:
+            os.makedirs(self._locks_dir, exist_ok=True)
+        app.extensions['singleflight'] = self
+
+    def do(self, key, fn, timeout=None):
+        """
+        Выполнить fn() один раз на все одновременные вызовы с ключом key
+
+        Args:
+            key: tuple, например ('pdf', 'kp', order_id, order.state_hash())
+            fn: функция без аргументов; результат должен сериализоваться pickle
+            timeout: сколько ждать чужое вычисление (в этом или другом воркере), сек
+
+        Returns:
+            результат fn()
+
+        Raises:
+            SingleFlightTimeout: чужое вычисление не завершилось за timeout
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['leader_total'] += 1
+            else:
+                self._stats['shared_total'] += 1
+
+        if not leader:
+            if not call.event.wait(timeout):
+                raise SingleFlightTimeout('Операция уже выполняется, повторите позже')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_exclusive(key, fn, timeout)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+            self._maybe_reap()
+        return call.result
+
+    def _run_exclusive(self, key, fn, timeout):
+        """Выполнить fn под межпроцессной блокировкой либо взять готовый результат"""
+        if fcntl is None or not self._locks_dir:
+            return fn()
+
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        lock_path = os.path.join(self._locks_dir, f'{digest}.lock')
+        result_path = os.path.join(self._locks_dir, f'{digest}.result')
+
+        lock_file = self._open_locked(lock_path, timeout)
+        try:
+            cached = self._read_result(result_path)
+            if cached is not None:
+                with self._lock:
+                    self._stats['shared_total'] += 1
+                return cached[0]
+
+            result = fn()
+            self._write_result(result_path, result)
+            return result
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    @classmethod
+    def _open_locked(cls, lock_path, timeout):
+        """
+        Открыть и заблокировать файл блокировки
+
+        Файл мог быть удалён уборкой (reap), пока мы ждали: тогда блокировка
+        взята на удалённом файле, и другой воркер может заблокировать новый.
+        Блокировка действительна, только если путь всё ещё ведёт к нашему файлу.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            lock_file = open(lock_path, 'a+b')
+            try:
+                cls._acquire(lock_file, deadline)
+            except BaseException:
+                lock_file.close()
+                raise
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    @staticmethod
+    def _acquire(lock_file, deadline):
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise SingleFlightTimeout('Операция уже выполняется, повторите позже')
+                time.sleep(0.05)
+
+    def _read_result(self, path):
+        """Результат, сохранённый другим воркером не раньше чем result_ttl секунд назад"""
+        try:
+            if time.time() - os.path.getmtime(path) > self._result_ttl:
+                return None
+            with open(path, 'rb') as f:
+                return (pickle.load(f),)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    @staticmethod
+    def _write_result(path, result):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(result, f)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PickleError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _maybe_reap(self):
+        if fcntl is None or not self._locks_dir:
+            return
+        with self._lock:
+            if time.monotonic() - self._last_reap < self._reap_interval:
+                return
+            self._last_reap = time.monotonic()
+        self.reap()
+
+    def reap(self):
+        """
+        Удалить из каталога блокировок результаты старше result_ttl
+        и свободные блокировки того же возраста
+
+        Returns:
+            число удалённых файлов
+        """
+        if fcntl is None or not self._locks_dir:
+            return 0
+        removed = 0
+        now = time.time()
+        for entry in os.scandir(self._locks_dir):
+            try:
+                if now - entry.stat().st_mtime <= self._result_ttl:
+                    continue
+                if entry.name.endswith(('.result', '.tmp')):
+                    os.remove(entry.path)
+                    removed += 1
+                elif entry.name.endswith('.lock') and self._remove_idle_lock(entry.path):
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    @staticmethod
+    def _remove_idle_lock(path):
+        """Удалить файл блокировки, если её сейчас никто не держит"""
+        with open(path, 'a+b') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                os.remove(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return True
+
+    def metrics(self):
+        """Сколько вычислений выполнено и сколько вызовов получили чужой результат"""
+        with self._lock:
+            return dict(self._stats)
+
+
+coalescer = SingleFlight()
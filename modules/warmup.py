@@ -0,0 +1,65 @@
+"""
+Прогрев воркера перед первым запросом
+
+Тяжёлые библиотеки (pandas, openpyxl, ReportLab) импортируются лениво,
+поэтому create_app быстрый. Прогрев делает заранее то, что иначе
+досталось бы первому запросу воркера:
+
+- pdf — ReportLab, шрифты и стили PDF (modules.pdf.theme);
+- prices — карты цен по всем типам систем (pricing.catalog.get_price_map);
+- db — соединение из пула и настройка мапперов SQLAlchemy.
+
+Вызывается из хука gunicorn (gunicorn.conf.py) в каждом воркере, в том
+числе после перезапуска по --max-requests. Этапы — WORKER_WARMUP.
+"""
+
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from extensions import db
+
+
+def _warm_pdf():
+    from modules.pdf.theme import warm_up
+    warm_up()
+
+
+def _warm_prices():
+    from modules.calculator import SYSTEM_TYPES
+    from modules.pricing.catalog import get_price_map
+    for system_type in SYSTEM_TYPES:
+        get_price_map(system_type)
+
+
+def _warm_db():
+    configure_mappers()
+    db.session.execute(text('SELECT 1'))
+
+
+STAGES = {
+    'db': _warm_db,
+    'prices': _warm_prices,
+    'pdf': _warm_pdf,
+}
+
+
+def warm_up_worker(app, stages=None):
+    """
+    Прогреть воркер
+
+    Args:
+        stages: этапы из STAGES (по умолчанию WORKER_WARMUP из конфигурации)
+
+    Returns:
+        dict этап -> секунды
+    """
+    if stages is None:
+        stages = app.config.get('WORKER_WARMUP', tuple(STAGES))
+    timings = {}
+    with app.app_context():
+        for stage in stages:
+            started = time.perf_counter()
+            STAGES[stage]()
+            timings[stage] = time.perf_counter() - started
+        db.session.remove()
+    return timings
@@ -1,7 +1,15 @@
 // order-detail.js - Логика страницы деталей заказа
 
+// Поля для страницы: calculated_data систем не нужен и не загружается
+const ORDER_FIELDS = [
+    'id', 'customer_name', 'city', 'ral_color', 'discount_percent', 'status', 'total_price',
+    'notes', 'bitrix_deal_id', 'systems_count',
+    'systems.position', 'systems.system_type', 'systems.width', 'systems.height',
+    'systems.panels', 'systems.opening', 'systems.price'
+].join(',');
+
 function loadOrder(orderId) {
-    fetch(`/api/orders/${orderId}`)
+    fetch(`/api/orders/${orderId}?fields=${ORDER_FIELDS}`)
         .then(response => response.json())
         .then(data => {
             if (!data.success) {
@@ -3,10 +3,14 @@ import pytest
 from app import create_app
 from extensions import db as _db
 from config import TestingConfig
+from modules.query_audit import query_audit
 
 @pytest.fixture(scope='session')
-def app():
-    app = create_app(TestingConfig)
+def app(tmp_path_factory):
+    class Config(TestingConfig):
+        PDF_EXPORTS_DIR = str(tmp_path_factory.mktemp('exports'))
+
+    app = create_app(Config)
     return app
 
 @pytest.fixture(scope='function')
@@ -19,3 +23,13 @@ def db(app):
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+@pytest.fixture
+def query_budget():
+    """
+    Бюджет SQL для блока: тест падает со списком запросов, если их больше
+
+        with query_budget(3):
+            client.get('/api/orders')
+    """
+    return query_audit.budget
@@ -0,0 +1,295 @@
+# tests/fake_bitrix.py
+"""
+Локальная замена REST API Битрикс24 для интеграционных и нагрузочных тестов
+
+Поддерживает методы, которые использует синхронизация:
+crm.deal.add / update / get, crm.timeline.comment.add,
+disk.folder.uploadfile (двухшаговая загрузка через uploadUrl),
+disk.file.markdeleted и batch (со ссылками $result[...]).
+
+Настраивается задержка ответа, доля случайных ошибок, ошибки для
+конкретных методов и лимит запросов (token bucket, как у портала:
+сверх лимита — HTTP 503 QUERY_LIMIT_EXCEEDED).
+
+    with FakeBitrix(latency=0.05, rate_limit=2, burst=50) as bitrix:
+        os.environ['BITRIX24_WEBHOOK_URL'] = bitrix.webhook_url
+        ...
+        bitrix.stats  # число запросов по методам, отказов по лимиту
+
+Запуск отдельно: python -m tests.fake_bitrix [порт]
+"""
+
+import itertools
+import random
+import re
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+_RESULT_REF = re.compile(r'^\$result\[([^\]]+)\]((?:\[[^\]]+\])*)$')
+
+
+def parse_php_query(query):
+    """'fields[A]=1&id=5' -> {'fields': {'A': '1'}, 'id': '5'}"""
+    data = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        parts = re.findall(r'[^\[\]]+', key)
+        target = data
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return data
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class FakeBitrix:
+    """Сервер-заглушка Битрикс24 в фоновом потоке"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, rate_limit=None, burst=50,
+                 fail_methods=None, port=0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.fail_methods = dict(fail_methods or {})
+        self.port = port
+        self.deals = {}
+        self.files = {}
+        self.comments = []
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'methods': {}}
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._fail_next = []
+        self._pending_uploads = {}
+        self._server = None
+        self._thread = None
+        self.app = self._create_app()
+
+    # ---------- Управление ----------
+
+    def start(self):
+        self._server = make_server('127.0.0.1', self.port, self.app, threaded=True,
+                                   request_handler=_QuietHandler)
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    @property
+    def webhook_url(self):
+        return f'{self.base_url}/rest/1/token/'
+
+    def fail_next(self, count=1, error='QUERY_LIMIT_EXCEEDED'):
+        """Следующие count запросов завершатся ошибкой error"""
+        with self._lock:
+            self._fail_next.extend([error] * count)
+
+    # ---------- Сервер ----------
+
+    def _create_app(self):
+        app = Flask('fake_bitrix')
+
+        @app.route('/rest/<int:user_id>/<token>/<method>', methods=['GET', 'POST'])
+        def rest(user_id, token, method):
+            method = method[:-5] if method.endswith('.json') else method
+            params = request.get_json(silent=True) or parse_php_query(request.get_data(as_text=True))
+            return self._handle_request(method, params)
+
+        @app.route('/upload/<upload_id>', methods=['POST'])
+        def upload(upload_id):
+            error = self._before_request('upload')
+            if error:
+                return error
+            with self._lock:
+                pending = self._pending_uploads.pop(upload_id, None)
+            if pending is None or 'file' not in request.files:
+                return jsonify({'error': 'ERROR_UPLOAD', 'error_description': 'Неизвестный uploadUrl'}), 400
+            content = request.files['file'].read()
+            file_id = next(self._ids)
+            with self._lock:
+                self.files[file_id] = {'ID': file_id, 'NAME': pending['name'], 'FOLDER_ID': pending['folder_id'],
+                                       'SIZE': len(content), 'DELETED': False}
+            return jsonify({'result': self.files[file_id]})
+
+        return app
+
+    def _count(self, method, request=True):
+        """Учесть вызов метода; команды внутри batch не считаются отдельными запросами"""
+        with self._lock:
+            self.stats['requests'] += request
+            self.stats['methods'][method] = self.stats['methods'].get(method, 0) + 1
+
+    def _before_request(self, method):
+        """Задержка, лимит и внедрённые ошибки; ответ с ошибкой или None"""
+        self._count(method)
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            forced = self._fail_next.pop(0) if self._fail_next else None
+            if forced is None and self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_limit)
+                self._updated = now
+                if self._tokens < 1:
+                    forced = 'QUERY_LIMIT_EXCEEDED'
+                else:
+                    self._tokens -= 1
+            if forced is None and self.error_rate and self._random.random() < self.error_rate:
+                forced = 'INTERNAL_SERVER_ERROR'
+
+        if forced is None:
+            return None
+        with self._lock:
+            self.stats['throttled' if forced == 'QUERY_LIMIT_EXCEEDED' else 'errors'] += 1
+        status = 503 if forced in ('QUERY_LIMIT_EXCEEDED', 'INTERNAL_SERVER_ERROR') else 400
+        return jsonify({'error': forced, 'error_description': f'Fake Bitrix: {forced}'}), status
+
+    def _handle_request(self, method, params):
+        error = self._before_request(method)
+        if error:
+            return error
+        try:
+            return jsonify({'result': self._call(method, params), 'time': {'start': time.time()}})
+        except _MethodError as e:
+            return jsonify({'error': e.code, 'error_description': e.description}), 400
+
+    def _call(self, method, params):
+        if method in self.fail_methods:
+            raise _MethodError(self.fail_methods[method], f'Ошибка {method}')
+        handler = self._methods().get(method)
+        if handler is None:
+            raise _MethodError('ERROR_METHOD_NOT_FOUND', f'Метод {method} не найден')
+        return handler(params)
+
+    def _methods(self):
+        return {
+            'crm.deal.add': self._deal_add,
+            'crm.deal.update': self._deal_update,
+            'crm.deal.get': self._deal_get,
+            'crm.timeline.comment.add': self._comment_add,
+            'disk.folder.uploadfile': self._upload_url,
+            'disk.file.markdeleted': self._file_delete,
+            'batch': self._batch,
+        }
+
+    # ---------- Методы ----------
+
+    def _deal_add(self, params):
+        deal_id = next(self._ids)
+        with self._lock:
+            self.deals[deal_id] = dict(params.get('fields') or {}, ID=deal_id)
+        return deal_id
+
+    def _deal_update(self, params):
+        deal_id = int(params.get('id') or 0)
+        with self._lock:
+            if deal_id not in self.deals:
+                raise _MethodError('NOT_FOUND', 'Сделка не найдена')
+            self.deals[deal_id].update(params.get('fields') or {})
+        return True
+
+    def _deal_get(self, params):
+        deal_id = int(params.get('id') or 0)
+        with self._lock:
+            if deal_id not in self.deals:
+                raise _MethodError('NOT_FOUND', 'Сделка не найдена')
+            return dict(self.deals[deal_id])
+
+    def _comment_add(self, params):
+        fields = params.get('fields') or {}
+        if int(fields.get('ENTITY_ID') or 0) not in self.deals:
+            raise _MethodError('NOT_FOUND', 'Сделка не найдена')
+        comment_id = next(self._ids)
+        with self._lock:
+            self.comments.append(dict(fields, ID=comment_id))
+        return comment_id
+
+    def _upload_url(self, params):
+        upload_id = f'u{next(self._ids)}'
+        with self._lock:
+            self._pending_uploads[upload_id] = {'name': params.get('name'), 'folder_id': params.get('id')}
+        return {'field': 'file', 'uploadUrl': f'{self.base_url}/upload/{upload_id}'}
+
+    def _file_delete(self, params):
+        file_id = int(params.get('id') or 0)
+        with self._lock:
+            if file_id not in self.files:
+                raise _MethodError('NOT_FOUND', 'Файл не найден')
+            self.files[file_id]['DELETED'] = True
+        return self.files[file_id]
+
+    def _batch(self, params):
+        cmd = params.get('cmd') or {}
+        halt = str(params.get('halt', 0)) not in ('0', '', 'false')
+        if len(cmd) > 50:
+            raise _MethodError('ERROR_BATCH_LENGTH_EXCEEDED', 'Max batch length exceeded')
+
+        results, errors = {}, {}
+        for name, command in cmd.items():
+            method, _, query = command.partition('?')
+            command_params = self._resolve(parse_php_query(query), results)
+            self._count(method, request=False)
+            try:
+                results[name] = self._call(method, command_params)
+            except _MethodError as e:
+                errors[name] = {'error': e.code, 'error_description': e.description}
+                if halt:
+                    break
+        return {'result': results, 'result_error': errors or [],
+                'result_total': [], 'result_next': [], 'result_time': {}}
+
+    def _resolve(self, value, results):
+        """Подставить $result[name][key] из предыдущих команд batch"""
+        if isinstance(value, dict):
+            return {k: self._resolve(v, results) for k, v in value.items()}
+        match = _RESULT_REF.match(value) if isinstance(value, str) else None
+        if not match:
+            return value
+        resolved = results.get(match.group(1))
+        for key in re.findall(r'\[([^\]]+)\]', match.group(2)):
+            resolved = (resolved or {}).get(key)
+        return resolved
+
+
+class _MethodError(Exception):
+    def __init__(self, code, description):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    server = FakeBitrix(port=port, latency=0.05, rate_limit=2, burst=50).start()
+    print(f'BITRIX24_WEBHOOK_URL={server.webhook_url}')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,10 +1,32 @@
 # tests/test_bitrix.py
 import json
 import os
+import pytest
 from unittest.mock import patch, MagicMock
 
-def test_sync_order_creates_deal(client, db):
+def fake_batch(deal_id=12345):
+    """call_batch, который отвечает как Битрикс24 без ошибок"""
+    calls = []
+
+    def call_batch(commands, halt=False):
+        calls.append(commands)
+        results = {}
+        for name, (method, params) in commands.items():
+            if method == 'crm.deal.add':
+                results[name] = deal_id
+            elif method == 'disk.folder.uploadfile':
+                results[name] = {'uploadUrl': f'https://example.bitrix24.ru/upload/{name}'}
+            else:
+                results[name] = True
+        return results, {}
+
+    call_batch.calls = calls
+    return call_batch
+
+
+def test_sync_order_creates_deal(client, db, monkeypatch):
     """Тест создания сделки в Битрикс24"""
+    monkeypatch.setenv('BITRIX24_FOLDER_ID', '10')
     # Создаём заказ с системой
     response = client.post('/api/orders',
         data=json.dumps({'customer_name': 'Тест Компания', 'city': 'Москва'}),
@@ -19,10 +41,10 @@ def test_sync_order_creates_deal(client, db):
         content_type='application/json')
 
     # Мокируем API Битрикс24
-    with patch('modules.bitrix.routes.create_deal') as mock_create, \
-         patch('modules.bitrix.routes.upload_file_to_bitrix') as mock_upload:
+    batch = fake_batch(12345)
+    with patch('modules.bitrix.sync.call_batch', side_effect=batch), \
+         patch('modules.bitrix.sync.upload_to_url') as mock_upload:
 
-        mock_create.return_value = 12345
         mock_upload.return_value = 67890
         
         # Синхронизируем с Битрикс24
@@ -35,9 +57,18 @@ def test_sync_order_creates_deal(client, db):
         assert data['data']['bitrix_deal_id'] == 12345
         assert len(data['data']['files_uploaded']) == 2
 
+    # Сделка и оба uploadUrl — одним запросом batch, комментарий — после загрузки
+    assert len(batch.calls) == 2
+    methods = [method for method, _ in batch.calls[0].values()]
+    assert methods == ['crm.deal.add', 'disk.folder.uploadfile', 'disk.folder.uploadfile']
+    comment = batch.calls[1][f'comment_{order_id}'][1]
+    assert comment['fields']['ENTITY_ID'] == 12345
+    assert 'КП_' in comment['fields']['COMMENT']
+
 
-def test_sync_order_updates_deal(client, db):
+def test_sync_order_updates_deal(client, db, monkeypatch):
     """Тест обновления существующей сделки"""
+    monkeypatch.setenv('BITRIX24_FOLDER_ID', '10')
     # Создаём заказ с уже установленным bitrix_deal_id
     response = client.post('/api/orders',
         data=json.dumps({'customer_name': 'Тест', 'city': 'СПб'}),
@@ -58,10 +89,10 @@ def test_sync_order_updates_deal(client, db):
         content_type='application/json')
 
     # Мокируем API
-    with patch('modules.bitrix.routes.update_deal') as mock_update, \
-         patch('modules.bitrix.routes.upload_file_to_bitrix') as mock_upload:
+    batch = fake_batch()
+    with patch('modules.bitrix.sync.call_batch', side_effect=batch), \
+         patch('modules.bitrix.sync.upload_to_url') as mock_upload:
 
-        mock_update.return_value = True
         mock_upload.return_value = 11111
         
         response = client.post(f'/api/bitrix/sync/{order_id}')
@@ -71,3 +102,235 @@ def test_sync_order_updates_deal(client, db):
         assert data['success'] == True
         assert data['data']['action'] == 'updated'
         assert data['data']['bitrix_deal_id'] == 99999
+
+    deal_update = batch.calls[0][f'deal_{order_id}']
+    assert deal_update[0] == 'crm.deal.update' and deal_update[1]['id'] == 99999
+
+
+def test_upload_file_from_buffer(monkeypatch):
+    """Загрузка PDF прямо из памяти, без файла на диске"""
+    from io import BytesIO
+    from modules.bitrix.api import upload_file_to_bitrix
+
+    monkeypatch.setenv('BITRIX24_WEBHOOK_URL', 'https://example.bitrix24.ru/rest/1/token/')
+
+    first = MagicMock()
+    first.json.return_value = {'result': {'uploadUrl': 'https://example.bitrix24.ru/upload/1'}}
+    second = MagicMock(status_code=200)
+    second.json.return_value = {'result': {'ID': 555}}
+
+    with patch('modules.bitrix.api.requests.post', side_effect=[first, second]) as mock_post:
+        file_id = upload_file_to_bitrix(BytesIO(b'%PDF-1.4 test'), folder_id=10, filename='KP_1.pdf')
+
+    assert file_id == 555
+    uploaded_name, uploaded_content, _ = mock_post.call_args_list[1].kwargs['files']['file']
+    assert uploaded_name.startswith('KP_1_') and uploaded_name.endswith('.pdf')
+    assert uploaded_content == b'%PDF-1.4 test'
+
+
+def test_sync_skips_unchanged_parts(client, db, monkeypatch):
+    """Повторная синхронизация без изменений — ни одного запроса; после изменения — только изменившееся"""
+    monkeypatch.setenv('BITRIX24_FOLDER_ID', '10')
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Повтор', 'city': 'Казань'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    client.post(f'/api/orders/{order_id}/systems',
+        data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+        content_type='application/json')
+
+    batch = fake_batch(777)
+    with patch('modules.bitrix.sync.call_batch', side_effect=batch), \
+         patch('modules.bitrix.sync.upload_to_url', side_effect=[1, 2, 3, 4]):
+        client.post(f'/api/bitrix/sync/{order_id}')
+        response = client.post(f'/api/bitrix/sync/{order_id}')
+        assert json.loads(response.data)['data']['action'] == 'unchanged'
+        assert len(batch.calls) == 2
+
+        # Примечание не попадает в сделку, но меняет документы
+        client.put(f'/api/orders/{order_id}',
+            data=json.dumps({'notes': 'Новый контакт'}),
+            content_type='application/json')
+        response = client.post(f'/api/bitrix/sync/{order_id}')
+
+    data = json.loads(response.data)['data']
+    assert data['action'] == 'updated'
+    assert len(data['files_uploaded']) == 2
+    methods = sorted(method for method, _ in batch.calls[-1].values())
+    assert 'crm.deal.update' not in methods
+    assert methods.count('disk.file.markdeleted') == 2
+
+    from models import BitrixSyncState
+    state = db.session.get(BitrixSyncState, order_id)
+    assert state.deal_id == 777
+    assert {f['id'] for f in state.files.values()} == {3, 4}
+
+
+def test_sync_keeps_old_document_when_upload_fails(client, db, monkeypatch):
+    """Загрузка не удалась — прежний файл не удаляется, комментарий только о загруженном"""
+    monkeypatch.setenv('BITRIX24_FOLDER_ID', '10')
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Сбой', 'city': 'Казань'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+
+    batch = fake_batch(888)
+    with patch('modules.bitrix.sync.call_batch', side_effect=batch), \
+         patch('modules.bitrix.sync.upload_to_url', side_effect=[1, 2, 3, ConnectionError('обрыв')]):
+        client.post(f'/api/bitrix/sync/{order_id}')
+        client.put(f'/api/orders/{order_id}', data=json.dumps({'notes': 'Изменение'}),
+                   content_type='application/json')
+        response = client.post(f'/api/bitrix/sync/{order_id}')
+
+    assert response.status_code == 500
+    followup = batch.calls[-1]
+    deleted = [params['id'] for method, params in followup.values() if method == 'disk.file.markdeleted']
+    assert deleted == [1]
+    comment = followup[f'comment_{order_id}'][1]['fields']['COMMENT']
+    assert 'КП_' in comment and 'Разблюдовка_' not in comment
+
+    from models import BitrixSyncState
+    state = db.session.get(BitrixSyncState, order_id)
+    assert state.files['kp']['id'] == 3
+    assert state.files['spec']['id'] == 2
+
+
+def test_deleted_order_drops_sync_state(client, db):
+    """Состояние синхронизации удаляется вместе с заказом"""
+    from models import BitrixSyncState
+    response = client.post('/api/orders', data=json.dumps({'customer_name': 'Удаляемый'}),
+                           content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    db.session.add(BitrixSyncState(order_id=order_id, deal_id=7, files={'kp': {'id': 1, 'hash': 'x'}}))
+    db.session.commit()
+
+    client.delete(f'/api/orders/{order_id}')
+    db.session.expire_all()
+    assert db.session.get(BitrixSyncState, order_id) is None
+
+
+def test_bulk_sync_packs_orders_into_batches(client, db, monkeypatch):
+    """Массовая синхронизация: команды заказов упакованы по 50 в batch, ошибка — у своего заказа"""
+    from modules.bitrix.api import BitrixError
+
+    monkeypatch.setenv('BITRIX24_FOLDER_ID', '10')
+    order_ids = []
+    for i in range(20):
+        response = client.post('/api/orders',
+            data=json.dumps({'customer_name': f'Клиент {i}'}),
+            content_type='application/json')
+        order_ids.append(json.loads(response.data)['data']['id'])
+
+    ok_batch = fake_batch(500)
+
+    def call_batch(commands, halt=False):
+        results, errors = ok_batch(commands)
+        broken = f'deal_{order_ids[0]}'
+        if broken in commands:
+            errors[broken] = BitrixError('ERROR_CORE', 'Сделка заблокирована')
+        return results, errors
+
+    with patch('modules.bitrix.sync.call_batch', side_effect=call_batch), \
+         patch('modules.bitrix.sync.upload_to_url', return_value=1):
+        response = client.post('/api/bitrix/sync',
+            data=json.dumps({'ids': order_ids}),
+            content_type='application/json')
+
+    data = json.loads(response.data)
+    assert data['data']['batches'] == 2  # 20 заказов × 3 команды
+    assert all(len(commands) <= 50 for commands in ok_batch.calls)
+    results = data['data']['results']
+    assert results[str(order_ids[0])]['success'] is False
+    assert all(results[str(i)]['success'] for i in order_ids[1:])
+    assert data['success'] is False
+
+
+def test_build_query_for_batch():
+    from modules.bitrix.api import build_query
+
+    query = build_query({'id': 5, 'fields': {'TITLE': 'A&B', 'ENTITY_ID': '$result[deal]'}})
+    assert query == 'id=5&fields[TITLE]=A%26B&fields[ENTITY_ID]=$result[deal]'
+
+
+def test_rate_limiter_shared_between_workers(tmp_path):
+    """Две корзины с одним файлом (два воркера) делят общий запас запросов"""
+    from modules.bitrix.limiter import TokenBucket, RateLimitTimeout
+
+    path = str(tmp_path / 'bucket.sqlite')
+    first = TokenBucket(rate=0.01, burst=2, path=path)
+    second = TokenBucket(rate=0.01, burst=2, path=path)
+    first.init_storage()
+
+    first.acquire()
+    second.acquire()
+    with pytest.raises(RateLimitTimeout):
+        first.acquire(timeout=0.1)
+
+
+def test_rate_limiter_adapts_to_limit_errors(monkeypatch):
+    """QUERY_LIMIT_EXCEEDED снижает скорость и повторяет запрос; успехи возвращают скорость"""
+    from modules.bitrix import api
+    from modules.bitrix.limiter import TokenBucket
+
+    limiter = TokenBucket(rate=1000, burst=10)
+    monkeypatch.setattr(api, 'rate_limiter', limiter)
+    monkeypatch.setenv('BITRIX24_WEBHOOK_URL', 'https://example.bitrix24.ru/rest/1/token/')
+
+    throttled = MagicMock(status_code=503)
+    throttled.json.return_value = {'error': 'QUERY_LIMIT_EXCEEDED', 'error_description': 'Too many requests'}
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {'result': {'ID': 7}}
+
+    with patch('modules.bitrix.api.requests.post', side_effect=[throttled, ok]) as mock_post:
+        assert api.call_method('crm.deal.get', {'id': 7}) == {'ID': 7}
+
+    assert mock_post.call_count == 2
+    assert limiter.metrics()['limit_errors'] == 1
+    assert limiter.current_rate() < 1000
+
+    for _ in range(20):
+        limiter.reward()
+    assert limiter.current_rate() == 1000
+
+
+def test_limit_error_after_retries(monkeypatch):
+    """QUERY_LIMIT_EXCEEDED на каждую попытку: каждая штрафует скорость, затем BitrixError"""
+    from modules.bitrix import api
+    from modules.bitrix.limiter import TokenBucket
+
+    limiter = TokenBucket(rate=1000, burst=10)
+    monkeypatch.setattr(api, 'rate_limiter', limiter)
+    monkeypatch.setenv('BITRIX24_WEBHOOK_URL', 'https://example.bitrix24.ru/rest/1/token/')
+
+    throttled = MagicMock(status_code=503)
+    throttled.json.return_value = {'error': 'QUERY_LIMIT_EXCEEDED', 'error_description': 'Too many requests'}
+
+    with patch('modules.bitrix.api.requests.post', return_value=throttled) as mock_post:
+        with pytest.raises(api.BitrixError) as error:
+            api.call_method('crm.deal.get', {'id': 7})
+
+    assert error.value.code == 'QUERY_LIMIT_EXCEEDED'
+    assert mock_post.call_count == api.MAX_LIMIT_RETRIES + 1
+    assert limiter.metrics()['limit_errors'] == api.MAX_LIMIT_RETRIES + 1
+
+
+def test_rate_limiter_metrics_do_not_lock(tmp_path):
+    """Метрики читают корзину без блокировки записи: не ждут чужой транзакции"""
+    import sqlite3
+    import time
+    from modules.bitrix.limiter import TokenBucket
+
+    path = str(tmp_path / 'bucket.sqlite')
+    bucket = TokenBucket(rate=5, burst=2, path=path)
+    bucket.init_storage()
+    bucket.acquire()
+
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        started = time.monotonic()
+        assert bucket.metrics()['rate'] == 5
+        assert time.monotonic() - started < 1
+    finally:
+        writer.execute('ROLLBACK')
+        writer.close()
@@ -0,0 +1,185 @@
+# tests/test_bitrix_fake.py
+"""Синхронизация с Битрикс24 целиком: реальный HTTP-клиент против tests/fake_bitrix.py"""
+import json
+import pytest
+from modules.bitrix.limiter import rate_limiter
+from tests.fake_bitrix import FakeBitrix
+
+
+@pytest.fixture
+def bitrix(monkeypatch):
+    with FakeBitrix() as server:
+        monkeypatch.setenv('BITRIX24_WEBHOOK_URL', server.webhook_url)
+        monkeypatch.setenv('BITRIX24_FOLDER_ID', '10')
+        # Быстрая корзина, чтобы штраф за QUERY_LIMIT_EXCEEDED не тормозил тест
+        monkeypatch.setattr(rate_limiter, 'rate', 100.0)
+        monkeypatch.setattr(rate_limiter, 'min_rate', 10.0)
+        monkeypatch.setattr(rate_limiter, '_last_rate', 100.0)
+        monkeypatch.setattr(rate_limiter, '_memory', None)
+        yield server
+    rate_limiter._memory = None
+
+
+def create_order(client, name='Тест Компания'):
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': name, 'city': 'Москва'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    client.post(f'/api/orders/{order_id}/systems',
+        data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+        content_type='application/json')
+    return order_id
+
+
+def test_sync_against_fake_bitrix(client, db, bitrix):
+    """Создание сделки, пропуск неизменившегося заказа и обновление"""
+    order_id = create_order(client)
+
+    data = json.loads(client.post(f'/api/bitrix/sync/{order_id}').data)
+    assert data['success'] is True
+    assert data['data']['action'] == 'created'
+    deal = bitrix.deals[data['data']['bitrix_deal_id']]
+    assert deal['TITLE'] == 'Заказ - Тест Компания'
+    assert len(bitrix.files) == 2
+    assert int(bitrix.comments[0]['ENTITY_ID']) == deal['ID']
+    # batch, две загрузки файлов и batch с комментарием
+    assert bitrix.stats['methods']['batch'] == 2
+    assert bitrix.stats['methods']['upload'] == 2
+
+    requests_before = bitrix.stats['requests']
+    data = json.loads(client.post(f'/api/bitrix/sync/{order_id}').data)
+    assert data['data']['action'] == 'unchanged'
+    assert bitrix.stats['requests'] == requests_before
+
+    client.put(f'/api/orders/{order_id}', data=json.dumps({'discount_percent': 10}),
+               content_type='application/json')
+    data = json.loads(client.post(f'/api/bitrix/sync/{order_id}').data)
+    assert data['data']['action'] == 'updated'
+    order = json.loads(client.get(f'/api/orders/{order_id}').data)['data']
+    assert float(bitrix.deals[deal['ID']]['OPPORTUNITY']) == pytest.approx(order['total_price'])
+    # Прежние версии документов ушли в корзину
+    assert sum(f['DELETED'] for f in bitrix.files.values()) == 2
+
+
+def test_sync_retries_query_limit(client, db, bitrix):
+    """QUERY_LIMIT_EXCEEDED от портала: запрос повторяется, скорость снижается"""
+    order_ids = [create_order(client, f'Компания {i}') for i in range(3)]
+    errors_before = rate_limiter.metrics()['limit_errors']
+    bitrix.fail_next(2)
+
+    response = client.post('/api/bitrix/sync', data=json.dumps({'ids': order_ids}),
+                           content_type='application/json')
+    data = json.loads(response.data)
+
+    assert data['success'] is True
+    assert data['data']['batches'] == 1
+    assert len(bitrix.deals) == 3
+    assert bitrix.stats['throttled'] == 2
+    assert rate_limiter.metrics()['limit_errors'] - errors_before == 2
+    assert rate_limiter.current_rate() < 100.0
+
+
+def test_deal_events_update_order_status(app, client, db, bitrix, monkeypatch):
+    """ONCRMDEALUPDATE: серия событий по сделке — одно чтение стадии и новый статус заказа"""
+    from modules.bitrix.events import deal_events
+    monkeypatch.setitem(app.config, 'BITRIX_APP_TOKEN', 'secret')
+    order_id = create_order(client)
+    deal_id = json.loads(client.post(f'/api/bitrix/sync/{order_id}').data)['data']['bitrix_deal_id']
+    bitrix.deals[deal_id]['STAGE_ID'] = 'C0:EXECUTING'
+
+    def event(deal, token='secret'):
+        return client.post('/api/bitrix/events', data={
+            'event': 'ONCRMDEALUPDATE', 'data[FIELDS][ID]': str(deal), 'auth[application_token]': token
+        })
+
+    assert event(deal_id, token='wrong').status_code == 403
+
+    monkeypatch.setattr(deal_events, 'run_async', True)
+    monkeypatch.setattr(deal_events, 'debounce', 0.2)
+    deduplicated = deal_events.metrics()['deduplicated_total']
+    for _ in range(5):
+        assert event(deal_id).status_code == 200
+    assert event(999999).status_code == 200  # сделка без заказа
+    # Пул очереди однопоточный: пустая задача завершится после обработки
+    deal_events._executor.submit(lambda: None).result(timeout=10)
+
+    assert deal_events.metrics()['deduplicated_total'] - deduplicated == 4
+    assert bitrix.stats['methods']['crm.deal.get'] == 1
+    order = json.loads(client.get(f'/api/orders/{order_id}').data)['data']
+    assert order['status'] == 'in_production'
+
+
+def test_deal_events_retry_after_error(app, client, db, bitrix, monkeypatch):
+    """Ошибка чтения стадий: сделка остаётся в очереди и обрабатывается повтором"""
+    import time
+    from modules.bitrix import events
+    from modules.bitrix.events import deal_events
+    monkeypatch.setitem(app.config, 'BITRIX_APP_TOKEN', 'secret')
+    order_id = create_order(client)
+    deal_id = json.loads(client.post(f'/api/bitrix/sync/{order_id}').data)['data']['bitrix_deal_id']
+    bitrix.deals[deal_id]['STAGE_ID'] = 'C0:EXECUTING'
+
+    calls = []
+
+    def flaky_call_batch(commands, halt=False):
+        calls.append(commands)
+        if len(calls) == 1:
+            raise ConnectionError('портал недоступен')
+        return events_call_batch(commands, halt)
+
+    events_call_batch = events.call_batch
+    monkeypatch.setattr(events, 'call_batch', flaky_call_batch)
+    monkeypatch.setattr(deal_events, 'run_async', True)
+    monkeypatch.setattr(deal_events, 'debounce', 0.05)
+    failed = deal_events.metrics()['failed_total']
+
+    response = client.post('/api/bitrix/events', data={
+        'event': 'ONCRMDEALUPDATE', 'data[FIELDS][ID]': str(deal_id), 'auth[application_token]': 'secret'
+    })
+    assert response.status_code == 200
+
+    deadline = time.monotonic() + 10
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    deal_events._executor.submit(lambda: None).result(timeout=10)
+
+    assert len(calls) == 2
+    assert deal_events.metrics()['failed_total'] - failed == 1
+    assert deal_events.metrics()['pending'] == 0
+    db.session.expire_all()
+    order = json.loads(client.get(f'/api/orders/{order_id}').data)['data']
+    assert order['status'] == 'in_production'
+
+
+def test_deal_cache(client, db, bitrix):
+    """get_deal_by_id: повторное чтение из кэша, своя синхронизация и update_deal сбрасывают запись"""
+    from modules.bitrix.api import get_deal_by_id, update_deal
+    from modules.bitrix.cache import deal_cache
+    order_id = create_order(client)
+    deal_id = json.loads(client.post(f'/api/bitrix/sync/{order_id}').data)['data']['bitrix_deal_id']
+    hits = deal_cache.metrics()['hits']
+
+    assert get_deal_by_id(deal_id)['ID'] == deal_id
+    assert get_deal_by_id(deal_id)['ID'] == deal_id
+    assert bitrix.stats['methods']['crm.deal.get'] == 1
+    assert deal_cache.metrics()['hits'] - hits == 1
+
+    client.put(f'/api/orders/{order_id}', data=json.dumps({'customer_name': 'Новое имя'}),
+               content_type='application/json')
+    client.post(f'/api/bitrix/sync/{order_id}')
+    opportunity = get_deal_by_id(deal_id)['OPPORTUNITY']
+    assert bitrix.stats['methods']['crm.deal.get'] == 2
+    assert opportunity == bitrix.deals[deal_id]['OPPORTUNITY']
+
+    # Изменение полученной сделки не портит кэш
+    get_deal_by_id(deal_id)['OPPORTUNITY'] = -1
+    assert get_deal_by_id(deal_id)['OPPORTUNITY'] == opportunity
+
+    # update_deal сбрасывает запись после ответа портала
+    update_deal(deal_id, 12345)
+    assert float(get_deal_by_id(deal_id)['OPPORTUNITY']) == 12345
+    assert bitrix.stats['methods']['crm.deal.get'] == 3
+
+    metrics = json.loads(client.get('/api/bitrix/metrics').data)['data']['deal_cache']
+    assert metrics['remote_calls'] >= 2
+    assert 0 < metrics['hit_ratio'] < 1
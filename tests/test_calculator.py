@@ -22,3 +22,38 @@ def test_calculate_slider_l():
 def test_calculate_unknown_system():
     with pytest.raises(ValueError):
         calculate_system({'system_type': 'Unknown'})
+
+def test_calculation_profile_stages():
+    from modules.calculator.profiling import profile_calculation
+    with profile_calculation(memory=True) as profile:
+        calculate_system({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3})
+
+    report = profile.report()
+    stages = [entry['stage'] for entry in report]
+    assert stages[0] == 'tracks' and stages[-1] == 'result'
+    assert len(stages) == 12
+    assert all('alloc_bytes' in entry and entry['ms'] >= 0 for entry in report)
+
+def test_calculation_profile_tracing_shared_between_threads():
+    """tracemalloc выключается только после последнего профиля с памятью"""
+    import threading
+    import tracemalloc
+    from modules.calculator.profiling import profile_calculation
+
+    entered, release = threading.Event(), threading.Event()
+
+    def worker():
+        with profile_calculation(memory=True):
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    entered.wait(5)
+    with profile_calculation(memory=True) as profile:
+        release.set()
+        thread.join(5)
+        assert tracemalloc.is_tracing()
+        calculate_system({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3})
+    assert not tracemalloc.is_tracing()
+    assert 'alloc_bytes' in profile.report()[-1]
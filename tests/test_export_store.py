@@ -0,0 +1,104 @@
+# tests/test_export_store.py
+import os
+import threading
+import time
+from modules.export_store import ExportStore
+
+
+def make_store(tmp_path, max_kb=10, max_age_days=30):
+    store = ExportStore()
+    store.root = str(tmp_path)
+    store.max_bytes = max_kb * 1024
+    store.max_age = max_age_days * 86400
+    store.init_index()
+    return store
+
+
+def test_lru_eviction_over_quota(tmp_path):
+    store = make_store(tmp_path, max_kb=10)
+    store.put('a.pdf', b'a' * 4096)
+    store.put('b.pdf', b'b' * 4096)
+    time.sleep(0.01)
+    assert store.get('a.pdf') is not None  # a используется чаще b
+
+    store.put('c.pdf', b'c' * 4096)
+
+    assert store.get('b.pdf') is None
+    assert not os.path.exists(store.path('b.pdf'))
+    assert store.get('a.pdf') == b'a' * 4096
+    assert store.report()['bytes'] == 8192
+
+
+def test_expired_files_removed(tmp_path):
+    store = make_store(tmp_path)
+    store.put('cache/old.pdf', b'old')
+    with store._connect() as conn:
+        conn.execute("UPDATE entries SET created = created - 40 * 86400 WHERE key = 'cache/old.pdf'")
+
+    assert store.prune() == (1, 3)
+    assert store.get('cache/old.pdf') is None
+
+
+def test_prune_only_over_threshold(tmp_path, monkeypatch):
+    """put запускает вытеснение, только когда квота или возраст превышены"""
+    store = make_store(tmp_path, max_kb=10)
+    calls = []
+    prune = store.prune
+    monkeypatch.setattr(store, 'prune', lambda **kw: calls.append(kw) or prune(**kw))
+
+    store.put('a.pdf', b'a' * 4096)
+    store.put('a.pdf', b'a' * 4096)  # перезапись не увеличивает размер
+    store.put('b.pdf', b'b' * 4096)
+    assert calls == []
+    assert store.report()['bytes'] == 8192
+
+    store.put('c.pdf', b'c' * 4096)
+    assert calls == [{'keep': 'c.pdf'}]
+    assert store.report()['bytes'] == 8192
+
+
+def test_prune_keeps_file_written_concurrently(tmp_path):
+    """put того же ключа во время вытеснения: файл и запись индекса остаются вместе"""
+    store = make_store(tmp_path, max_kb=100)
+    store.put('k.pdf', b'old')
+    time.sleep(0.01)
+    store.put('other.pdf', b'x' * 10)
+
+    remove_file = store._remove_file
+    writer = threading.Thread(target=store.put, args=('k.pdf', b'new'))
+
+    def remove_with_concurrent_put(key):
+        if key == 'k.pdf' and not writer.is_alive():
+            writer.start()
+            writer.join(0.3)  # put ждёт блокировку индекса, пока идёт вытеснение
+        remove_file(key)
+
+    store._remove_file = remove_with_concurrent_put
+    assert store.prune(max_bytes=10) == (1, 3)
+    writer.join(10)
+
+    assert store.get('k.pdf') == b'new'
+
+
+def test_reindex_and_missing_files(tmp_path):
+    store = make_store(tmp_path)
+    (tmp_path / 'legacy.pdf').write_bytes(b'x' * 100)
+    store.put('new.pdf', b'y')
+    os.remove(store.path('new.pdf'))
+
+    assert store.open_path('new.pdf') is None
+    assert store.reindex() == 1
+    assert store.get('legacy.pdf') == b'x' * 100
+
+
+def test_cli_report_and_prune(app):
+    runner = app.test_cli_runner()
+    store = app.extensions['export_store']
+    store.put('cli.pdf', b'z' * 2048)
+
+    result = runner.invoke(args=['exports', 'report'])
+    assert 'files:' in result.output
+
+    result = runner.invoke(args=['exports', 'prune', '--max-mb', '0'])
+    assert 'Удалено файлов' in result.output
+    assert store.report()['files'] == 0
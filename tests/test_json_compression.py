@@ -0,0 +1,74 @@
+# tests/test_json_compression.py
+import gzip
+import json
+from datetime import datetime
+from decimal import Decimal
+from flask import Flask
+from config import TestingConfig
+from modules import json_provider
+from modules.json_provider import OrjsonProvider, StdlibJSONProvider
+
+
+def _provider_app(name):
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    app.config['JSON_PROVIDER'] = name
+    json_provider.init_app(app)
+    return app
+
+
+def test_providers_give_same_json():
+    """orjson и стандартный json: одинаковые данные, дата в ISO, кириллица без экранирования"""
+    data = {'customer': 'Тест', 'created_at': datetime(2024, 5, 1, 12, 30), 'price': Decimal('10.50'),
+            'systems': [{'calculated_data': {'panels': 3, 1: 'ключ-число'}}]}
+
+    results = {}
+    for name in ('orjson', 'stdlib'):
+        app = _provider_app(name)
+        assert isinstance(app.json, OrjsonProvider if name == 'orjson' else StdlibJSONProvider)
+        with app.app_context():
+            body = app.json.response(data).get_data()
+        assert 'Тест'.encode('utf-8') in body
+        results[name] = json.loads(body)
+
+    assert results['orjson'] == results['stdlib']
+    assert results['orjson']['created_at'] == '2024-05-01T12:30:00'
+    assert results['orjson']['price'] == '10.50'
+
+
+def test_orjson_provider_parses_request(client, db):
+    """Тело запроса разбирается orjson, неверный JSON — ошибка 400"""
+    response = client.post('/api/orders', data=json.dumps({'customer_name': 'Иванов'}),
+                           content_type='application/json')
+    assert response.status_code == 201
+    assert json.loads(response.data)['data']['customer_name'] == 'Иванов'
+
+    response = client.post('/api/orders', data='{"customer_name": ', content_type='application/json')
+    assert response.status_code == 400
+
+
+def test_compression(client, db):
+    """Крупный JSON и PDF сжимаются gzip по Accept-Encoding, мелкие ответы — нет"""
+    response = client.post('/api/orders', data=json.dumps({'customer_name': 'Тест'}),
+                           content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    for _ in range(5):
+        client.post(f'/api/orders/{order_id}/systems',
+                    data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+                    content_type='application/json')
+
+    plain = client.get(f'/api/orders/{order_id}')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    compressed = client.get(f'/api/orders/{order_id}', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert int(compressed.headers['Content-Length']) < len(plain.data)
+    assert json.loads(gzip.decompress(compressed.data)) == json.loads(plain.data)
+
+    small = client.get('/health', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+    pdf = client.get(f'/api/orders/{order_id}/pdf/kp', headers={'Accept-Encoding': 'gzip'})
+    assert pdf.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(pdf.data).startswith(b'%PDF')
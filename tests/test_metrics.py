@@ -0,0 +1,51 @@
+# tests/test_metrics.py
+import json
+from modules.metrics import RequestMetrics
+
+
+def test_server_timing_and_metrics_endpoint(client, db):
+    """Заголовок Server-Timing и метрики запроса в /metrics"""
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Тест'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+
+    response = client.post(f'/api/orders/{order_id}/systems',
+        data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+        content_type='application/json')
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert 'calc;dur=' in timing
+    assert 'app;dur=' in timing
+
+    text = client.get('/metrics').data.decode('utf-8')
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert 'http_requests_total{endpoint="orders.add_system",method="POST",status="201"} 1' in text
+    assert 'stage_duration_seconds_count{stage="calculator"}' in text
+    assert 'db_statements_total{endpoint="orders.add_system"}' in text
+
+
+def test_metrics_aggregate_across_workers(tmp_path):
+    """Два воркера с общим файлом: /metrics отдаёт сумму, гистограмма накопительная"""
+    workers = []
+    for _ in range(2):
+        metrics = RequestMetrics()
+        metrics.path = str(tmp_path / 'metrics.sqlite')
+        metrics.init_storage()
+        workers.append(metrics)
+
+    workers[0].inc('http_requests_total', {'endpoint': 'a', 'method': 'GET', 'status': '200'})
+    workers[1].inc('http_requests_total', {'endpoint': 'a', 'method': 'GET', 'status': '200'}, 2)
+    workers[0].observe('stage_duration_seconds', {'stage': 'bitrix'}, 0.2)
+    workers[1].observe('stage_duration_seconds', {'stage': 'bitrix'}, 3.0)
+    workers[1].flush()
+
+    text = workers[0].render()
+    assert 'http_requests_total{endpoint="a",method="GET",status="200"} 3' in text
+    assert 'stage_duration_seconds_bucket{stage="bitrix",le="0.25"} 1' in text
+    assert 'stage_duration_seconds_bucket{stage="bitrix",le="+Inf"} 2' in text
+    assert 'stage_duration_seconds_count{stage="bitrix"} 2' in text
+    # Корзины идут по возрастанию границы
+    lines = [line for line in text.splitlines() if line.startswith('stage_duration_seconds_bucket')]
+    assert lines[0] == 'stage_duration_seconds_bucket{stage="bitrix",le="0.005"} 0'
+    assert '+Inf' in lines[-1]
@@ -101,3 +101,174 @@ def test_add_system_to_order(client, db):
     assert response.status_code == 201
     assert data['data']['position'] == 1
     assert data['data']['system_type'] == 'Slider L'
+
+
+def test_add_system_with_calculation_profile(client, db):
+    """Заголовок X-Calc-Profile: этапы расчёта в ответе и в /metrics"""
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Тест'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+
+    response = client.post(f'/api/orders/{order_id}/systems',
+        data=json.dumps({'system_type': 'JV Line', 'width': 3000, 'height': 2500, 'panels': 3}),
+        content_type='application/json', headers={'X-Calc-Profile': '1'})
+    data = json.loads(response.data)
+    assert response.status_code == 201
+    assert [entry['stage'] for entry in data['profile']][-1] == 'result'
+
+    plain = client.post(f'/api/orders/{order_id}/systems',
+        data=json.dumps({'system_type': 'JV Line', 'width': 3000, 'height': 2500, 'panels': 3}),
+        content_type='application/json')
+    assert 'profile' not in json.loads(plain.data)
+
+    text = client.get('/metrics').data.decode('utf-8')
+    assert 'calculator_stage_seconds_count{stage="result",system="JV Line"}' in text
+
+def test_calculation_profile_header_gated(app, client, db, monkeypatch):
+    """Без включённого заголовка или с неверным токеном X-Calc-Profile игнорируется"""
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Тест'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+
+    def add(value):
+        response = client.post(f'/api/orders/{order_id}/systems',
+            data=json.dumps({'system_type': 'JV Line', 'width': 3000, 'height': 2500, 'panels': 3}),
+            content_type='application/json', headers={'X-Calc-Profile': value})
+        return 'profile' in json.loads(response.data)
+
+    monkeypatch.setitem(app.config, 'CALC_PROFILE_HEADER', False)
+    assert not add('1')
+
+    monkeypatch.setitem(app.config, 'CALC_PROFILE_HEADER', True)
+    monkeypatch.setitem(app.config, 'CALC_PROFILE_TOKEN', 'secret')
+    assert not add('1')
+    assert add('secret')
+
+def test_add_system_prices_from_catalog(client, db):
+    """Цена системы и сумма заказа — по прайсу системы; артикулы без цены перечислены"""
+    from modules.calculator import calculate_system
+    from modules.calculator.bom import iter_bom
+
+    params = {'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}
+    bom = [(item['code'], qty or 0) for _, item, qty, _ in iter_bom(calculate_system(dict(params)))
+           if item.get('code')]
+    codes = sorted({code for code, _ in bom})
+    unpriced = codes[-1]
+    for i, code in enumerate(codes[:-1]):
+        client.post('/api/prices', data=json.dumps({
+            'article': code, 'name': f'Позиция {i}', 'price': 100 + i, 'category': 'Тест',
+            'system_types': ['Slider L']
+        }), content_type='application/json')
+    prices = {code: 100 + i for i, code in enumerate(codes[:-1])}
+    expected = round(sum(prices.get(code, 0) * qty for code, qty in bom), 2)
+
+    response = client.post('/api/orders', data=json.dumps({'customer_name': 'Тест'}),
+                           content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    for _ in range(2):
+        response = client.post(f'/api/orders/{order_id}/systems', data=json.dumps(params),
+                               content_type='application/json')
+        system = json.loads(response.data)['data']
+        assert system['price'] == expected
+        assert system['calculated_data']['summary']['missing_articles'] == [unpriced]
+
+    order = json.loads(client.get(f'/api/orders/{order_id}').data)['data']
+    assert expected > 0
+    assert order['total_price'] == pytest.approx(2 * expected)
+
+
+def _order_with_systems(client, count):
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Тест', 'city': 'Москва'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    for i in range(count):
+        client.post(f'/api/orders/{order_id}/systems',
+            data=json.dumps({'system_type': 'Slider L', 'width': 3000 + i, 'height': 2500, 'panels': 3}),
+            content_type='application/json')
+    return order_id
+
+def test_get_order_default_fields_unchanged(client, db, app):
+    """Без параметров заказ отдаётся как Order.to_dict(include_systems=True)"""
+    from models import Order
+    order_id = _order_with_systems(client, 2)
+
+    data = json.loads(client.get(f'/api/orders/{order_id}').data)['data']
+    listed = json.loads(client.get('/api/orders').data)['data'][0]
+    with app.app_context():
+        order = db.session.get(Order, order_id)
+        assert data == order.to_dict(include_systems=True)
+        assert listed == order.to_dict()
+
+def test_sparse_fields(client, db, query_budget):
+    """fields/include: только запрошенные поля, тяжёлые колонки не читаются"""
+    order_id = _order_with_systems(client, 3)
+
+    with query_budget(3) as counter:
+        response = client.get(f'/api/orders/{order_id}?fields=id,status,systems.position,systems.price')
+    data = json.loads(response.data)['data']
+    assert set(data) == {'id', 'status', 'systems'}
+    assert [set(s) for s in data['systems']] == [{'position', 'price'}] * 3
+    assert not any('calculated_data' in s or 'notes' in s for s in counter.statements)
+
+    data = json.loads(client.get('/api/orders?fields=id,systems_count&include=systems.position').data)['data']
+    assert data == [{'id': order_id, 'systems_count': 3, 'systems': [{'position': p} for p in (1, 2, 3)]}]
+
+    response = client.get(f'/api/orders/{order_id}?fields=id,password')
+    assert response.status_code == 400
+    assert 'password' in json.loads(response.data)['error']
+
+def test_systems_columnar(client, db):
+    """Список систем заказа объектами и столбцами"""
+    order_id = _order_with_systems(client, 3)
+
+    rows = json.loads(client.get(f'/api/orders/{order_id}/systems?fields=position,width').data)
+    assert rows['data'] == [{'position': 1, 'width': 3000}, {'position': 2, 'width': 3001},
+                            {'position': 3, 'width': 3002}]
+
+    columns = json.loads(client.get(f'/api/orders/{order_id}/systems?fields=position,width&format=columnar').data)
+    assert columns['data'] == {'position': [1, 2, 3], 'width': [3000, 3001, 3002]}
+    assert columns['total'] == 3
+
+    assert client.get('/api/orders/999/systems').status_code == 404
+    assert client.get(f'/api/orders/{order_id}/systems?format=xml').status_code == 400
+
+def test_order_etag_not_modified(client, db, query_budget):
+    """If-None-Match с текущим ETag: 304 одним запросом по первичному ключу, без систем"""
+    order_id = _order_with_systems(client, 2)
+
+    response = client.get(f'/api/orders/{order_id}')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    with query_budget(1) as counter:
+        response = client.get(f'/api/orders/{order_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert not any('order_systems' in s for s in counter.statements)
+
+    # Сжатый ответ отдаёт слабый ETag — он тоже подходит
+    weak = client.get(f'/api/orders/{order_id}', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    assert weak == 'W/' + etag
+    assert client.get(f'/api/orders/{order_id}', headers={'If-None-Match': weak}).status_code == 304
+
+def test_order_etag_changes_with_systems(client, db):
+    """ETag меняется при добавлении и удалении системы, даже если сумма заказа прежняя"""
+    order_id = _order_with_systems(client, 1)
+    etags = [client.get(f'/api/orders/{order_id}').headers['ETag']]
+
+    client.post(f'/api/orders/{order_id}/systems',
+        data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+        content_type='application/json')
+    etags.append(client.get(f'/api/orders/{order_id}').headers['ETag'])
+    client.delete(f'/api/orders/{order_id}/systems/2')
+    etags.append(client.get(f'/api/orders/{order_id}').headers['ETag'])
+    client.put(f'/api/orders/{order_id}', data=json.dumps({'notes': 'Звонить заранее'}),
+               content_type='application/json')
+    etags.append(client.get(f'/api/orders/{order_id}/systems').headers['ETag'])
+
+    assert len(set(etags)) == 4
+    response = client.get(f'/api/orders/{order_id}', headers={'If-None-Match': etags[0]})
+    assert response.status_code == 200
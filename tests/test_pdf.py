@@ -57,3 +57,260 @@ def test_download_commercial(client, db):
     assert response.status_code == 200
     assert response.content_type == 'application/pdf'
     assert len(response.data) > 0
+
+
+def test_pdf_render_job_status_and_metrics(client, db):
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Тест'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    client.post(f'/api/orders/{order_id}/systems',
+        data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+        content_type='application/json')
+
+    from models import PdfRenderJob
+    response = client.get(f'/api/orders/{order_id}/pdf/kp?async=1')
+    assert response.status_code == 202
+
+    job = PdfRenderJob.query.filter_by(order_id=order_id, kind='kp').one()
+    response = client.get(f'/api/pdf/jobs/{job.id}')
+    data = json.loads(response.data)['data']
+    assert data['status'] == 'done'
+
+    response = client.get(data['file_url'])
+    assert response.content_type == 'application/pdf'
+
+    metrics = json.loads(client.get('/api/pdf/metrics').data)['data']
+    assert metrics['rendered_total'] >= 1
+    assert metrics['queue_depth'] == 0
+
+
+def test_pdf_render_jobs_keep_own_results(client, db):
+    """Две задачи по одному заказу в разных состояниях — у каждой свой PDF"""
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Первый'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+
+    first = json.loads(client.get(f'/api/orders/{order_id}/pdf/kp?async=1').data)['data']
+    first_pdf = client.get(f'/api/pdf/jobs/{first["id"]}/file').data
+    client.put(f'/api/orders/{order_id}', data=json.dumps({'customer_name': 'Второй'}),
+               content_type='application/json')
+    second = json.loads(client.get(f'/api/orders/{order_id}/pdf/kp?async=1').data)['data']
+
+    # Результат второй задачи не перезаписал файл первой
+    assert client.get(f'/api/pdf/jobs/{first["id"]}/file').data == first_pdf
+    second_pdf = client.get(f'/api/pdf/jobs/{second["id"]}/file').data
+    assert second_pdf.startswith(b'%PDF') and second_pdf != first_pdf
+
+
+def test_pdf_render_in_process_pool(app, db):
+    """Рендеринг в отдельном процессе: снимок заказа переживает pickle"""
+    from models import Order, OrderSystem
+    from modules.calculator import calculate_system
+    from modules.pdf.service import PdfRenderService
+
+    order = Order(customer_name='Тест')
+    db.session.add(order)
+    db.session.commit()
+    params = {'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}
+    db.session.add(OrderSystem(order_id=order.id, position=1, price=1000,
+                               calculated_data=calculate_system(params), **params))
+    db.session.commit()
+
+    service = PdfRenderService()
+    service._app = app
+    try:
+        job, future = service.submit(order, 'spec')
+        pdf_bytes, seconds = future.result(timeout=60)
+    finally:
+        service._get_executor().shutdown()
+
+    assert pdf_bytes.startswith(b'%PDF')
+    assert seconds > 0
+
+
+def test_pdf_broken_pool_releases_queue_slot(app, db):
+    """Ошибка постановки в пул (BrokenProcessPool) не занимает слот очереди навсегда"""
+    from concurrent.futures.process import BrokenProcessPool
+    from models import Order, PdfRenderJob
+    from modules.pdf.service import PdfRenderService
+
+    class BrokenPool:
+        def submit(self, *args):
+            raise BrokenProcessPool('процесс пула убит')
+
+    order = Order(customer_name='Тест')
+    db.session.add(order)
+    db.session.commit()
+
+    service = PdfRenderService()
+    service._app = app
+    service._workers = 2
+    service._queue_limit = 1
+    service._executor, service._executor_pid = BrokenPool(), os.getpid()
+
+    for _ in range(3):
+        job, future = service.submit(order, 'kp')
+        assert isinstance(future.exception(), BrokenProcessPool)
+        assert service.metrics()['queue_depth'] == 0
+        # Сломанный пул сброшен, следующий вызов создал бы новый
+        assert service._executor is None
+        service._executor, service._executor_pid = BrokenPool(), os.getpid()
+
+    db.session.expire_all()
+    assert db.session.get(PdfRenderJob, job.id).status == 'failed'
+    assert service.metrics()['failed_total'] == 3
+
+
+def test_pdf_job_done_only_with_file(app, client, db, monkeypatch):
+    """Задача с сохранением результата становится done только вместе с файлом"""
+    from concurrent.futures import Future
+    from models import Order, PdfRenderJob
+    from modules.export_store import export_store
+    from modules.pdf import service as pdf_service
+    from modules.pdf.service import PdfRenderService
+
+    futures = []
+
+    class ManualPool:
+        def submit(self, *args):
+            futures.append(Future())
+            return futures[-1]
+
+    order = Order(customer_name='Тест')
+    db.session.add(order)
+    db.session.commit()
+
+    service = PdfRenderService()
+    service._app = app
+    service._workers = 1
+    service._executor, service._executor_pid = ManualPool(), os.getpid()
+    monkeypatch.setattr(pdf_service, 'pdf_renderer', service)
+
+    statuses_at_write = []
+    put = export_store.put
+
+    def checking_put(key, data):
+        with app.app_context():
+            statuses_at_write.append(db.session.get(PdfRenderJob, job_id).status)
+        return put(key, data)
+
+    monkeypatch.setattr(export_store, 'put', checking_put)
+
+    job, future = service.submit(order, 'kp', persist=True)
+    job_id = job.id
+    futures[0].set_result((b'%PDF-1.4 test', 0.01))
+
+    # Опрос сразу после завершения: done — и файл уже можно скачать
+    db.session.expire_all()
+    status = json.loads(client.get(f'/api/pdf/jobs/{job_id}').data)['data']
+    assert statuses_at_write == ['queued']
+    assert status['status'] == 'done'
+    assert status['file_url'] == f'/api/pdf/jobs/{job_id}/file'
+    assert client.get(status['file_url']).data == b'%PDF-1.4 test'
+
+
+def test_bulk_export_zip(client, db):
+    """Массовая выгрузка: ZIP со всеми PDF, повторно — из кэша экспорта"""
+    import io
+    import zipfile
+    from modules.pdf.service import pdf_renderer
+
+    order_ids = []
+    for name in ('Первый', 'Второй'):
+        response = client.post('/api/orders',
+            data=json.dumps({'customer_name': name}),
+            content_type='application/json')
+        order_id = json.loads(response.data)['data']['id']
+        client.post(f'/api/orders/{order_id}/systems',
+            data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+            content_type='application/json')
+        order_ids.append(order_id)
+
+    response = client.post('/api/exports/pdf',
+        data=json.dumps({'ids': order_ids}),
+        content_type='application/json')
+    assert response.status_code == 200
+    assert response.content_type == 'application/zip'
+
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    names = sorted(archive.namelist())
+    assert names == sorted(f'{prefix}_{i}.pdf' for i in order_ids for prefix in ('КП', 'Разблюдовка'))
+    assert all(archive.read(name).startswith(b'%PDF') for name in names)
+
+    rendered = pdf_renderer.metrics()['rendered_total']
+    response = client.post('/api/exports/pdf',
+        data=json.dumps({'ids': order_ids, 'kinds': ['kp']}),
+        content_type='application/json')
+    assert len(zipfile.ZipFile(io.BytesIO(response.data)).namelist()) == 2
+    assert pdf_renderer.metrics()['rendered_total'] == rendered
+
+    response = client.post('/api/exports/pdf',
+        data=json.dumps({'status': 'nonexistent'}),
+        content_type='application/json')
+    assert response.status_code == 404
+
+
+def test_download_specification_xlsx(client, db):
+    """Разблюдовка в XLSX: строки по системам и сводный лист по артикулам"""
+    import io
+    from openpyxl import load_workbook
+
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Склад'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    for _ in range(2):
+        client.post(f'/api/orders/{order_id}/systems',
+            data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+            content_type='application/json')
+
+    response = client.get(f'/api/orders/{order_id}/xlsx/spec')
+    assert response.status_code == 200
+
+    workbook = load_workbook(io.BytesIO(response.data), read_only=True)
+    assert workbook.sheetnames == ['Разблюдовка', 'Итого']
+    spec_rows = list(workbook['Разблюдовка'].iter_rows(min_row=2, values_only=True))
+    total_rows = list(workbook['Итого'].iter_rows(min_row=2, values_only=True))
+
+    # Две одинаковые системы: в «Итого» вдвое меньше строк, количество удвоено
+    assert len(total_rows) * 2 <= len(spec_rows)
+    top_profile = [r for r in spec_rows if r[3] == 'S-010']
+    assert len(top_profile) == 2
+    assert [r for r in total_rows if r[1] == 'S-010'][0][4] == round(top_profile[0][6] * 2, 3)
+
+    assert client.get('/api/orders/999999/xlsx/spec').status_code == 404
+
+
+def test_cached_pdf_expires_with_document_date(app, db, monkeypatch):
+    """PDF неизменившегося заказа из кэша — только в день рендеринга: в нём дата оформления"""
+    from datetime import date
+    from models import Order
+    from modules.export_store import export_store
+    from modules.pdf import service
+    from modules.pdf.service import pdf_renderer
+
+    order = Order(customer_name='Дата')
+    db.session.add(order)
+    db.session.commit()
+
+    class Day(date):
+        current = date(2026, 3, 1)
+
+        @classmethod
+        def today(cls):
+            return cls.current
+
+    monkeypatch.setattr(service, 'date', Day)
+    rendered = pdf_renderer.metrics()['rendered_total']
+
+    pdf_renderer.render_cached(order, 'kp')
+    pdf_renderer.render_cached(order, 'kp')
+    assert pdf_renderer.metrics()['rendered_total'] - rendered == 1
+    assert export_store.get(pdf_renderer.cache_key('kp', order.id, order.state_hash(), date(2026, 3, 1)))
+
+    Day.current = date(2026, 3, 2)
+    pdf_renderer.render_cached(order, 'kp')
+    assert pdf_renderer.metrics()['rendered_total'] - rendered == 2
+    assert service.snapshot_order(order).document_date == date(2026, 3, 2)
@@ -84,3 +84,345 @@ def test_import_prices_update(client, db):
     
     assert test_item['name'] == 'Новое название'
     assert test_item['price'] == 200
+
+
+def test_search_prices_prefix_and_cyrillic_case(client, db):
+    for article, name in [('S-010', 'Профиль верхний 3 дорожки'),
+                          ('S-020', 'Профиль верхний 5 дорожек'),
+                          ('H-001', 'Ручка круглая')]:
+        client.post('/api/prices',
+            data=json.dumps({'article': article, 'name': name, 'price': 100, 'category': 'Тест'}),
+            content_type='application/json')
+
+    # Префикс артикула
+    response = client.get('/api/prices?search=s-01')
+    prices = json.loads(response.data)['data']
+    assert [p['article'] for p in prices] == ['S-010']
+
+    # Кириллица без учёта регистра, по префиксу слова
+    response = client.get('/api/prices?search=ПРОФ')
+    prices = json.loads(response.data)['data']
+    assert {p['article'] for p in prices} == {'S-010', 'S-020'}
+
+    # По началу слов ничего — запасной поиск подстрокой
+    response = client.get('/api/prices?search=рофиль')
+    assert {p['article'] for p in json.loads(response.data)['data']} == {'S-010', 'S-020'}
+    response = client.get('/api/prices?search=01')
+    assert [p['article'] for p in json.loads(response.data)['data']] == ['H-001', 'S-010']
+
+    # Совпадение по началу слова есть — подстрока не подмешивается
+    response = client.get('/api/prices?search=кругл')
+    assert [p['article'] for p in json.loads(response.data)['data']] == ['H-001']
+
+
+def test_search_postgresql_pattern_matches_word_prefix():
+    """PostgreSQL: то же совпадение, что "слово"* в FTS5 — начало слова, '-' и '.' внутри слова"""
+    from modules.pricing.search import _pg_word_prefix_pattern, _split_terms
+    assert [_pg_word_prefix_pattern(t) for t in _split_terms('S-01 проф')] == [
+        r'(^|[^[:alnum:].-])s\-01', '(^|[^[:alnum:].-])проф']
+
+
+def test_search_index_follows_edits(client, db):
+    client.post('/api/prices',
+        data=json.dumps({'article': 'TEST-002', 'name': 'Заглушка', 'price': 10, 'category': 'Тест'}),
+        content_type='application/json')
+    client.put('/api/prices/TEST-002',
+        data=json.dumps({'name': 'Демпфер'}),
+        content_type='application/json')
+
+    response = client.get('/api/prices?search=заглушка')
+    assert json.loads(response.data)['data'] == []
+
+    response = client.get('/api/prices?search=демпфер')
+    assert [p['article'] for p in json.loads(response.data)['data']] == ['TEST-002']
+
+
+def test_filter_prices_by_system_type(client, db):
+    for article, system_types in [('SL-150', ['Slider L']),
+                                  ('SX-150', ['Slider X']),
+                                  ('AA-200', None)]:
+        client.post('/api/prices',
+            data=json.dumps({'article': article, 'name': article, 'price': 10,
+                             'category': 'Тест', 'system_types': system_types}),
+            content_type='application/json')
+
+    response = client.get('/api/prices?system_type=Slider L')
+    articles = {p['article'] for p in json.loads(response.data)['data']}
+    assert articles == {'SL-150', 'AA-200'}
+
+    # Правка system_types перестраивает применимость
+    client.put('/api/prices/SX-150',
+        data=json.dumps({'system_types': ['Slider X', 'Slider L']}),
+        content_type='application/json')
+    response = client.get('/api/prices?system_type=Slider L')
+    articles = {p['article'] for p in json.loads(response.data)['data']}
+    assert articles == {'SL-150', 'SX-150', 'AA-200'}
+
+
+def test_import_prices_system_types(client, db):
+    df = pd.DataFrame({
+        'Артикул': ['JL-001', 'AA-110'],
+        'Наименование': ['Профиль JV Line', 'Активатор'],
+        'Цена': [900, 150],
+        'Категория': ['Профили', 'Расходники'],
+        'Системы': ['JV Line', None]
+    })
+    excel_file = BytesIO()
+    df.to_excel(excel_file, index=False, engine='openpyxl')
+    excel_file.seek(0)
+    client.post('/api/prices/import',
+        data={'file': (excel_file, 'prices.xlsx')},
+        content_type='multipart/form-data')
+
+    response = client.get('/api/prices?system_type=Slider X')
+    articles = {p['article'] for p in json.loads(response.data)['data']}
+    assert articles == {'AA-110'}
+
+
+def test_apply_prices_uses_system_catalog(app, db):
+    from models import PriceItem
+    from modules.pricing.catalog import apply_prices, invalidate_price_maps
+
+    db.session.add(PriceItem(article='S-010', name='Верхний', price=1000,
+                             category='Профили', system_types=['Slider L']))
+    db.session.add(PriceItem(article='S-040', name='Ручка', price=500, category='Фурнитура'))
+    db.session.commit()
+    invalidate_price_maps()
+
+    calculated = {
+        'profiles': [{'code': 'S-010', 'total_m': 3.0}],
+        'hardware': [{'code': 'S-040', 'qty': 2}, {'code': 'SL-160', 'qty': 2}],
+    }
+    apply_prices(calculated, 'Slider L')
+
+    assert calculated['summary']['total_price'] == 4000
+    assert calculated['summary']['missing_articles'] == ['SL-160']
+
+
+def _write_price_file(path, rows):
+    df = pd.DataFrame(rows, columns=['Артикул', 'Наименование', 'Ед.изм.', 'Цена', 'Категория'])
+    df.to_excel(path, index=False, engine='openpyxl')
+
+
+def test_import_status_reports_error_rows(client, db):
+    excel_file = BytesIO()
+    _write_price_file(excel_file, [
+        ['A-001', 'Позиция 1', 'шт', 10, 'Тест'],
+        ['A-002', 'Позиция 2', 'шт', 'не число', 'Тест'],
+    ])
+    excel_file.seek(0)
+
+    response = client.post('/api/prices/import',
+        data={'file': (excel_file, 'prices.xlsx')},
+        content_type='multipart/form-data')
+    job_id = json.loads(response.data)['data']['id']
+
+    response = client.get(f'/api/prices/import/{job_id}')
+    job = json.loads(response.data)['data']
+
+    assert job['status'] == 'done'
+    assert job['processed_rows'] == 2
+    assert job['created'] == 1
+    assert [e['row'] for e in job['errors']] == [3]
+
+
+def test_resume_import_from_checkpoint(client, db, tmp_path):
+    from models import PriceImportJob
+
+    path = tmp_path / 'prices.xlsx'
+    _write_price_file(path, [
+        ['B-001', 'Позиция 1', 'шт', 10, 'Тест'],
+        ['B-002', 'Позиция 2', 'шт', 20, 'Тест'],
+        ['B-003', 'Позиция 3', 'шт', 30, 'Тест'],
+    ])
+    # Импорт упал после коммита первых двух строк
+    job = PriceImportJob(filename='prices.xlsx', file_path=str(path), status='failed',
+                         processed_rows=2, created=2, errors=[])
+    db.session.add(job)
+    db.session.commit()
+
+    response = client.post(f'/api/prices/import/{job.id}/resume')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data['created'] == 3
+    assert data['data']['processed_rows'] == 3
+
+    response = client.get('/api/prices')
+    assert [p['article'] for p in json.loads(response.data)['data']] == ['B-003']
+
+
+def test_resume_stale_running_import(client, db, tmp_path):
+    """Импорт running без свежего чекпоинта продолжается, живой — нет"""
+    from datetime import datetime, timedelta
+    from models import PriceImportJob
+
+    path = tmp_path / 'prices.xlsx'
+    _write_price_file(path, [
+        ['S-001', 'Позиция 1', 'шт', 10, 'Тест'],
+        ['S-002', 'Позиция 2', 'шт', 20, 'Тест'],
+    ])
+    job = PriceImportJob(filename='prices.xlsx', file_path=str(path), status='running',
+                         processed_rows=1, created=1, errors=[])
+    db.session.add(job)
+    db.session.commit()
+
+    response = client.post(f'/api/prices/import/{job.id}/resume')
+    assert response.status_code == 400
+    assert json.loads(client.get(f'/api/prices/import/{job.id}').data)['data']['resumable'] is False
+
+    # Воркер перезапущен: чекпоинт давно не обновлялся
+    job.updated_at = datetime.utcnow() - timedelta(hours=1)
+    db.session.commit()
+    assert json.loads(client.get(f'/api/prices/import/{job.id}').data)['data']['resumable'] is True
+
+    response = client.post(f'/api/prices/import/{job.id}/resume')
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert data['data']['status'] == 'done'
+    assert data['data']['processed_rows'] == 2
+
+
+def test_resume_import_async(app, client, db, tmp_path, monkeypatch):
+    """Продолжение в фоне: 202, затем импорт доходит до конца в пуле воркера"""
+    from models import PriceImportJob
+    from modules.pricing import routes
+
+    futures, submit_import = [], routes.submit_import
+
+    def submit(app, job_id):
+        futures.append(submit_import(app, job_id))
+        return futures[-1]
+
+    monkeypatch.setattr(routes, 'submit_import', submit)
+    monkeypatch.setitem(app.config, 'PRICE_IMPORT_ASYNC', True)
+
+    path = tmp_path / 'prices.xlsx'
+    _write_price_file(path, [
+        ['R-001', 'Позиция 1', 'шт', 10, 'Тест'],
+        ['R-002', 'Позиция 2', 'шт', 20, 'Тест'],
+    ])
+    job = PriceImportJob(filename='prices.xlsx', file_path=str(path), status='failed',
+                         processed_rows=1, created=1, errors=[])
+    db.session.add(job)
+    db.session.commit()
+
+    response = client.post(f'/api/prices/import/{job.id}/resume')
+    assert response.status_code == 202
+    assert json.loads(response.data)['data']['status'] == 'pending'
+
+    futures[0].result(timeout=10)
+    db.session.expire_all()
+    response = client.get(f'/api/prices/import/{job.id}')
+    data = json.loads(response.data)['data']
+    assert data['status'] == 'done'
+    assert data['created'] == 2
+
+    # Завершённый импорт повторно не продолжается
+    response = client.post(f'/api/prices/import/{job.id}/resume')
+    assert response.status_code == 400
+
+
+def test_import_dry_run_diff(client, db):
+    for article, price, category in [('D-001', 100, 'Профили'),
+                                     ('D-002', 200, 'Профили'),
+                                     ('D-003', 300, 'Фурнитура')]:
+        client.post('/api/prices',
+            data=json.dumps({'article': article, 'name': article, 'price': price, 'category': category}),
+            content_type='application/json')
+
+    excel_file = BytesIO()
+    _write_price_file(excel_file, [
+        ['D-001', 'D-001', 'шт', 100, 'Профили'],      # без изменений
+        ['D-002', 'D-002', 'шт', 250, 'Фурнитура'],    # цена и категория
+        ['D-004', 'D-004', 'шт', 400, 'Профили'],      # новая
+    ])
+    excel_file.seek(0)
+
+    response = client.post('/api/prices/import?dry_run=1',
+        data={'file': (excel_file, 'prices.xlsx')},
+        content_type='multipart/form-data')
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data['summary']['new'] == 1
+    assert data['summary']['removed'] == 1
+    assert data['summary']['price_changed'] == 1
+    assert data['summary']['category_moved'] == 1
+    assert data['summary']['unchanged'] == 1
+    assert [(d['article'], d['change']) for d in data['data']] == [
+        ('D-002', 'price'), ('D-003', 'removed'), ('D-004', 'new')
+    ]
+    assert data['data'][0]['delta'] == 50
+    assert data['data'][0]['category_moved'] is True
+
+    # Ничего не записано
+    response = client.get('/api/prices?search=D-004')
+    assert json.loads(response.data)['data'] == []
+
+
+def test_price_history_as_of(client, db):
+    client.post('/api/prices',
+        data=json.dumps({'article': 'P-001', 'name': 'Профиль', 'price': 100, 'category': 'Профили'}),
+        content_type='application/json')
+    client.put('/api/prices/P-001', data=json.dumps({'name': 'Только имя'}),
+               content_type='application/json')
+    client.put('/api/prices/P-001', data=json.dumps({'price': 150}),
+               content_type='application/json')
+
+    response = client.get('/api/prices/P-001/history')
+    history = json.loads(response.data)['data']
+    assert [h['price'] for h in history] == [150, 100]
+
+    first_valid_from = history[-1]['valid_from']
+    response = client.get(f'/api/prices/as-of?date={first_valid_from}&articles=P-001')
+    assert json.loads(response.data)['data'] == {'P-001': 100}
+
+    response = client.get('/api/prices/as-of?date=2000-01-01&articles=P-001')
+    assert json.loads(response.data)['data'] == {}
+
+    # Момент с зоной приводится к UTC
+    response = client.get('/api/prices/as-of?date=2999-01-01T00:00:00Z&articles=P-001')
+    assert response.status_code == 200
+    assert json.loads(response.data)['data'] == {'P-001': 150}
+    response = client.get('/api/prices/as-of?date=2000-01-01T03:00:00%2B03:00&articles=P-001')
+    assert json.loads(response.data)['as_of'] == '2000-01-01T00:00:00'
+
+
+def test_reprice_order_as_of(client, db):
+    from datetime import datetime
+    from models import PriceHistory
+
+    response = client.post('/api/orders',
+        data=json.dumps({'customer_name': 'Тест'}),
+        content_type='application/json')
+    order_id = json.loads(response.data)['data']['id']
+    client.post(f'/api/orders/{order_id}/systems',
+        data=json.dumps({'system_type': 'Slider L', 'width': 3000, 'height': 2500, 'panels': 3}),
+        content_type='application/json')
+
+    # Цена ручки S-040 на 2026-01-01 и позже — другая
+    db.session.add(PriceHistory(article='S-040', price=500, valid_from=datetime(2026, 1, 1)))
+    db.session.add(PriceHistory(article='S-040', price=900, valid_from=datetime(2026, 6, 1)))
+    db.session.commit()
+
+    response = client.post(f'/api/orders/{order_id}/reprice',
+        data=json.dumps({'as_of': '2026-03-01T00:00:00'}),
+        content_type='application/json')
+    data = json.loads(response.data)['data']
+
+    assert response.status_code == 200
+    # 2 ручки по 500
+    assert data['systems'][0]['price'] == 1000
+    assert data['total_price'] == 1000
+
+    # 2026-06-01T02:00+03:00 — ещё 31 мая по UTC
+    response = client.post(f'/api/orders/{order_id}/reprice',
+        data=json.dumps({'as_of': '2026-06-01T02:00:00+03:00'}),
+        content_type='application/json')
+    assert response.status_code == 200
+    assert json.loads(response.data)['data']['total_price'] == 1000
+    response = client.post(f'/api/orders/{order_id}/reprice',
+        data=json.dumps({'as_of': '2026-06-02T00:00:00Z'}),
+        content_type='application/json')
+    assert json.loads(response.data)['data']['total_price'] == 1800
@@ -0,0 +1,75 @@
+# tests/test_query_audit.py
+import json
+import pytest
+from flask import Response
+from models import Order
+from modules.query_audit import query_audit, QueryBudgetExceeded
+
+
+def test_orders_list_query_budget(client, db, query_budget):
+    """Список заказов: число SQL не зависит от числа заказов"""
+    for i in range(10):
+        order = Order(customer_name=f'Заказ {i}')
+        db.session.add(order)
+    db.session.commit()
+
+    with query_budget(3):
+        response = client.get('/api/orders')
+    assert len(json.loads(response.data)['data']) == 10
+
+
+def test_query_budget_exceeded(db, query_budget):
+    with pytest.raises(QueryBudgetExceeded) as e:
+        with query_budget(1):
+            Order.query.count()
+            Order.query.count()
+    assert 'Выполнено 2 SQL при бюджете 1' in str(e.value)
+
+
+def test_repeated_statements_reported(app, db):
+    """Одинаковый SQL 5 раз за запрос — находка N+1 со стеком"""
+    with app.test_request_context('/api/orders'):
+        query_audit._start_request()
+        for order_id in range(5):
+            db.session.get(Order, order_id + 1)
+        query_audit._finish_request(Response())
+
+    report = query_audit.reports()[-1]
+    assert report['kind'] == 'repeated'
+    assert report['count'] == 5
+    assert any('test_query_audit.py' in frame for frame in report['stack'])
+
+
+def test_slow_statement_reported_with_plan(app, db, monkeypatch):
+    monkeypatch.setattr(query_audit, 'slow_seconds', 0)
+    Order.query.filter(Order.status == 'draft').all()
+
+    report = query_audit.reports()[-1]
+    assert report['kind'] == 'slow'
+    assert 'idx' in ' '.join(report['plan']).lower() or 'ix_' in ' '.join(report['plan']).lower()
+
+
+def test_explain_in_savepoint_on_postgresql():
+    """PostgreSQL: сбой EXPLAIN откатывается к точке сохранения и не обрывает транзакцию"""
+    from types import SimpleNamespace
+
+    executed = []
+
+    class Cursor:
+        def execute(self, statement, parameters=None):
+            executed.append(statement)
+            if statement.startswith('EXPLAIN'):
+                raise RuntimeError('нет прав')
+
+        def close(self):
+            pass
+
+    dbapi_connection = SimpleNamespace(autocommit=False, cursor=Cursor)
+    conn = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'))
+    cursor = SimpleNamespace(connection=dbapi_connection)
+
+    plan = query_audit._explain(conn, cursor, 'SELECT 1', {})
+
+    assert plan == ['EXPLAIN не выполнен: нет прав']
+    assert executed == ['SAVEPOINT query_audit_explain', 'EXPLAIN SELECT 1',
+                        'ROLLBACK TO SAVEPOINT query_audit_explain', 'RELEASE SAVEPOINT query_audit_explain']
@@ -0,0 +1,111 @@
+import threading
+import time
+import pytest
+from modules.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 'pdf'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do(('pdf', 1, 'h'), slow)))
+    leader.start()
+    started.wait()
+
+    followers = [threading.Thread(target=lambda: results.append(flight.do(('pdf', 1, 'h'), slow)))
+                 for _ in range(4)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join()
+
+    assert calls == [1]
+    assert results == ['pdf'] * 5
+    assert flight.metrics() == {'leader_total': 1, 'shared_total': 4}
+
+
+def test_error_is_shared_and_not_cached():
+    flight = SingleFlight()
+
+    def failing():
+        raise RuntimeError('Битрикс недоступен')
+
+    with pytest.raises(RuntimeError):
+        flight.do(('bitrix_sync', 1, 'h'), failing)
+
+    # Следующий вызов выполняется заново
+    assert flight.do(('bitrix_sync', 1, 'h'), lambda: 'ok') == 'ok'
+
+
+def test_result_shared_between_workers(tmp_path):
+    """Второй «воркер» с тем же каталогом блокировок берёт готовый результат"""
+    worker_a, worker_b = SingleFlight(), SingleFlight()
+    for flight in (worker_a, worker_b):
+        flight._locks_dir = str(tmp_path)
+
+    assert worker_a.do(('pdf', 'kp', 1, 'h'), lambda: b'%PDF-a') == b'%PDF-a'
+    assert worker_b.do(('pdf', 'kp', 1, 'h'), lambda: b'%PDF-b') == b'%PDF-a'
+    # Другое состояние заказа — другой ключ
+    assert worker_b.do(('pdf', 'kp', 1, 'h2'), lambda: b'%PDF-b') == b'%PDF-b'
+
+
+def test_follower_waits_at_most_timeout():
+    """Зависшее вычисление лидера не держит остальные вызовы дольше timeout"""
+    from modules.singleflight import SingleFlightTimeout
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def hung():
+        started.set()
+        release.wait(5)
+        return 'pdf'
+
+    leader = threading.Thread(target=lambda: flight.do(('pdf', 1, 'h'), hung))
+    leader.start()
+    started.wait()
+    try:
+        begin = time.monotonic()
+        with pytest.raises(SingleFlightTimeout):
+            flight.do(('pdf', 1, 'h'), hung, timeout=0.1)
+        assert time.monotonic() - begin < 2
+    finally:
+        release.set()
+        leader.join()
+
+
+def test_reap_removes_expired_files(tmp_path):
+    """Уборка удаляет устаревшие результаты и свободные блокировки, занятые — оставляет"""
+    import fcntl
+    import os
+    flight = SingleFlight()
+    flight._locks_dir = str(tmp_path)
+    flight._result_ttl = 10
+
+    flight.do(('pdf', 'kp', 1, 'h'), lambda: b'%PDF-a')
+    flight.do(('pdf', 'kp', 2, 'h'), lambda: b'%PDF-b')
+    assert len(os.listdir(tmp_path)) == 4
+
+    # Все файлы устарели; одну из блокировок держит другой воркер
+    old = time.time() - 60
+    for path in tmp_path.iterdir():
+        os.utime(path, (old, old))
+    held_path = next(p for p in tmp_path.iterdir() if p.suffix == '.lock')
+    held = open(held_path, 'a+b')
+    fcntl.flock(held, fcntl.LOCK_EX)
+    try:
+        assert flight.reap() == 3
+        assert [p.name for p in tmp_path.iterdir()] == [held_path.name]
+    finally:
+        fcntl.flock(held, fcntl.LOCK_UN)
+        held.close()
+
+    # После уборки ключ вычисляется заново
+    assert flight.do(('pdf', 'kp', 1, 'h'), lambda: b'%PDF-new') == b'%PDF-new'
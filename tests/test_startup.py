@@ -0,0 +1,19 @@
+# tests/test_startup.py
+import subprocess
+import sys
+from modules.warmup import warm_up_worker
+
+
+def test_create_app_skips_heavy_imports():
+    """pandas, openpyxl и ReportLab не загружаются при старте воркера"""
+    code = ('import sys; from app import create_app; from config import TestingConfig; '
+            'create_app(TestingConfig); '
+            'print(",".join(m for m in ("pandas", "openpyxl", "reportlab") if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == ''
+
+
+def test_warm_up_worker(app, db):
+    timings = warm_up_worker(app)
+    assert list(timings) == ['db', 'prices', 'pdf']
+    assert 'reportlab' in sys.modules